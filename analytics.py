@@ -0,0 +1,185 @@
+from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
+import click
+from sqlalchemy import select, func, delete, cast, Date
+from extensions import db, dialect_insert
+from models import Transaction, TransactionType, DailyMerchantActivity, DailyCustomerSketch
+from hll import hll_registers, hll_estimate
+
+# Transfers are between customers; everything else is a merchant paying out
+MERCHANT_ACTIVITY_TYPES = tuple(t for t in TransactionType if t != TransactionType.TRANSFER)
+ANALYTICS_BUCKETS = ('day', 'week', 'month')
+
+def record_merchant_activity(merchant_id, transaction_type, points, count, customer_ids, day):
+    """Add a write to the merchant's daily rollup, in the caller's session"""
+    if transaction_type not in MERCHANT_ACTIVITY_TYPES:
+        return
+    stmt = dialect_insert()(DailyMerchantActivity).values(
+        merchant_id=merchant_id, day=day, transaction_type=transaction_type,
+        points=points, transactions=count
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyMerchantActivity.merchant_id, DailyMerchantActivity.day,
+                        DailyMerchantActivity.transaction_type],
+        set_={
+            'points': DailyMerchantActivity.points + stmt.excluded.points,
+            'transactions': DailyMerchantActivity.transactions + stmt.excluded.transactions,
+        }
+    )
+    db.session.execute(stmt)
+
+    if customer_ids:
+        _record_daily_customers(merchant_id, day, customer_ids)
+
+def _record_daily_customers(merchant_id, day, customer_ids):
+    # Registers only grow, as in stats.record_customers
+    stmt = dialect_insert()(DailyCustomerSketch)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyCustomerSketch.merchant_id, DailyCustomerSketch.day, DailyCustomerSketch.register],
+        set_={'rank': stmt.excluded.rank},
+        where=stmt.excluded.rank > DailyCustomerSketch.rank
+    )
+    db.session.execute(stmt, [
+        {'merchant_id': merchant_id, 'day': day, 'register': register, 'rank': rank}
+        for register, rank in hll_registers(customer_ids).items()
+    ])
+
+def _is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def backfill_merchant_activity():
+    """Rebuild both rollup tables from the transactions table"""
+    # stats imports this module. Queued stats are already in the ledger
+    from stats import fold_merchant_stats
+    fold_merchant_stats()
+
+    # SQLite has no DATE type; date() gives the same text Date columns store
+    day = cast(Transaction.created_at, Date) if _is_postgres() else func.date(Transaction.created_at)
+    merchant_conditions = Transaction.sender_id.is_not(None), Transaction.transaction_type.in_(MERCHANT_ACTIVITY_TYPES)
+
+    db.session.execute(delete(DailyCustomerSketch))
+    db.session.execute(delete(DailyMerchantActivity))
+    db.session.execute(
+        DailyMerchantActivity.__table__.insert().from_select(
+            ['merchant_id', 'day', 'transaction_type', 'points', 'transactions'],
+            select(Transaction.sender_id, day, Transaction.transaction_type,
+                   func.sum(Transaction.points), func.count(Transaction.id))
+            .where(*merchant_conditions)
+            .group_by(Transaction.sender_id, day, Transaction.transaction_type)
+        )
+    )
+    customers = db.session.execute(
+        select(Transaction.sender_id, day, Transaction.receiver_id)
+        .where(*merchant_conditions, Transaction.receiver_id.is_not(None))
+        .order_by(Transaction.sender_id, day)
+        .execution_options(yield_per=10000)
+    )
+    for (merchant_id, customer_day), rows in groupby(customers, key=itemgetter(0, 1)):
+        _record_daily_customers(merchant_id, _as_date(customer_day), (customer_id for *_, customer_id in rows))
+    db.session.commit()
+
+def _bucket_start(day, bucket):
+    """SQL for the first day of the bucket a day falls in (weeks start Monday)"""
+    if bucket == 'day':
+        return day
+    if _is_postgres():
+        return cast(func.date_trunc(bucket, day), Date)
+    if bucket == 'week':
+        return func.date(day, 'weekday 0', '-6 days')
+    return func.date(day, 'start of month')
+
+def _bucket_starts(start, end, bucket):
+    if bucket == 'week':
+        current = start - timedelta(days=start.weekday())
+    elif bucket == 'month':
+        current = start.replace(day=1)
+    else:
+        current = start
+    while current <= end:
+        yield current
+        if bucket == 'day':
+            current += timedelta(days=1)
+        elif bucket == 'week':
+            current += timedelta(days=7)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+
+def _as_date(value):
+    # SQLite hands computed dates back as strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def _empty_bucket():
+    return {'points': {t.value: 0 for t in MERCHANT_ACTIVITY_TYPES}, 'transactions': 0, 'unique_customers': 0}
+
+def merchant_activity(merchant_id, start, end, bucket):
+    """Per-bucket points by type, transaction counts and unique customers.
+
+    Sums the daily rollup rows in [start, end]. Unique customers are
+    estimated from the daily sketches merged by register max, so weeks and
+    months count each customer once, and the cost depends on the number of
+    days rather than of customers (see hll.py for the error bound).
+    """
+    in_range = DailyMerchantActivity.merchant_id == merchant_id, DailyMerchantActivity.day.between(start, end)
+    activity_bucket = _bucket_start(DailyMerchantActivity.day, bucket)
+    activity = db.session.execute(
+        select(activity_bucket, DailyMerchantActivity.transaction_type,
+               func.sum(DailyMerchantActivity.points), func.sum(DailyMerchantActivity.transactions))
+        .where(*in_range)
+        .group_by(activity_bucket, DailyMerchantActivity.transaction_type)
+    ).all()
+
+    sketches_in_range = (
+        DailyCustomerSketch.merchant_id == merchant_id, DailyCustomerSketch.day.between(start, end)
+    )
+    customer_bucket = _bucket_start(DailyCustomerSketch.day, bucket).label('bucket')
+    merged = (
+        select(customer_bucket, DailyCustomerSketch.register, func.max(DailyCustomerSketch.rank).label('rank'))
+        .where(*sketches_in_range)
+        .group_by(customer_bucket, DailyCustomerSketch.register)
+        .subquery()
+    )
+    bucket_ranks = {}
+    for bucket_day, rank, registers in db.session.execute(
+        select(merged.c.bucket, merged.c.rank, func.count()).group_by(merged.c.bucket, merged.c.rank)
+    ):
+        bucket_ranks.setdefault(_as_date(bucket_day), {})[rank] = registers
+    merged_total = (
+        select(func.max(DailyCustomerSketch.rank).label('rank'))
+        .where(*sketches_in_range)
+        .group_by(DailyCustomerSketch.register)
+        .subquery()
+    )
+    total_ranks = dict(db.session.execute(
+        select(merged_total.c.rank, func.count()).group_by(merged_total.c.rank)
+    ).all())
+
+    buckets = {day: _empty_bucket() for day in _bucket_starts(start, end, bucket)}
+    totals = _empty_bucket()
+    for bucket_day, transaction_type, points, count in activity:
+        entry = buckets[_as_date(bucket_day)]
+        entry['points'][transaction_type.value] = points
+        entry['transactions'] += count
+        totals['points'][transaction_type.value] += points
+        totals['transactions'] += count
+    for bucket_day, rank_counts in bucket_ranks.items():
+        buckets[bucket_day]['unique_customers'] = hll_estimate(rank_counts)
+    totals['unique_customers'] = hll_estimate(total_ranks)
+
+    for entry in [totals, *buckets.values()]:
+        entry['redeemed'] = entry['points'][TransactionType.REDEMPTION.value]
+        entry['issued'] = sum(entry['points'].values()) - entry['redeemed']
+
+    return {
+        'bucket': bucket,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': [{'start': day.isoformat(), **entry} for day, entry in buckets.items()],
+        'totals': totals,
+    }
+
+@click.command('backfill-analytics')
+def backfill_analytics_command():
+    """Rebuild the daily merchant activity rollup from transaction history."""
+    backfill_merchant_activity()
+    click.echo('Merchant analytics backfilled.')
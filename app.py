@@ -1,6 +1,6 @@
 import os
 import logging
-from flask import Flask, render_template
+from flask import render_template
 from flask_sqlalchemy_lite import SQLAlchemy
 from flask_alembic import Alembic
 from flask_login import LoginManager
@@ -8,14 +8,17 @@ from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_wtf.csrf import CSRFProtect
 
-from extensions import Model, db, alembic, login_manager
+from extensions import Model, db, alembic, login_manager, notifier, write_queue, stats_folder, request_timing, metrics, sqlite_profile
+from metrics import TimedQueuePool, TimedAsyncQueuePool
+from async_mode import EventLoopFlask
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
-def create_app():
+def create_app(async_mode=False):
+    """Create the app; async_mode also sets up the async engine asgi.py serves reads from"""
     # Create the app
-    app = Flask(__name__)
+    app = EventLoopFlask(__name__)
     
     # Configure app
     app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
@@ -26,20 +29,72 @@ def create_app():
 
     # Database configuration
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///loyalty.db")
+    # Logging every statement is slow and noisy; Server-Timing headers give
+    # per-request counts, and SLOW_REQUEST_MS logs the worst offenders
+    echo = os.environ.get("SQLALCHEMY_ECHO", "0") == "1"
+    # Flask-SQLAlchemy-Lite takes engine options alongside each engine's URL
     app.config["SQLALCHEMY_ENGINES"] = {
-        "default": app.config["SQLALCHEMY_DATABASE_URI"],
-    }
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
+        "default": {
+            "url": app.config["SQLALCHEMY_DATABASE_URI"],
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+            "echo": echo,
+            # Records checkout waits and pool usage for /metrics
+            "poolclass": TimedQueuePool,
+        },
     }
+    # SQLite profile: WAL and busy timeouts on every connection and BEGIN
+    # IMMEDIATE for write paths (see sqlite_profile.py)
+    app.config["SQLITE_PROFILE"] = os.environ.get("SQLITE_PROFILE", "1") == "1"
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    if async_mode:
+        from async_mode import async_database_url
+        app.config["SQLALCHEMY_ASYNC_ENGINES"] = {
+            "default": {
+                "url": os.environ.get("ASYNC_DATABASE_URL") or async_database_url(app.config["SQLALCHEMY_DATABASE_URI"]),
+                "pool_recycle": 300,
+                "pool_pre_ping": True,
+                "echo": echo,
+                "poolclass": TimedAsyncQueuePool,
+            },
+        }
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config['SQLALCHEMY_ECHO'] = True  # Enable SQL query logging for debugging
+    app.config["SERVER_TIMING"] = os.environ.get("SERVER_TIMING", "1") == "1"
+    app.config["SLOW_REQUEST_MS"] = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+    
+    # Group commit for point awards: scans and redemptions are queued and
+    # committed together, up to WRITE_BATCH_SIZE at a time or every
+    # WRITE_BATCH_WAIT_MS milliseconds
+    app.config["WRITE_BATCHING"] = os.environ.get("WRITE_BATCHING", "0") == "1"
+    app.config["WRITE_BATCH_SIZE"] = int(os.environ.get("WRITE_BATCH_SIZE", "64"))
+    app.config["WRITE_BATCH_WAIT_MS"] = float(os.environ.get("WRITE_BATCH_WAIT_MS", "5"))
+    # Scans and redemptions queue the merchant's side of their stats; each
+    # worker folds the queue into the merchant's rows every
+    # STATS_FOLD_INTERVAL_MS milliseconds (0 leaves it to `flask fold-stats`)
+    app.config["STATS_FOLD_INTERVAL_MS"] = float(os.environ.get("STATS_FOLD_INTERVAL_MS", "1000"))
+    app.config["STATS_FOLD_BATCH"] = int(os.environ.get("STATS_FOLD_BATCH", "5000"))
+    
+    # Processes per worker rendering batch QR codes; every gunicorn worker
+    # starts its own pool, so keep it small
+    app.config["QR_RENDER_WORKERS"] = int(os.environ.get("QR_RENDER_WORKERS", "2"))
+    # Seconds a printed batch QR code stays valid (90 days); single codes
+    # shown at the till expire after five minutes
+    app.config["QR_BATCH_MAX_AGE"] = int(os.environ.get("QR_BATCH_MAX_AGE", str(90 * 24 * 3600)))
+    
+    # Dashboard event streams per worker that may each hold a thread; later
+    # dashboards poll instead. asgi.py's streams hold no thread and skip it
+    app.config["EVENTS_MAX_STREAMS"] = int(os.environ.get("EVENTS_MAX_STREAMS", "8"))
     
     # Initialize extensions
     db.init_app(app)
     alembic.init_app(app)
     login_manager.init_app(app)
+    notifier.init_app(app)
+    write_queue.init_app(app)
+    stats_folder.init_app(app)
+    request_timing.init_app(app)
+    metrics.init_app(app)
+    sqlite_profile.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
@@ -55,11 +110,22 @@ def create_app():
     app.register_blueprint(transactions_bp)
     app.register_blueprint(map_bp)
     
+    # CLI commands
+    from stats import rebuild_stats_command, fold_stats_command
+    from transactions.vouchers import issue_vouchers_command
+    from analytics import backfill_analytics_command
+    from seed import seed_command
+    app.cli.add_command(rebuild_stats_command)
+    app.cli.add_command(fold_stats_command)
+    app.cli.add_command(issue_vouchers_command)
+    app.cli.add_command(backfill_analytics_command)
+    app.cli.add_command(seed_command)
+    
     # User loader for Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return db.session.get(User, int(user_id))
+        from auth.user_cache import load_user_snapshot
+        return load_user_snapshot(int(user_id))
     
     # Home route
     @app.route('/')
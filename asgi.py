@@ -0,0 +1,15 @@
+"""ASGI entry point, the async counterpart of main.py.
+
+The dashboard and map reads are served on an event loop with an async
+engine, so a request waiting on the database, or an idle event stream,
+holds a coroutine instead of a thread. Writes and everything else run on
+WSGI_THREADS threads with the sync engine. Needs the `async` extra:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 asgi:app
+"""
+import os
+from app import create_app
+from async_mode import AsyncApp
+
+app = AsyncApp(create_app(async_mode=True), threads=int(os.environ.get('WSGI_THREADS', '32')))
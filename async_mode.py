@@ -0,0 +1,239 @@
+import asyncio
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from tempfile import SpooledTemporaryFile
+from flask import Flask, appcontext_pushed, g
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only, greenlet_spawn
+from werkzeug.exceptions import HTTPException
+
+# Async drivers standing in for the sync ones in DATABASE_URL
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+# True while a request is being served on the event loop
+_on_event_loop = ContextVar('on_event_loop', default=False)
+
+def async_database_url(url):
+    """DATABASE_URL with its driver swapped for an asyncio one"""
+    url = make_url(url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    # asyncpg takes ssl= rather than libpq's sslmode=
+    if url.drivername == 'postgresql+asyncpg' and 'sslmode' in url.query:
+        url = url.update_query_dict({'ssl': url.query['sslmode']}).difference_update_query(['sslmode'])
+    return url.render_as_string(hide_password=False)
+
+def serving_on_event_loop():
+    """True while the current request is being served on the event loop"""
+    return _on_event_loop.get()
+
+def runs_on_event_loop(view):
+    """Serve this view on the event loop in ASGI mode, querying through the async engine.
+
+    Its only blocking I/O may be through db.session, which the async
+    session's greenlet bridge turns into awaits; anything else would stall
+    every request on the loop.
+    """
+    view.runs_on_event_loop = True
+    return view
+
+class EventLoopFlask(Flask):
+    """Flask that can run async callbacks on the event loop's own thread.
+
+    Flask runs async callbacks, such as Flask-SQLAlchemy-Lite's session
+    teardown, through asgiref, which won't run them on the loop's thread.
+    While AsyncApp serves a request there, they're awaited through the
+    request's greenlet instead; everywhere else Flask's default applies.
+    """
+
+    def async_to_sync(self, func):
+        if _on_event_loop.get():
+            return lambda *args, **kwargs: await_only(func(*args, **kwargs))
+        return super().async_to_sync(func)
+
+class EventLoopQueue:
+    """Stand-in for queue.Queue(maxsize=1) that waits on the event loop.
+
+    put_nowait() may be called from any thread. get() yields to the loop
+    while it waits, so it must be called while serving a request on it.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def put_nowait(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop has shut down, and the waiter with it
+            pass
+
+    def get(self, timeout=None):
+        try:
+            await_only(asyncio.wait_for(self._ready.wait(), timeout))
+        except TimeoutError:
+            raise queue.Empty
+        self._ready.clear()
+        return True
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP request, `body` being a file of its body"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        # Repeated headers are joined, as the WSGI spec asks
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+def wakeup_queue():
+    """A single-slot queue whose get() suits the thread it's called from"""
+    return EventLoopQueue() if _on_event_loop.get() else queue.Queue(maxsize=1)
+
+class AsyncApp:
+    """ASGI front for the Flask app.
+
+    Views marked with runs_on_event_loop are served on the event loop: the
+    app runs in a greenlet whose db.session is the sync face of an async
+    session, so each query awaits the async engine instead of holding a
+    thread. Everything else, the write paths included, runs unchanged on
+    the sync engine in a pool of `threads` threads, as under gthread. The
+    app must be an EventLoopFlask.
+    """
+
+    def __init__(self, app, threads=32):
+        from extensions import db
+
+        if not isinstance(app, EventLoopFlask):
+            raise TypeError('AsyncApp serves an EventLoopFlask app')
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+        with app.app_context():
+            self.engine = db.async_engine
+            self.sessionmaker = db.async_sessionmaker
+        appcontext_pushed.connect(self._bind_async_session, app)
+
+    def _bind_async_session(self, sender, **extra):
+        if _on_event_loop.get():
+            # Where Flask-SQLAlchemy-Lite keeps db.session for the context;
+            # its teardown closes it, from inside the greenlet. Private, so
+            # pyproject caps the version and tests/test_async_mode.py checks it
+            g._sqlalchemy_sessions = {'default': self.sessionmaker().sync_session}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope {scope["type"]!r}')
+
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            environ = wsgi_environ(scope, body)
+            loop = asyncio.get_running_loop()
+            if not self._runs_on_event_loop(environ):
+                def send_from_thread(message):
+                    asyncio.run_coroutine_threadsafe(send(message), loop).result()
+                return await loop.run_in_executor(self.executor, self._run_wsgi, environ, send_from_thread)
+
+            _on_event_loop.set(True)
+            dispatch = asyncio.ensure_future(
+                greenlet_spawn(self._run_wsgi, environ, lambda message: await_only(send(message)))
+            )
+            disconnect = asyncio.ensure_future(self._disconnected(receive))
+            try:
+                done, _ = await asyncio.wait({dispatch, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                disconnect.cancel()
+                if not dispatch.done():
+                    # The client went away, which is how event streams
+                    # usually end; let the view unwind before returning
+                    dispatch.cancel()
+                    await asyncio.wait({dispatch})
+            if dispatch in done:
+                dispatch.result()
+
+    def _runs_on_event_loop(self, environ):
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException:
+            return False
+        view = self.app.view_functions.get(rule.endpoint)
+        return getattr(view, 'runs_on_event_loop', False)
+
+    def _run_wsgi(self, environ, send):
+        """Run the Flask app on one request, passing its response to send()"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            }
+
+        body = self.app(environ, start_response)
+        try:
+            started = False
+            for chunk in body:
+                if not chunk:
+                    continue
+                if not started:
+                    send(response['start'])
+                    started = True
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send(response['start'])
+            send({'type': 'http.response.body'})
+        finally:
+            # Ends streamed responses' request contexts
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+
+    async def _disconnected(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
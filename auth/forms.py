@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, SelectField, HiddenField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional
+from wtforms import StringField, PasswordField, SubmitField, SelectField, HiddenField, FloatField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, NumberRange
+from wtforms.widgets import HiddenInput
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=64)])
@@ -11,6 +12,8 @@ class RegistrationForm(FlaskForm):
     user_type = SelectField('User Type', choices=[('customer', 'Customer'), ('merchant', 'Merchant')], validators=[DataRequired()])
     business_name = StringField('Business Name')
     address = StringField('Address')
+    latitude = FloatField('Latitude', validators=[Optional(), NumberRange(min=-90, max=90)], widget=HiddenInput())
+    longitude = FloatField('Longitude', validators=[Optional(), NumberRange(min=-180, max=180)], widget=HiddenInput())
     submit = SubmitField('Register')
 
 class LoginForm(FlaskForm):
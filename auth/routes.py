@@ -4,6 +4,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import select
 from auth import auth_bp
 from app import db
+from extensions import begin_write
 from models import User, UserType
 from .forms import LoginForm, RegistrationForm
 from utils import is_safe_url
@@ -32,6 +33,7 @@ def login():
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
+        begin_write()
         existing_user = db.session.scalar(
             select(User).where(
                 (User.email == form.email.data) | (User.username == form.username.data)
@@ -39,6 +41,7 @@ def register():
         )
         
         if existing_user:
+            db.session.rollback()
             flash('User with this email or username already exists', 'error')
             return render_template('auth/register.html', form=form)
         
@@ -50,8 +53,8 @@ def register():
             user_type=UserType(form.user_type.data),
             business_name=form.business_name.data if form.user_type.data == 'merchant' else None,
             address=form.address.data if form.user_type.data == 'merchant' else None,
-            # latitude=form.latitude.data if form.user_type.data == 'merchant' else None,
-            # longitude=form.longitude.data if form.user_type.data == 'merchant' else None
+            latitude=form.latitude.data if form.user_type.data == 'merchant' else None,
+            longitude=form.longitude.data if form.user_type.data == 'merchant' else None
         )
         print(user)
         
@@ -0,0 +1,62 @@
+import threading
+from flask_login import UserMixin
+from extensions import db, notifier
+from cache import LRUCache
+from models import User
+
+# Upper bound on staleness if a change notification is ever missed
+USER_CACHE_TTL = 60
+
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'phone', 'user_type', 'business_name', 'address',
+    'latitude', 'longitude', 'points_balance', 'created_at',
+)
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of a user's profile, safe to share between requests.
+
+    It is not attached to any session, so it can't lazy-load relationships
+    or be written back; code that changes a user works on the row itself.
+    """
+
+    def __init__(self, user):
+        for name in SNAPSHOT_FIELDS:
+            object.__setattr__(self, name, getattr(user, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('User snapshots are read-only')
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.id}>'
+
+# Snapshots by user id for Flask-Login; `user_cache.hit_rate` shows how
+# often a request skipped the users lookup
+user_cache = LRUCache(maxsize=4096, ttl=USER_CACHE_TTL)
+
+_epoch = 0
+_epoch_lock = threading.Lock()
+
+def invalidate_users(user_ids):
+    global _epoch
+    with _epoch_lock:
+        _epoch += 1
+    for user_id in user_ids:
+        user_cache.delete(user_id)
+
+def load_user_snapshot(user_id):
+    """The user as a cached snapshot, or None if they no longer exist"""
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    # Every worker drops a user as soon as any worker commits a change to them
+    notifier.add_callback(invalidate_users)
+    epoch = _epoch
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    snapshot = UserSnapshot(user)
+    # An invalidation during the read may mean it saw the old row
+    if epoch == _epoch:
+        user_cache.set(user_id, snapshot)
+    return snapshot
@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class WriteRejected(Exception):
+    """Raised by an operation, before it has written anything, to refuse it"""
+
+class GroupCommitter:
+    """Applies queued write operations in shared database transactions.
+
+    Requests submit a callable and block until the batch containing it has
+    committed. A single committer thread per worker drains the queue,
+    running up to `max_batch` operations, or whatever arrived within
+    `max_wait` seconds of the first one, under one commit. That trades a
+    few milliseconds of latency for one fsync per batch instead of one per
+    request.
+
+    Operations run in the committer's own app context and must only use
+    their arguments and db.session. An operation refuses a request by
+    raising WriteRejected before writing; the batch carries on without it.
+    Any other error, or a failed commit, rolls the batch back and each
+    operation is retried on its own so one bad write can't fail its
+    neighbours.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.max_batch = 64
+        self.max_wait = 0.005
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('WRITE_BATCHING', False)
+        self.max_batch = app.config.get('WRITE_BATCH_SIZE', self.max_batch)
+        self.max_wait = app.config.get('WRITE_BATCH_WAIT_MS', self.max_wait * 1000) / 1000
+
+    def submit(self, operation, *args):
+        """Run operation(*args) in the next batch; returns its result after commit"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((operation, args, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        # Started lazily so each forked worker gets its own committer
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        from extensions import db, begin_write
+
+        while True:
+            batch = self._collect()
+            with self.app.app_context():
+                results = []
+                try:
+                    begin_write()
+                    for operation, args, future in batch:
+                        try:
+                            results.append((future, operation(*args), None))
+                        except WriteRejected as e:
+                            results.append((future, None, e))
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self._run_individually(db, begin_write, batch)
+                    continue
+
+            self.batches += 1
+            self.operations += len(batch)
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _run_individually(self, db, begin_write, batch):
+        for operation, args, future in batch:
+            try:
+                begin_write()
+                result = operation(*args)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+class StatsFolder:
+    """Applies queued merchant stats in the background (see stats.queue_merchant_stats).
+
+    One thread per worker, started by the worker's first queued write,
+    folds whatever has queued every `interval` seconds, up to `max_batch`
+    rows per transaction. Folders in different workers share the queue
+    safely; each row is claimed by the delete that removes it. With an
+    interval of 0 nothing folds in the background; run `flask fold-stats`.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.interval = 1.0
+        self.max_batch = 5000
+        self.folded = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('STATS_FOLD_INTERVAL_MS', self.interval * 1000) / 1000
+        self.max_batch = app.config.get('STATS_FOLD_BATCH', self.max_batch)
+
+    def start(self):
+        if not self.interval:
+            return
+        # Started lazily so each forked worker gets its own folder
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def fold(self):
+        """Fold everything queued so far, a batch per transaction; returns how many"""
+        from extensions import db, begin_write
+        from stats import fold_merchant_stats
+
+        total = 0
+        with self.app.app_context():
+            while True:
+                try:
+                    begin_write()
+                    folded = fold_merchant_stats(self.max_batch)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                total += folded
+                if folded < self.max_batch:
+                    break
+        self.folded += total
+        return total
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.fold()
+            except Exception:
+                # The rows stay queued for the next run
+                logger.exception('Could not fold merchant stats')
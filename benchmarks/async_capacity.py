@@ -0,0 +1,174 @@
+"""Concurrent connections and memory per connection: gthread workers versus asgi.py.
+
+Starts one server process of each kind: gunicorn's gthread worker serving
+main.py, as deployed, and uvicorn serving asgi.py, both with --threads
+threads. Against each it opens --connections dashboard event streams as
+one logged-in customer and counts how many the server starts answering
+within --timeout seconds, times /dashboard/stats while they are all open,
+and reports how much resident memory the server grew by per open stream.
+
+A gthread worker gives every open stream a thread, so it serves at most
+--threads of them and everything else, the stats requests included, waits
+behind them. Under asgi.py an idle stream is a coroutine.
+
+Usage: python benchmarks/async_capacity.py [--connections 1000] [--threads 32]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from werkzeug.security import generate_password_hash
+from endpoints import ROOT, HttpSession, login, _free_port
+from app import create_app
+from extensions import db, alembic
+from models import User, UserType
+
+EMAIL = 'capacity@example.com'
+PROBES = 10
+# Seconds a stats request may wait while the streams are open
+PROBE_TIMEOUT = 5
+
+def setup():
+    app = create_app()
+    with app.app_context():
+        alembic.upgrade()
+        db.session.add(User(
+            username='capacity', email=EMAIL, password_hash=generate_password_hash('password'),
+            user_type=UserType.CUSTOMER, points_balance=100,
+        ))
+        db.session.commit()
+
+def start_server(command, threads):
+    port = _free_port()
+    env = dict(os.environ, WSGI_THREADS=str(threads), LOG_LEVEL='WARNING')
+    process = subprocess.Popen([sys.executable, '-m', *command(port)], cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/auth/login').close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'{command(port)[0]} did not start')
+
+def rss_kb(pid):
+    """Resident memory of a process and all its descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may hold spaces; fields resume after ')'
+                    parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+        except (OSError, StopIteration):
+            pass
+    return total
+
+def _request(path, cookie):
+    return (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n'
+            f'Connection: close\r\n\r\n').encode()
+
+async def open_stream(port, cookie, timeout):
+    """An event stream connection, once the server sent its first stats event"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(_request('/dashboard/events', cookie))
+    received = b''
+    try:
+        async with asyncio.timeout(timeout):
+            while b'event: stats' not in received:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                received += chunk
+    except TimeoutError:
+        pass
+    return writer, b'event: stats' in received
+
+async def probe(port, cookie, index, timeout):
+    """Milliseconds to fetch /dashboard/stats, or None if it timed out"""
+    start = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(_request(f'/dashboard/stats?probe={index}', cookie))
+            response = await reader.read()
+            writer.close()
+    except TimeoutError:
+        return None
+    return (time.perf_counter() - start) * 1000 if response.startswith(b'HTTP/1.1 200') else None
+
+async def measure(pid, port, cookie, args):
+    baseline = rss_kb(pid)
+    streams = await asyncio.gather(*(open_stream(port, cookie, args.timeout) for _ in range(args.connections)))
+    served = sum(1 for _, ok in streams if ok)
+    held = rss_kb(pid)
+    probes = [await probe(port, cookie, i, PROBE_TIMEOUT) for i in range(PROBES)]
+    for writer, _ in streams:
+        writer.close()
+    answered = [ms for ms in probes if ms is not None]
+    return {
+        'served': served,
+        'kb_per_stream': (held - baseline) / served if served else None,
+        'baseline_mb': baseline / 1024,
+        'stats_p50_ms': statistics.median(answered) if answered else None,
+        'stats_timeouts': PROBES - len(answered),
+    }
+
+SERVERS = {
+    'gthread (main.py)': lambda args: lambda port: [
+        'gunicorn', '-b', f'127.0.0.1:{port}', '--worker-class', 'gthread', '--threads', str(args.threads),
+        '--worker-connections', str(args.connections + PROBES + 10), '--log-level', 'warning', 'main:app',
+    ],
+    'uvicorn (asgi.py)': lambda args: lambda port: [
+        'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning', '--no-access-log',
+    ],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='seconds for all the streams to start')
+    args = parser.parse_args()
+
+    setup()
+    print(f'{args.connections} event streams, {args.threads} threads, '
+          f'{os.environ["DATABASE_URL"].split(":")[0]}')
+    for name, command in SERVERS.items():
+        process, port = start_server(command(args), args.threads)
+        try:
+            session = login(HttpSession(f'http://127.0.0.1:{port}'), EMAIL)
+            cookie = '; '.join(f'{c.name}={c.value}' for c in session.cookies)
+            result = asyncio.run(measure(process.pid, port, cookie, args))
+        finally:
+            process.terminate()
+            process.wait()
+        per_stream = f'{result["kb_per_stream"]:6.1f} KB' if result['kb_per_stream'] is not None else '     n/a'
+        p50 = f'{result["stats_p50_ms"]:7.1f}ms' if result['stats_p50_ms'] is not None else '      n/a'
+        print(f'{name:>18}: {result["served"]:5d} streams served  {per_stream}/stream '
+              f'(base {result["baseline_mb"]:.0f} MB)  stats p50 {p50}  '
+              f'stats timeouts {result["stats_timeouts"]}/{PROBES}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""customers_served from the HyperLogLog sketch versus COUNT(DISTINCT).
+
+Grows one merchant's history in stages, each customer visiting a few
+times, maintaining the sketch the way the write path does. After each
+stage it times the sketch estimate and the exact query and reports the
+estimate's error. Exits non-zero if any error exceeds the bound.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/customers_served.py [max_customers] [bound_pct]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import insert
+from app import create_app
+from extensions import db
+from models import Transaction, TransactionType
+from stats import customers_served, record_customers
+from scan_concurrency import setup
+
+VISITS = 4
+
+def grow(app, merchant_id, customer_ids, batch=50000):
+    """Record VISITS scans from each new customer, sketch included"""
+    visits = [customer_id for customer_id in customer_ids for _ in range(VISITS)]
+    random.shuffle(visits)
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        for offset in range(0, len(visits), batch):
+            chunk = visits[offset:offset + batch]
+            record_customers(merchant_id, chunk)
+            db.session.execute(insert(Transaction), [
+                {'transaction_type': TransactionType.QR_ISSUE, 'sender_id': merchant_id,
+                 'receiver_id': customer_id, 'points': 1, 'created_at': now}
+                for customer_id in chunk
+            ])
+            db.session.commit()
+
+def timed(app, merchant_id, exact, repeat=5):
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            value = customers_served(merchant_id, exact=exact)
+        return value, (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    max_customers = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    bound_pct = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    app = create_app()
+    with app.app_context():
+        db.engine.echo = False
+    print(f'Up to {max_customers} customers x {VISITS} visits against '
+          f'{app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]}')
+    merchant_id, customer_ids = setup(app, max_customers)
+
+    failed = False
+    stage, done = 100, 0
+    while done < max_customers:
+        stage = min(stage, max_customers)
+        grow(app, merchant_id, customer_ids[done:stage])
+        done = stage
+        exact, exact_ms = timed(app, merchant_id, True)
+        estimate, sketch_ms = timed(app, merchant_id, False)
+        error = (estimate - exact) / exact * 100
+        print(f'{exact:>8} customers: sketch {estimate:>8} ({error:+5.2f}%) in {sketch_ms:6.2f}ms | '
+              f'exact in {exact_ms:8.2f}ms')
+        failed = failed or abs(error) > bound_pct
+        stage *= 10 if stage < 10_000 else 2
+    if failed:
+        sys.exit(f'FAIL: an estimate was off by more than {bound_pct}%')
+    print(f'OK: every estimate within {bound_pct}%')
+
+if __name__ == '__main__':
+    main()
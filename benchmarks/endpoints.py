@@ -0,0 +1,336 @@
+"""Latency, throughput and SQL statements per request for the hot endpoints.
+
+Seeds a database with seed.py's generator (or reuses one), then drives
+each endpoint with --concurrency logged-in clients, each sending its share
+of --requests. Requests go through the Flask test client in-process, where
+every SQL statement is counted, or over HTTP to a gunicorn process started
+for the run (--mode http) or to an already running server (--url), which
+reports its statement counts in the Server-Timing header.
+
+    python benchmarks/endpoints.py --save baseline.json
+    python benchmarks/endpoints.py --compare baseline.json --threshold 0.25
+
+--compare exits non-zero when an endpoint's p50 or p95 latency or its
+throughput got worse by more than the threshold, or when it runs more SQL
+statements per request than in the baseline. Reads bypass the per-user
+response cache with a throwaway query argument, so they measure the real
+work rather than cache hits. Set DATABASE_URL to benchmark a particular
+database; add --reuse to skip seeding one that is already populated.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import event, select, func
+from app import create_app
+from extensions import db
+from models import User, UserType, UserStats, Transaction
+from seed import generate
+from transactions.routes import sign_qr_code_data
+from transactions.vouchers import issue_vouchers
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+# Latency changes smaller than this are noise, whatever the percentage
+NOISE_MS = 1.0
+
+_statements = threading.local()
+_json_dumps = json.dumps
+
+def _count_statement(*args):
+    _statements.count = getattr(_statements, 'count', 0) + 1
+
+class TestClientSession:
+    """One logged-in user, requests served in-process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json=None, headers=None):
+        _statements.count = 0
+        response = self.client.open(path, method=method, data=data, json=json, headers=headers)
+        return response.status_code, response.get_data(as_text=True), _statements.count
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpSession:
+    """One logged-in user talking to a real server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def request(self, method, path, data=None, json=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _json_dumps(json).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            response = self.opener.open(req)
+        except urllib.error.HTTPError as e:
+            response = e
+        with response:
+            # The server reports its statement count in Server-Timing
+            queries = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+            return response.status, response.read().decode(), int(queries.group(1)) if queries else None
+
+def login(session, email):
+    _, page, _ = session.request('GET', '/auth/login')
+    status, _, _ = session.request('POST', '/auth/login', data={
+        'csrf_token': CSRF_TOKEN.search(page).group(1), 'email': email, 'password': 'password',
+    })
+    if status != 302:
+        raise RuntimeError(f'Could not log in as {email}')
+    _, page, _ = session.request('GET', '/transactions/redeem')
+    session.csrf_token = CSRF_TOKEN.search(page).group(1)
+    return session
+
+def prepare(app, args):
+    """Seed if needed and pick the users and vouchers the scenarios use"""
+    with app.app_context():
+        db.engine.echo = False
+        if not args.reuse:
+            generate(args.customers, args.merchants, args.transactions, echo=lambda message: None)
+        # The busiest merchant, and the customers with the most to transfer
+        merchant_id = db.session.scalar(
+            select(User.id).join(UserStats, UserStats.user_id == User.id)
+            .where(User.user_type == UserType.MERCHANT).order_by(UserStats.total_spent.desc()).limit(1)
+        )
+        merchant = db.session.get(User, merchant_id)
+        customers = db.session.scalars(
+            select(User.email).where(User.user_type == UserType.CUSTOMER)
+            .order_by(User.points_balance.desc()).limit(args.concurrency + 1)
+        ).all()
+        vouchers = issue_vouchers(merchant_id, args.requests + args.concurrency * args.warmup, 5, 'Benchmark')
+        db.session.commit()
+        with app.test_request_context():
+            qr_code = sign_qr_code_data({
+                'type': 'points_issue', 'merchant_id': merchant_id, 'points': 1, 'description': 'Benchmark',
+            })
+        lat, lon = (merchant.latitude, merchant.longitude) if merchant.geohash else (0, 0)
+        return {
+            'size': {
+                'customers': db.session.scalar(select(func.count(User.id)).where(User.user_type == UserType.CUSTOMER)),
+                'merchants': db.session.scalar(select(func.count(User.id)).where(User.user_type == UserType.MERCHANT)),
+                'transactions': db.session.scalar(select(func.count(Transaction.id))),
+            },
+            'merchant': merchant.email,
+            'customers': customers,
+            'vouchers': iter(vouchers),
+            'voucher_lock': threading.Lock(),
+            'qr_code': qr_code,
+            # A neighbourhood around the merchant
+            'bbox': f'{lon - 0.05},{lat - 0.05},{lon + 0.05},{lat + 0.05}',
+        }
+
+def _next_voucher(data):
+    with data['voucher_lock']:
+        return next(data['vouchers'])
+
+# name -> (who is logged in, request for the i-th call, expected status)
+SCENARIOS = {
+    'dashboard_transactions': ('merchant', lambda s, d, i: ('GET', f'/dashboard/transactions?bench={i}'), 200),
+    'dashboard_stats': ('merchant', lambda s, d, i: ('GET', f'/dashboard/stats?bench={i}'), 200),
+    'map_merchants': ('merchant', lambda s, d, i: ('GET', f'/map/merchants?bbox={d["bbox"]}&zoom=14&bench={i}'), 200),
+    'scan_qr': ('customer', lambda s, d, i: ('POST', '/transactions/scan_qr', {
+        'json': {'qr_data': d['qr_code']}, 'headers': {'X-CSRFToken': s.csrf_token},
+    }), 200),
+    'redeem': ('customer', lambda s, d, i: ('POST', '/transactions/redeem', {
+        'data': {'csrf_token': s.csrf_token, 'voucher_code': _next_voucher(d)},
+    }), 302),
+    'transfer': ('customer', lambda s, d, i: ('POST', '/transactions/transfer', {
+        'data': {'csrf_token': s.csrf_token, 'recipient_email': d['customers'][-1], 'points': 1},
+    }), 302),
+}
+
+def _ok(name, status, body, expected):
+    if status != expected:
+        return False
+    if name == 'scan_qr':
+        return json.loads(body).get('success', False)
+    return True
+
+def run_scenario(name, sessions, data, args):
+    _, make_request, expected = SCENARIOS[name]
+    per_client = args.requests // len(sessions)
+
+    def client_loop(index, session):
+        results = []
+        for i in range(-args.warmup, per_client):
+            method, path, *options = make_request(session, data, index * per_client + i)
+            started = time.perf_counter()
+            status, body, statements = session.request(method, path, **(options[0] if options else {}))
+            elapsed = (time.perf_counter() - started) * 1000
+            if i >= 0:
+                results.append((elapsed, statements, _ok(name, status, body, expected)))
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(sessions)) as pool:
+        results = [r for rs in pool.map(client_loop, range(len(sessions)), sessions) for r in rs]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    statements = [count for _, count, _ in results if count is not None]
+    # Throughput leaves out the warmup requests, which ran in the same wall time
+    measured = len(results) / (wall * len(results) / (len(results) + args.warmup * len(sessions)))
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, _, ok in results if not ok),
+        'p50_ms': round(quantiles[49], 3),
+        'p95_ms': round(quantiles[94], 3),
+        'p99_ms': round(quantiles[98], 3),
+        'throughput_rps': round(measured, 1),
+        'statements_per_request': round(statistics.mean(statements), 2) if statements else None,
+    }
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_gunicorn(workers):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning',
+         'main:app'],
+        cwd=ROOT,
+    )
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/auth/login').close()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+def compare(results, baseline, threshold):
+    """Print each endpoint against the baseline; returns the regressions"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        checks = [
+            ('p50_ms', current['p50_ms'] > base['p50_ms'] * (1 + threshold) + NOISE_MS),
+            ('p95_ms', current['p95_ms'] > base['p95_ms'] * (1 + threshold) + NOISE_MS),
+            ('throughput_rps', current['throughput_rps'] < base['throughput_rps'] * (1 - threshold)),
+        ]
+        if current['statements_per_request'] is not None and base['statements_per_request'] is not None:
+            checks.append(('statements_per_request',
+                           current['statements_per_request'] > base['statements_per_request'] + 0.5))
+        for metric, regressed in checks:
+            marker = 'REGRESSED' if regressed else ''
+            print(f'  {name:>24} {metric:>22}: {base[metric]:>10} -> {current[metric]:>10} {marker}')
+            if regressed:
+                regressions.append(f'{name} {metric}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--url', help='benchmark a server that is already running (implies --mode http)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers in http mode')
+    parser.add_argument('--customers', type=int, default=5000)
+    parser.add_argument('--merchants', type=int, default=100)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--reuse', action='store_true', help='use the data already in DATABASE_URL')
+    parser.add_argument('--requests', type=int, default=400, help='measured requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per client first')
+    parser.add_argument('--only', action='append', choices=SCENARIOS, help='run just these endpoints')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+    if args.url:
+        args.mode = 'http'
+
+    app = create_app()
+    data = prepare(app, args)
+    server = None
+    if args.mode == 'client':
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', _count_statement)
+        new_session = lambda: TestClientSession(app)
+    else:
+        url = args.url
+        if not url:
+            server, url = start_gunicorn(args.workers)
+        new_session = lambda: HttpSession(url)
+
+    try:
+        results = {}
+        for name in args.only or SCENARIOS:
+            role = SCENARIOS[name][0]
+            sessions = [
+                login(new_session(), data['merchant'] if role == 'merchant' else data['customers'][i])
+                for i in range(args.concurrency)
+            ]
+            results[name] = run_scenario(name, sessions, data, args)
+            r = results[name]
+            statements = '-' if r['statements_per_request'] is None else r['statements_per_request']
+            print(f'{name:>24}: p50 {r["p50_ms"]:8.2f}ms  p95 {r["p95_ms"]:8.2f}ms  p99 {r["p99_ms"]:8.2f}ms  '
+                  f'{r["throughput_rps"]:8.1f} req/s  {statements:>6} stmts/req  errors {r["errors"]}')
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'config': {
+            'mode': args.mode, 'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+            **data['size'], 'requests': args.requests, 'concurrency': args.concurrency,
+        },
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved to {args.save}')
+
+    failed = any(r['errors'] for r in results.values())
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['config'] != report['config']:
+            print(f'Note: baseline was run with {baseline["config"]}')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'FAIL: regressed beyond {args.threshold:.0%}: {", ".join(regressions)}')
+            failed = True
+        else:
+            print(f'OK: no endpoint regressed beyond {args.threshold:.0%}')
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
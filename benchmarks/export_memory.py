@@ -0,0 +1,79 @@
+"""Peak memory of the streaming ledger export, small versus large ledgers.
+
+Builds a synthetic ledger for one merchant, then drains the CSV and
+NDJSON generators for the first 1k rows and for the whole ledger while
+tracemalloc records the peak Python allocation. Exits non-zero if the
+large export peaks above the bound, or grows well past the small one.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/export_memory.py [rows] [bound_mb]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import insert
+from app import create_app
+from extensions import db
+from models import Transaction, TransactionType
+from dashboard.export import ledger_rows, ledger_csv, ledger_ndjson
+from scan_concurrency import setup
+
+def populate(app, rows, batch=50000):
+    merchant_id, customer_ids = setup(app, 100)
+    start = datetime(2024, 1, 1)
+    types = [TransactionType.QR_ISSUE, TransactionType.AIRDROP, TransactionType.VOUCHER_ISSUE]
+    with app.app_context():
+        for offset in range(0, rows, batch):
+            db.session.execute(insert(Transaction), [
+                {
+                    'transaction_type': types[i % 3],
+                    'sender_id': merchant_id,
+                    'receiver_id': customer_ids[i % len(customer_ids)],
+                    'points': i % 50 + 1,
+                    'description': f'Synthetic transaction {i}',
+                    'created_at': start + timedelta(seconds=i * 7),
+                }
+                for i in range(offset, min(offset + batch, rows))
+            ])
+            db.session.commit()
+    return merchant_id, start + timedelta(seconds=min(rows, 1000) * 7)
+
+def measure(app, serialize, merchant_id, conditions):
+    with app.app_context():
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in serialize(ledger_rows(merchant_id, conditions)))
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak / 2 ** 20, size / 2 ** 20, elapsed
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    bound_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 16
+    app = create_app()
+    with app.app_context():
+        db.engine.echo = False
+    print(f'{rows} ledger rows against {app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]}')
+    merchant_id, first_1k_end = populate(app, rows)
+
+    failed = False
+    for serialize in (ledger_csv, ledger_ndjson):
+        small = measure(app, serialize, merchant_id, [Transaction.created_at < first_1k_end])
+        large = measure(app, serialize, merchant_id, [])
+        print(f'{serialize.__name__:>13}: 1k rows peak {small[0]:6.2f}MB | '
+              f'{rows} rows peak {large[0]:6.2f}MB, {large[1]:.0f}MB written in {large[2]:.1f}s')
+        if large[0] > bound_mb or large[0] > small[0] * 2 + 1:
+            failed = True
+    if failed:
+        sys.exit(f'FAIL: export memory grew with ledger size (bound {bound_mb}MB)')
+    print(f'OK: peak memory flat and under {bound_mb}MB')
+
+if __name__ == '__main__':
+    main()
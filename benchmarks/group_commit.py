@@ -0,0 +1,70 @@
+"""QR scan throughput with one commit per request versus group commit.
+
+Runs the scan_qr write path from N threads, first committing every scan
+on its own and then through the write queue, which applies up to
+WRITE_BATCH_SIZE scans per transaction. Each scan still waits for its own
+batch to commit, so the numbers are comparable request for request.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/group_commit.py [threads] [scans_per_thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import select, func
+from app import create_app
+from extensions import db, write_queue
+from models import User
+from transactions.routes import _run_write, _award_qr_points
+from scan_concurrency import setup, POINTS
+
+def run(app, batched, threads, scans):
+    merchant_id, customer_ids = setup(app, threads)
+    write_queue.enabled = batched
+    batches_before = write_queue.batches
+    errors = []
+
+    def worker(customer_id):
+        for _ in range(scans):
+            # One app context per scan, like one request
+            with app.app_context():
+                try:
+                    _run_write(_award_qr_points, customer_id, merchant_id, POINTS, 'bench')
+                except Exception as e:
+                    errors.append(e)
+
+    pool = [threading.Thread(target=worker, args=(customer_id,)) for customer_id in customer_ids]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        balance = db.session.scalar(select(func.sum(User.points_balance)))
+    done = threads * scans - len(errors)
+    label = 'group commit' if batched else 'per request'
+    line = f'{label:>13}: {done / elapsed:8.0f} scans/s  errors={len(errors)}  lost updates={(done * POINTS - balance) // POINTS}'
+    if batched:
+        line += f'  avg batch={done / max(write_queue.batches - batches_before, 1):.1f}'
+    print(line)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    app = create_app()
+    with app.app_context():
+        db.engine.echo = False
+    print(f'{threads} threads x {scans} scans against {app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]}'
+          f' (batch size {write_queue.max_batch}, wait {write_queue.max_wait * 1000:g}ms)')
+    run(app, False, threads, scans)
+    run(app, True, threads, scans)
+
+if __name__ == '__main__':
+    main()
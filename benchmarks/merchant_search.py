@@ -0,0 +1,96 @@
+"""Merchant search: indexed FTS5 / pg_trgm search versus leading-wildcard ILIKE.
+
+Fills the users table (1M rows by default, one in ten a merchant), then
+times `ILIKE '%term%'` over names and addresses against search_merchants()
+for whole words, prefixes, misspellings and narrow multi-word queries.
+Common words let an unranked ILIKE stop after the first 20 rows; the
+indexed search ranks every match instead.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/merchant_search.py [users] [repeats]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from sqlalchemy import delete, insert, select, or_
+from app import create_app
+from extensions import db, alembic
+from models import User, UserType, UserStats, Transaction, Voucher
+from map.search import search_merchants
+
+NAME_WORDS = ['Golden', 'Dragon', 'Blue', 'Olive', 'Corner', 'Harbor', 'Maple', 'Sunrise', 'Urban', 'Rustic',
+              'Lotus', 'Copper', 'Velvet', 'Garden', 'Little', 'Royal', 'Silver', 'Spice', 'Coastal', 'Cedar']
+KINDS = ['Cafe', 'Bistro', 'Bakery', 'Diner', 'Kitchen', 'Grill', 'Noodle Bar', 'Pizzeria', 'Tavern', 'Deli']
+STREETS = ['Main', 'Oak', 'Pine', 'Elm', 'Market', 'Church', 'Mill', 'Station', 'Bridge', 'Park']
+CITIES = ['Springfield', 'Riverton', 'Lakeside', 'Fairview', 'Greenville', 'Brookfield', 'Ashford', 'Westport']
+
+QUERIES = {
+    'word': ['bakery', 'harbor', 'riverton', 'copper grill'],
+    'prefix': ['bak', 'harb', 'river', 'cop gri'],
+    'typo': ['bakrey', 'harbour', 'rivertn', 'coper gril'],
+    'narrow': ['velvet lotus tavern', '742 elm', 'cedar spice deli'],
+}
+
+def populate(app, users, batch=20000):
+    with app.app_context():
+        alembic.upgrade()
+        for model in (Transaction, Voucher, UserStats, User):
+            db.session.execute(delete(model))
+        rng = random.Random(42)
+        for start in range(0, users, batch):
+            rows = []
+            for i in range(start, min(start + batch, users)):
+                merchant = i % 10 == 0
+                rows.append({
+                    'username': f'bench-{i}',
+                    'email': f'user{i}@bench.test',
+                    'password_hash': 'x',
+                    'user_type': UserType.MERCHANT if merchant else UserType.CUSTOMER,
+                    'business_name': f'{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {rng.choice(KINDS)}' if merchant else None,
+                    'address': f'{rng.randint(1, 999)} {rng.choice(STREETS)} St, {rng.choice(CITIES)}' if merchant else None,
+                    'points_balance': 0,
+                })
+            db.session.execute(insert(User), rows)
+            db.session.commit()
+
+def ilike_search(query, limit):
+    conditions = [User.user_type == UserType.MERCHANT]
+    conditions += [
+        or_(User.business_name.ilike(f'%{term}%'), User.address.ilike(f'%{term}%'))
+        for term in query.split()
+    ]
+    return db.session.scalars(select(User).where(*conditions).limit(limit)).all()
+
+def timed(search, query, repeats, limit=20):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        results = search(query, limit)
+    return (time.perf_counter() - start) / repeats * 1000, len(results)
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    app = create_app()
+    with app.app_context():
+        db.engine.echo = False
+    print(f'{users} users against {app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]}')
+
+    start = time.perf_counter()
+    populate(app, users)
+    print(f'populated in {time.perf_counter() - start:.1f}s')
+
+    with app.app_context():
+        print(f'{"query":>20} {"kind":>7} {"ilike ms":>9} {"hits":>5} {"search ms":>10} {"hits":>5}')
+        for kind, queries in QUERIES.items():
+            for query in queries:
+                ilike_ms, ilike_hits = timed(ilike_search, query, repeats)
+                search_ms, search_hits = timed(search_merchants, query, repeats)
+                print(f'{query:>20} {kind:>7} {ilike_ms:9.1f} {ilike_hits:5} {search_ms:10.1f} {search_hits:5}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Per-call cost of the Prometheus instrumentation on the hot path.
+
+Times what a request pays for metrics: the latency hooks around every
+request, a labelled counter increment (transactions written, QR scans) and
+the pool checkout accounting, the last against a plain QueuePool. Runs once
+in-process and once in multiprocess mode, as under gunicorn, where every
+sample goes to a memory-mapped file. Exits non-zero if any cost exceeds
+the bound.
+
+Usage: python benchmarks/metrics_overhead.py [iterations] [bound_us]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+def per_call_us(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def measure(iterations):
+    """{name: microseconds per call} in the current process's mode"""
+    from flask import Response
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import QueuePool
+    from app import create_app
+    from extensions import metrics
+    from metrics import TimedQueuePool, QR_SCANS
+
+    app = create_app()
+    response = Response()
+
+    def hooks():
+        metrics._start()
+        metrics._observe(response)
+
+    def checkout(engine):
+        engine.connect().close()
+
+    plain = create_engine('sqlite://', poolclass=QueuePool)
+    timed = create_engine('sqlite://', poolclass=TimedQueuePool)
+    with app.test_request_context('/dashboard/transactions'):
+        app.preprocess_request()
+        results = {
+            'request hooks': per_call_us(hooks, iterations),
+            'counter inc': per_call_us(lambda: QR_SCANS.labels('success').inc(), iterations),
+        }
+    results['pool checkout'] = per_call_us(lambda: checkout(timed), iterations) - per_call_us(lambda: checkout(plain), iterations)
+    return results
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        for name, us in measure(int(sys.argv[2])).items():
+            print(f'{name}\t{us}')
+        return
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bound = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    worst = 0
+    for mode in ('single process', 'multiprocess'):
+        env = dict(os.environ)
+        env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        if mode == 'multiprocess':
+            env['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp()
+        # A fresh interpreter each, since prometheus_client picks its mode on import
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', str(iterations)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        print(f'{mode}:')
+        for line in output.splitlines():
+            name, us = line.split('\t')
+            us = float(us)
+            worst = max(worst, us)
+            print(f'  {name:>14}: {us:7.2f} us/call')
+    if worst > bound:
+        print(f'FAIL: {worst:.2f} us/call exceeds {bound} us')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
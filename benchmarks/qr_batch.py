@@ -0,0 +1,44 @@
+"""Batch QR rendering throughput versus the single-code path in a loop.
+
+Usage: python benchmarks/qr_batch.py [count] [workers]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itsdangerous import URLSafeTimedSerializer
+from transactions.qr import render_qr_code, stream_qr_zip, _render_pool
+
+def payloads(count):
+    s = URLSafeTimedSerializer('benchmark-secret')
+    return [
+        s.dumps({'type': 'points_issue', 'merchant_id': 1, 'points': 10,
+                 'description': 'Table tent', 'serial': serial})
+        for serial in range(1, count + 1)
+    ]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    data = payloads(count)
+
+    start = time.perf_counter()
+    for payload in data:
+        render_qr_code(payload)
+    loop_seconds = time.perf_counter() - start
+
+    # Start the pool outside the timed region, as a long-lived worker would
+    _render_pool(workers).submit(render_qr_code, data[0]).result()
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in stream_qr_zip(data, workers=workers))
+    batch_seconds = time.perf_counter() - start
+
+    print(f'codes: {count}, pool workers: {workers}')
+    print(f'single-code loop: {loop_seconds:.2f}s ({count / loop_seconds:.0f} codes/s)')
+    print(f'batch + zip:      {batch_seconds:.2f}s ({count / batch_seconds:.0f} codes/s, {size / 1024:.0f} KiB)')
+    print(f'speedup: {loop_seconds / batch_seconds:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""N threads scanning one merchant's QR code: queued merchant stats versus row locks.
+
+Compares three ways of writing a scan:
+
+- queued_scan is scan_qr's own _award_qr_points. The customer's balance is
+  one conditional UPDATE ... RETURNING, and the merchant's side of the stats
+  is appended to merchant_stats_deltas. Nothing keyed by the merchant is
+  written or locked, so concurrent scans only share the ledger inserts.
+- inline_scan uses the same balance update but upserts the merchant's
+  user_stats, daily rollup and customer sketch rows itself, so every scan
+  waits on the merchant's rows.
+- locking_scan is the original pattern: it locks both the customer and the
+  merchant rows, increments the balance in Python and upserts inline.
+
+The queued stats are folded afterwards and checked against the scans.
+Run it against Postgres to see lock contention; SQLite ignores FOR UPDATE
+and serializes all writers anyway.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/scan_concurrency.py [threads] [scans_per_thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+# Folded once at the end rather than by a thread during the timed scans
+os.environ.setdefault('STATS_FOLD_INTERVAL_MS', '0')
+
+from sqlalchemy import delete, insert, select, func
+from app import create_app
+from extensions import db, Model, stats_folder
+from models import (
+    User, UserType, UserStats, Transaction, TransactionType,
+    CustomerSketch, DailyMerchantActivity, DailyCustomerSketch, MerchantStatsDelta,
+)
+from transactions.routes import _adjust_balance, _award_qr_points, _create_transaction
+
+POINTS = 5
+
+def queued_scan(customer_id, merchant_id):
+    _award_qr_points(customer_id, merchant_id, POINTS, None)
+    db.session.commit()
+
+def inline_scan(customer_id, merchant_id):
+    sender = db.session.get(User, merchant_id)
+    assert sender.user_type == UserType.MERCHANT
+    _adjust_balance(customer_id, POINTS)
+    _create_transaction(TransactionType.QR_ISSUE, POINTS, sender_id=merchant_id, receiver_id=customer_id)
+    db.session.commit()
+
+def locking_scan(customer_id, merchant_id):
+    receiver = db.session.get(User, customer_id, with_for_update=True)
+    sender = db.session.get(User, merchant_id, with_for_update=True)
+    assert sender.user_type == UserType.MERCHANT
+    receiver.points_balance += POINTS
+    _create_transaction(TransactionType.QR_ISSUE, POINTS, sender_id=merchant_id, receiver_id=customer_id)
+    db.session.commit()
+
+def setup(app, customers):
+    with app.app_context():
+        Model.metadata.create_all(db.engine)
+        for model in (MerchantStatsDelta, Transaction, UserStats, CustomerSketch,
+                      DailyMerchantActivity, DailyCustomerSketch, User):
+            db.session.execute(delete(model))
+        db.session.execute(insert(User), [
+            {'username': 'bench-merchant', 'email': 'merchant@bench.test', 'password_hash': 'x',
+             'user_type': UserType.MERCHANT, 'business_name': 'Bench Cafe', 'points_balance': 0},
+        ] + [
+            {'username': f'bench-{i}', 'email': f'customer{i}@bench.test', 'password_hash': 'x',
+             'user_type': UserType.CUSTOMER, 'points_balance': 0}
+            for i in range(customers)
+        ])
+        db.session.commit()
+        merchant_id = db.session.scalar(select(User.id).where(User.user_type == UserType.MERCHANT))
+        customer_ids = db.session.scalars(select(User.id).where(User.user_type == UserType.CUSTOMER)).all()
+        return merchant_id, customer_ids
+
+def run(app, scan, threads, scans):
+    merchant_id, customer_ids = setup(app, threads)
+    errors = []
+
+    def worker(customer_id):
+        for _ in range(scans):
+            # One app context per scan, like one request
+            with app.app_context():
+                try:
+                    scan(customer_id, merchant_id)
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(e)
+
+    pool = [threading.Thread(target=worker, args=(customer_id,)) for customer_id in customer_ids]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    folded = stats_folder.fold()
+    fold_elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        balance = db.session.scalar(select(func.sum(User.points_balance)))
+        issued = db.session.scalar(select(UserStats.total_issued).where(UserStats.user_id == merchant_id))
+    done = threads * scans - len(errors)
+    lost = done * POINTS - balance
+    print(f'{scan.__name__:>13}: {done / elapsed:8.0f} scans/s  errors={len(errors)}  lost updates={lost // POINTS}'
+          + (f'  folded {folded} in {fold_elapsed * 1000:.0f}ms' if folded else ''))
+    assert issued == done * POINTS, f'merchant stats show {issued} points issued, expected {done * POINTS}'
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    app = create_app()
+    with app.app_context():
+        db.engine.echo = False
+    print(f'{threads} threads x {scans} scans against {app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]}')
+    run(app, locking_scan, threads, scans)
+    run(app, inline_scan, threads, scans)
+    run(app, queued_scan, threads, scans)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Transfers and voucher redemptions from many processes against one SQLite file.
+
+Runs --processes worker processes, as gunicorn would, each logged in as its
+own customer and sending --operations requests through the transfer and
+redeem views plus dashboard stats reads. Vouchers are drawn at random from
+one shared list, so redemptions of the same code race. It runs once with
+SQLITE_PROFILE=0, SQLite's defaults, and once with the engine profile, each
+against a fresh database file.
+
+Afterwards it checks the ledger: every transfer and redemption a worker
+saw succeed has its transaction row and nothing else does, each voucher
+was redeemed at most once, and every customer's balance equals their
+starting points plus what the ledger says they received, less what they
+sent. Exits non-zero if a check fails.
+
+WAL mostly saves fsyncs and reader/writer blocking, so the gap depends on
+the disk and on having spare cores; point TMPDIR at the production disk.
+
+Usage: python benchmarks/sqlite_stress.py [--processes 8] [--operations 200]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+START_BALANCE = 1000
+# Past transactions each customer starts with, so exports are long reads
+HISTORY = 2000
+VOUCHER_POINTS = 10
+PASSWORD = 'password'
+
+def setup(customers, vouchers):
+    """Customer emails and voucher codes in a freshly migrated database"""
+    from sqlalchemy import insert, select
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from extensions import db, alembic
+    from models import User, UserType, Transaction, TransactionType
+    from transactions.vouchers import issue_vouchers
+
+    app = create_app()
+    with app.app_context():
+        alembic.upgrade()
+        password_hash = generate_password_hash(PASSWORD)
+        merchant = User(username='stress-merchant', email='merchant@stress.example.com', password_hash=password_hash,
+                        user_type=UserType.MERCHANT, business_name='Stress Cafe', points_balance=0)
+        db.session.add(merchant)
+        emails = [f'customer{i}@stress.example.com' for i in range(customers)]
+        db.session.execute(insert(User), [
+            {'username': f'stress-{i}', 'email': email, 'password_hash': password_hash,
+             'user_type': UserType.CUSTOMER, 'points_balance': START_BALANCE}
+            for i, email in enumerate(emails)
+        ])
+        db.session.flush()
+        # Zero-point airdrops give every customer a history without moving
+        # balances or touching the transfer and redemption counts checked later
+        db.session.execute(insert(Transaction), [
+            {'transaction_type': TransactionType.AIRDROP, 'sender_id': merchant.id,
+             'receiver_id': customer_id, 'points': 0, 'description': 'history'}
+            for customer_id in db.session.scalars(select(User.id).where(User.email.in_(emails)))
+            for _ in range(HISTORY)
+        ])
+        codes = issue_vouchers(merchant.id, vouchers, VOUCHER_POINTS, 'stress')
+        db.session.commit()
+        db.engine.dispose()
+    return emails, codes
+
+def succeeded(response):
+    # Both views redirect to the dashboard on success and re-render the form otherwise
+    return response.status_code == 302 and response.location.endswith('/dashboard/')
+
+def worker(index, emails, codes, operations, barrier, results):
+    """One process's requests; puts its tallies on the results queue"""
+    logging.disable(logging.CRITICAL)
+    from app import create_app
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Errors reach the worker as exceptions rather than 500 pages
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    client = app.test_client()
+    if client.post('/auth/login', data={'email': emails[index], 'password': PASSWORD}).status_code != 302:
+        raise RuntimeError(f'{emails[index]} could not log in')
+    others = [email for email in emails if email != emails[index]]
+    rng = random.Random(index)
+    tally = Counter()
+    latencies = {'write': [], 'read': []}
+
+    barrier.wait()
+    started = time.time()
+    for _ in range(operations):
+        roll = rng.random()
+        request_started = time.perf_counter()
+        try:
+            if roll < 0.4:
+                response = client.post('/transactions/transfer', data={
+                    'recipient_email': rng.choice(others), 'points': rng.randint(1, 5),
+                })
+                tally['transfers' if succeeded(response) else 'rejected'] += 1
+            elif roll < 0.7:
+                response = client.post('/transactions/redeem', data={'voucher_code': rng.choice(codes)})
+                tally['redemptions' if succeeded(response) else 'rejected'] += 1
+            else:
+                path = '/dashboard/stats' if roll < 0.85 else '/dashboard/transactions/export'
+                # Buffered, so streamed exports are read to the end and closed
+                response = client.get(path, buffered=True)
+                tally['reads' if response.status_code == 200 else 'errors'] += 1
+        except Exception as e:
+            tally['errors'] += 1
+            tally[f'error: {str(e).splitlines()[0][:80]}'] += 1
+        latencies['write' if roll < 0.7 else 'read'].append(time.perf_counter() - request_started)
+    results.put((started, time.time(), tally, latencies))
+
+def check_ledger(emails, tally):
+    """Failed consistency checks, as messages"""
+    from sqlalchemy import select, func
+    from app import create_app
+    from extensions import db
+    from models import User, Transaction, TransactionType, Voucher
+
+    failures = []
+    app = create_app()
+    with app.app_context():
+        def count(transaction_type):
+            return db.session.scalar(
+                select(func.count(Transaction.id)).where(Transaction.transaction_type == transaction_type)
+            )
+
+        for name, transaction_type in (('transfers', TransactionType.TRANSFER),
+                                       ('redemptions', TransactionType.REDEMPTION)):
+            if count(transaction_type) != tally[name]:
+                failures.append(f'{tally[name]} {name} succeeded but {count(transaction_type)} were recorded')
+
+        redeemed = db.session.scalar(select(func.count(Voucher.id)).where(Voucher.is_redeemed))
+        distinct = db.session.scalar(
+            select(func.count(func.distinct(Transaction.voucher_code)))
+            .where(Transaction.transaction_type == TransactionType.REDEMPTION)
+        )
+        if not redeemed == distinct == tally['redemptions']:
+            failures.append(f'{redeemed} vouchers redeemed, {distinct} codes credited, '
+                            f'{tally["redemptions"]} redemptions succeeded')
+
+        customer_types = (TransactionType.TRANSFER, TransactionType.REDEMPTION)
+        received = dict(db.session.execute(
+            select(Transaction.receiver_id, func.sum(Transaction.points))
+            .where(Transaction.transaction_type.in_(customer_types))
+            .group_by(Transaction.receiver_id)
+        ).all())
+        sent = dict(db.session.execute(
+            select(Transaction.sender_id, func.sum(Transaction.points))
+            .where(Transaction.transaction_type == TransactionType.TRANSFER)
+            .group_by(Transaction.sender_id)
+        ).all())
+        for user_id, balance in db.session.execute(
+            select(User.id, User.points_balance).where(User.email.in_(emails))
+        ):
+            expected = START_BALANCE + received.get(user_id, 0) - sent.get(user_id, 0)
+            if balance != expected:
+                failures.append(f'user {user_id} has {balance} points, the ledger says {expected}')
+        db.engine.dispose()
+    return failures
+
+def percentile(ordered, fraction):
+    """Milliseconds at a fraction of a sorted list of seconds"""
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000 if ordered else 0.0
+
+def run(profile, args):
+    os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/stress.db"
+    os.environ['SQLITE_PROFILE'] = '1' if profile else '0'
+    emails, codes = setup(args.processes, args.processes * args.operations // 4)
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.processes)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(i, emails, codes, args.operations, barrier, results))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    elapsed = max(end for _, end, _, _ in outcomes) - min(start for start, _, _, _ in outcomes)
+    tally = sum((counts for _, _, counts, _ in outcomes), Counter())
+    latencies = {kind: sorted(seconds for *_, times in outcomes for seconds in times[kind])
+                 for kind in ('write', 'read')}
+    failures = check_ledger(emails, tally)
+    writes = tally['transfers'] + tally['redemptions']
+    requests = writes + tally['rejected'] + tally['reads'] + tally['errors']
+    label = 'profile' if profile else 'defaults'
+    print(f'{label:>8}: {writes / elapsed:6.0f} writes/s  {requests / elapsed:6.0f} requests/s  '
+          f'transfers={tally["transfers"]} redemptions={tally["redemptions"]} rejected={tally["rejected"]} '
+          f'reads={tally["reads"]} errors={tally["errors"]}')
+    print(' ' * 10 + '  '.join(
+        f'{kind} p50 {percentile(times, 0.5):6.1f}ms p99 {percentile(times, 0.99):7.1f}ms'
+        for kind, times in latencies.items()
+    ))
+    for name, count in tally.items():
+        if name.startswith('error: '):
+            print(f'          {count:5d} x {name[7:]}')
+    for failure in failures:
+        print(f'          LOST UPDATE: {failure}')
+    return not failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=200, help='requests per process')
+    args = parser.parse_args()
+
+    print(f'{args.processes} processes x {args.operations} requests')
+    consistent = [run(profile, args) for profile in (False, True)]
+    if not all(consistent):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
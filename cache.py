@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache.
+
+    Shared by all requests in a worker process; hits and misses are counted
+    so the hit rate can be inspected. With a ttl (seconds), entries also
+    expire that long after they were set. With maxbytes, the values'
+    sizes, as measured by `weigh`, are bounded too; a value bigger than
+    that on its own isn't stored.
+    """
+    
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None, weigh=len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        size = self.weigh(value) if self.maxbytes is not None else 0
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = (value, expires, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                self.nbytes -= self._data.popitem(last=False)[1][2]
+    
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+    
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
+    
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+    
+    def __len__(self):
+        return len(self._data)
@@ -1,11 +1,80 @@
-from flask import render_template, request, jsonify
+import base64
+import hashlib
+import json
+import queue
+import threading
+import time
+from functools import wraps
+from flask import current_app, render_template, request, jsonify, url_for, abort, make_response, Response, stream_with_context
 from flask_login import login_required, current_user
-from sqlalchemy import select, func
+from sqlalchemy import select, func, or_, union_all, tuple_
+from sqlalchemy.orm import aliased, selectinload
 from datetime import datetime, timedelta, timezone
 from dashboard import dashboard_bp
 from app import db
-from models import User, Transaction, UserType, TransactionType, Voucher
+from extensions import notifier
+from async_mode import runs_on_event_loop, serving_on_event_loop
+from models import User, Transaction, UserType, TransactionType, Voucher, UserStats
+from stats import STAT_COLUMNS, get_user_version, customers_served
+from analytics import ANALYTICS_BUCKETS, merchant_activity
+from cache import LRUCache
 from transactions.forms import TransferPointsForm
+from .export import EXPORT_FORMATS, ledger_rows
+
+# Longest date range the analytics endpoint will bucket
+ANALYTICS_MAX_DAYS = 5 * 366
+
+# Rendered polling responses keyed by (user, version, day, endpoint, args),
+# bounded in bytes as well as entries since a history page can be 300 KB
+response_cache = LRUCache(maxsize=2048, maxbytes=64 * 1024 * 1024, weigh=lambda cached: len(cached[0]))
+
+def versioned_response(*cache_args):
+    """Serve a per-user view with a strong ETag and an in-process cache.
+
+    The ETag is derived from the user's data version, which every write
+    touching them bumps, plus today's date because the relative date
+    windows move. A matching If-None-Match gets a 304 before the view runs.
+
+    Only requests whose query arguments are all in `cache_args` are kept
+    in the cache, keyed by those; anything else, such as a non-default
+    page size, is rendered each time.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (
+                current_user.id,
+                get_user_version(current_user.id),
+                datetime.now(timezone.utc).date().isoformat(),
+                request.endpoint,
+                bool(request.headers.get('HX-Request')),
+                tuple((name, tuple(request.args.getlist(name))) for name in cache_args),
+            )
+            cacheable = request.args.keys() <= set(cache_args)
+            etag = hashlib.sha1(repr(
+                key if cacheable else (*key[:-1], tuple(sorted(request.args.items(multi=True))))
+            ).encode()).hexdigest()
+            
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                cached = response_cache.get(key) if cacheable else None
+                if cached is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    cached = (response.get_data(), response.mimetype)
+                    if cacheable:
+                        response_cache.set(key, cached)
+                response = make_response(cached[0])
+                response.mimetype = cached[1]
+            
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('HX-Request')
+            return response
+        return wrapper
+    return decorator
 
 @dashboard_bp.route('/')
 @login_required
@@ -21,27 +90,117 @@ def index():
 def profile():
     return render_template('dashboard/profile.html', user=current_user)
 
+VOUCHER_STATUSES = {'redeemed': True, 'active': False}
+
 @dashboard_bp.route('/voucher_history')
+@runs_on_event_loop
 @login_required
 def voucher_history():
+    """Vouchers the user issued or redeemed, newest first, a page at a time"""
+    status = request.args.get('status', '')
+    conditions = []
+    if status in VOUCHER_STATUSES:
+        conditions.append(Voucher.is_redeemed == VOUCHER_STATUSES[status])
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = tuple_(*_decode_cursor(cursor, 'created_at'))
+        conditions.append(tuple_(Voucher.created_at, Voucher.id) < after)
+    
+    # One UNION ALL branch per indexed column, as for transaction history
+    issued = select(Voucher).where(Voucher.merchant_id == current_user.id, *conditions)
+    redeemed = select(Voucher).where(
+        Voucher.redeemed_by == current_user.id, Voucher.merchant_id != current_user.id, *conditions
+    )
+    history = aliased(Voucher, union_all(issued, redeemed).subquery('voucher_history'))
     vouchers = db.session.scalars(
-        select(Voucher).where(
-            (Voucher.merchant_id == current_user.id) |
-            (Voucher.redeemed_by == current_user.id)
-        ).order_by(Voucher.created_at.desc())
+        select(history).order_by(history.created_at.desc(), history.id.desc()).limit(HISTORY_PAGE_SIZE + 1)
     ).all()
+    
+    next_url = None
+    if len(vouchers) > HISTORY_PAGE_SIZE:
+        vouchers = vouchers[:HISTORY_PAGE_SIZE]
+        last = vouchers[-1]
+        next_url = url_for('dashboard.voucher_history', status=status or None,
+                           cursor=_encode_cursor(last.created_at, last.id))
+    
+    # Issuers and redeemers for the whole page in one query
+    user_ids = {v.merchant_id for v in vouchers} | {v.redeemed_by for v in vouchers if v.redeemed_by}
+    usernames = dict(db.session.execute(
+        select(User.id, User.username).where(User.id.in_(user_ids))
+    ).all()) if user_ids else {}
+
+    return render_template('dashboard/voucher_history.html', vouchers=vouchers, usernames=usernames,
+                           status=status, next_url=next_url, is_first_page=not cursor,
+                           current_user=current_user)
+
+# Sort option -> (keyset column, descending)
+HISTORY_SORTS = {
+    'date_desc': ('created_at', True),
+    'date_asc': ('created_at', False),
+    'points_desc': ('points', True),
+    'points_asc': ('points', False),
+}
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# SSE keepalive interval and stream lifetime, in seconds
+EVENTS_KEEPALIVE = 15
+EVENTS_MAX_AGE = 300
 
-    # Fetch related user objects for display
-    for voucher in vouchers:
-        if voucher.merchant_id:
-            voucher.merchant = db.session.get(User, voucher.merchant_id)
-        if voucher.redeemed_by:
-            voucher.redeemed_by_user = db.session.get(User, voucher.redeemed_by)
+# Event streams holding a worker thread, capped at EVENTS_MAX_STREAMS
+_thread_streams = 0
+_thread_streams_lock = threading.Lock()
 
-    return render_template('dashboard/voucher_history.html', vouchers=vouchers, current_user=current_user)
+def _claim_thread_stream():
+    global _thread_streams
+    with _thread_streams_lock:
+        if _thread_streams >= current_app.config['EVENTS_MAX_STREAMS']:
+            return False
+        _thread_streams += 1
+        return True
+
+def _release_thread_stream():
+    global _thread_streams
+    with _thread_streams_lock:
+        _thread_streams -= 1
+
+def _encode_cursor(value, row_id):
+    """Opaque page cursor holding the last row's (sort value, id)"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor, column):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        if column == 'created_at':
+            value = datetime.fromisoformat(value)
+        return int(value) if column == 'points' else value, int(row_id)
+    except (ValueError, TypeError):
+        abort(400, description='Invalid cursor')
+
+def _history_for(user_id, conditions):
+    """Transactions where the user is sender or receiver, as an aliased entity.
+
+    Built as two UNION ALL branches, each filtering on a single column, so the
+    (sender_id, created_at) and (receiver_id, created_at) indexes can drive
+    both halves. An OR across the two columns falls back to a table scan.
+    """
+    sent = select(Transaction).where(Transaction.sender_id == user_id, *conditions)
+    received = select(Transaction).where(
+        Transaction.receiver_id == user_id,
+        or_(Transaction.sender_id.is_(None), Transaction.sender_id != user_id),
+        *conditions
+    )
+    return aliased(Transaction, union_all(sent, received).subquery('history'))
 
 @dashboard_bp.route('/transactions')
+@runs_on_event_loop
 @login_required
+@versioned_response('type', 'sender_receiver', 'date_range', 'sort', 'cursor')
 def get_transactions():
     """Get filtered and sorted transactions for the dashboard"""
     
@@ -51,15 +210,11 @@ def get_transactions():
     date_range = request.args.get('date_range', '')
     sort_by = request.args.get('sort', 'date_desc')
     
-    # Base query - get transactions where user is sender or receiver
-    query = select(Transaction).where(
-        (Transaction.sender_id == current_user.id) |
-        (Transaction.receiver_id == current_user.id)
-    )
+    conditions = []
     
     # Apply filters
     if transaction_type:
-        query = query.where(Transaction.transaction_type == TransactionType(transaction_type))
+        conditions.append(Transaction.transaction_type == TransactionType(transaction_type))
     
     # Date range filter
     if date_range:
@@ -74,25 +229,48 @@ def get_transactions():
             start_date = None
             
         if start_date:
-            query = query.where(Transaction.created_at >= start_date)
-    
-    # Apply sorting
-    if sort_by == 'date_desc':
-        query = query.order_by(Transaction.created_at.desc())
-    elif sort_by == 'date_asc':
-        query = query.order_by(Transaction.created_at.asc())
-    elif sort_by == 'points_desc':
-        query = query.order_by(Transaction.points.desc())
-    elif sort_by == 'points_asc':
-        query = query.order_by(Transaction.points.asc())
+            conditions.append(Transaction.created_at >= start_date)
+    
+    column, descending = HISTORY_SORTS.get(sort_by, HISTORY_SORTS['date_desc'])
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    
+    # Keyset pagination: continue strictly after the last (sort value, id) seen,
+    # so every page is an index range read no matter how deep it is
+    cursor = request.args.get('cursor')
+    if cursor:
+        key = tuple_(getattr(Transaction, column), Transaction.id)
+        after = tuple_(*_decode_cursor(cursor, column))
+        conditions.append(key < after if descending else key > after)
+    
+    history = _history_for(current_user.id, conditions)
+    order = [getattr(history, column), history.id]
+    # Senders and receivers are loaded with one IN query each rather than a
+    # lazy SELECT per row when the template or JSON touches them
+    query = select(history).options(
+        selectinload(history.sender), selectinload(history.receiver)
+    ).order_by(
+        *[c.desc() if descending else c.asc() for c in order]
+    ).limit(limit + 1)
     
     transactions = db.session.scalars(query).all()
     
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        next_cursor = _encode_cursor(getattr(last, column), last.id)
+    
     # If this is an HTMX request, return just the transaction rows
     if request.headers.get('HX-Request'):
+        next_url = None
+        if next_cursor:
+            args = {k: v for k, v in request.args.items() if k != 'cursor'}
+            next_url = url_for('dashboard.get_transactions', cursor=next_cursor, **args)
         return render_template('partials/transaction_row.html', 
                              transactions=transactions, 
-                             current_user=current_user)
+                             current_user=current_user,
+                             is_first_page=not cursor,
+                             next_url=next_url)
     
     # Otherwise return JSON
     transaction_data = []
@@ -110,74 +288,184 @@ def get_transactions():
             'created_at': t.created_at.strftime('%Y-%m-%d %H:%M:%S')
         })
     
-    return jsonify(transaction_data)
+    return jsonify({
+        'transactions': transaction_data,
+        'next_cursor': next_cursor
+    })
+
+def _parse_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400, description=f'Invalid {name} date')
+
+@dashboard_bp.route('/transactions/export')
+@login_required
+def export_transactions():
+    """Stream the user's full ledger as CSV or NDJSON.
+
+    ?format=csv|ndjson, optional ?start= and ?end= dates (inclusive,
+    YYYY-MM-DD) and any number of ?type= filters. Rows are read through a
+    server-side cursor and written as they arrive, so memory use doesn't
+    grow with the size of the ledger.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400, description='Unknown export format')
+    
+    conditions = []
+    start, end = _parse_date('start'), _parse_date('end')
+    if start:
+        conditions.append(Transaction.created_at >= start)
+    if end:
+        conditions.append(Transaction.created_at < end + timedelta(days=1))
+    types = [t for t in request.args.getlist('type') if t]
+    if types:
+        try:
+            conditions.append(Transaction.transaction_type.in_([TransactionType(t) for t in types]))
+        except ValueError:
+            abort(400, description='Unknown transaction type')
+    
+    serialize, mimetype = EXPORT_FORMATS[fmt]
+    filename = f"ledger-{current_user.id}-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    return Response(
+        stream_with_context(serialize(ledger_rows(current_user.id, conditions))),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @dashboard_bp.route('/stats')
+@runs_on_event_loop
 @login_required
+@versioned_response('exact')
 def get_stats():
-    """Get user statistics for dashboard"""
+    """Get user statistics for dashboard.
+
+    Merchants' customers_served is an estimate (see hll.py); ?exact=1
+    counts it from the transactions table instead.
+    """
+    return jsonify(_stats_for(current_user, exact=request.args.get('exact') == '1'))
+
+@dashboard_bp.route('/analytics')
+@runs_on_event_loop
+@login_required
+@versioned_response('start', 'end', 'bucket')
+def analytics():
+    """Merchant activity over ?start= to ?end= (inclusive, YYYY-MM-DD) by ?bucket=day|week|month.
+
+    Summed from the daily rollup tables, so the cost depends on the number
+    of days in the range rather than the number of transactions. Defaults
+    to the last 30 days by day.
+    """
+    if current_user.user_type != UserType.MERCHANT:
+        abort(403)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in ANALYTICS_BUCKETS:
+        abort(400, description='Unknown bucket')
     
-    if current_user.user_type == UserType.MERCHANT:
-        total_issued = db.session.scalar(
-            select(func.sum(Transaction.points)).where(
-                Transaction.sender_id == current_user.id,
-                Transaction.transaction_type != TransactionType.REDEMPTION
-            )
-        ) or 0
-        
-        active_vouchers = db.session.scalar(
-            select(func.count(Voucher.id)).where(
-                Voucher.merchant_id == current_user.id,
-                Voucher.is_redeemed == False
-            )
-        ) or 0
-        
-        customers_served = db.session.scalar(
-            select(func.count(func.distinct(Transaction.receiver_id))).where(
-                Transaction.sender_id == current_user.id
-            )
-        ) or 0
+    today = datetime.now(timezone.utc).date()
+    start, end = _parse_date('start'), _parse_date('end')
+    end = end.date() if end else today
+    start = start.date() if start else end - timedelta(days=29)
+    if start > end:
+        abort(400, description='start is after end')
+    if (end - start).days > ANALYTICS_MAX_DAYS:
+        abort(400, description='Date range too long')
+    return jsonify(merchant_activity(current_user.id, start, end, bucket))
 
-        thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
+def _stats_for(user, exact=False):
+    # Lifetime totals come from the incrementally maintained rollup row
+    stats = db.session.get(UserStats, user.id) or UserStats(
+        **{name: 0 for name in STAT_COLUMNS}
+    )
+    
+    # The sliding 30-day window can't be kept incrementally; it is an index
+    # range read on (sender_id, created_at) / (receiver_id, created_at)
+    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
+    
+    if user.user_type == UserType.MERCHANT:
         recent_transactions = db.session.scalar(
             select(func.count(Transaction.id)).where(
-                Transaction.sender_id == current_user.id,
+                Transaction.sender_id == user.id,
                 Transaction.created_at >= thirty_days_ago
             )
         ) or 0
         
-        return jsonify({
-            'total_issued': total_issued,
-            'active_vouchers': active_vouchers,
-            'customers_served': customers_served,
+        return {
+            'total_issued': stats.total_issued,
+            'active_vouchers': stats.active_vouchers,
+            'customers_served': customers_served(user.id, exact=exact),
             'recent_transactions': recent_transactions
-        })
+        }
 
     else: # Customer stats
-        total_earned = db.session.scalar(
-            select(func.sum(Transaction.points)).where(
-                Transaction.receiver_id == current_user.id
-            )
-        ) or 0
-        
-        total_spent = db.session.scalar(
-            select(func.sum(Transaction.points)).where(
-                Transaction.sender_id == current_user.id
-            )
-        ) or 0
-        
-        thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
+        history = _history_for(user.id, [Transaction.created_at >= thirty_days_ago])
         recent_transactions = db.session.scalar(
-            select(func.count(Transaction.id)).where(
-                ((Transaction.sender_id == current_user.id) |
-                 (Transaction.receiver_id == current_user.id)) &
-                (Transaction.created_at >= thirty_days_ago)
-            )
+            select(func.count(history.id))
         ) or 0
         
-        return jsonify({
-            'points_balance': current_user.points_balance,
-            'total_earned': total_earned,
-            'total_spent': total_spent,
+        return {
+            # Read fresh: `user` may be a cached snapshot
+            'points_balance': db.session.scalar(select(User.points_balance).where(User.id == user.id)),
+            'total_earned': stats.total_earned,
+            'total_spent': stats.total_spent,
             'recent_transactions': recent_transactions
-        })
+        }
+
+@dashboard_bp.route('/events')
+@runs_on_event_loop
+@login_required
+def events():
+    """Server-Sent Events stream of stats updates for the current user.
+
+    Sends the current stats on connect and again whenever a write touches
+    the user. The stream ends after EVENTS_MAX_AGE seconds and EventSource
+    reconnects, so no worker thread is held indefinitely; served from
+    asgi.py, an idle stream holds no thread at all.
+
+    Otherwise each stream holds a thread for its lifetime, so only
+    EVENTS_MAX_STREAMS run per worker. Beyond that the answer is a 204,
+    which tells EventSource not to reconnect, and the dashboard polls
+    /dashboard/stats instead.
+    """
+    user_id = current_user.id
+    holds_thread = not serving_on_event_loop()
+    if holds_thread and not _claim_thread_stream():
+        return '', 204
+    
+    @stream_with_context
+    def generate():
+        # Subscribed here, so a response that is never iterated leaves
+        # nothing behind and one that is always reaches the finally
+        updates = notifier.subscribe(user_id)
+        try:
+            yield 'retry: 5000\n\n'
+            yield _stats_event(user_id)
+            deadline = time.monotonic() + EVENTS_MAX_AGE
+            while time.monotonic() < deadline:
+                try:
+                    updates.get(timeout=EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _stats_event(user_id)
+        finally:
+            notifier.unsubscribe(user_id, updates)
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    if holds_thread:
+        # Runs when the server closes the response, even one never iterated
+        response.call_on_close(_release_thread_stream)
+    return response
+
+def _stats_event(user_id):
+    user = db.session.get(User, user_id)
+    payload = json.dumps(_stats_for(user))
+    # Give the connection back to the pool while the stream sits idle
+    db.session.close()
+    return f'event: stats\ndata: {payload}\n\n'
@@ -0,0 +1,138 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from async_mode import wakeup_queue
+
+class Notifier:
+    """Cross-process "user data changed" notifications.
+
+    Publishers append user ids to a small SQLite file shared by every worker
+    on the host. Each worker runs one listener thread that tails the file and
+    hands new ids to that worker's in-process subscribers, so fan-out works
+    across gunicorn workers without an external broker.
+    """
+
+    def __init__(self, poll_interval=0.5, retention=300):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.path = None
+        self._subscribers = defaultdict(set)
+        self._callbacks = set()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._local = threading.local()
+
+    def init_app(self, app):
+        os.makedirs(app.instance_path, exist_ok=True)
+        self.path = app.config.setdefault(
+            'EVENTS_DB_PATH', os.path.join(app.instance_path, 'events.db')
+        )
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'user_id INTEGER NOT NULL, '
+                'created_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _publisher(self):
+        """This thread's connection for publishing, opened on first use.
+
+        Kept open so a publish is one INSERT rather than a connect and a
+        journal sync each time; a forked worker opens its own.
+        """
+        key = (os.getpid(), self.path)
+        if getattr(self._local, 'key', None) != key:
+            conn = self._connect()
+            # Events are only wake-ups, so losing the last few to a power
+            # cut costs nothing; in WAL this syncs at checkpoints only
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.key = conn, key
+        return self._local.conn
+
+    def publish(self, user_ids):
+        """Record that data for the given users changed"""
+        # This worker's callbacks hear about it straight away; other
+        # workers' pick it up from the file
+        self._run_callbacks(user_ids)
+        now = time.time()
+        with self._publisher() as conn:
+            conn.executemany(
+                'INSERT INTO events (user_id, created_at) VALUES (?, ?)',
+                [(user_id, now) for user_id in user_ids]
+            )
+
+    def subscribe(self, user_id):
+        """Queue that receives a token whenever the user's data changes.
+
+        Served on the ASGI event loop, its get() waits on the loop rather
+        than blocking the thread.
+        """
+        self._ensure_listener()
+        q = wakeup_queue()
+        with self._lock:
+            self._subscribers[user_id].add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            self._subscribers[user_id].discard(q)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def add_callback(self, callback):
+        """Call callback(user_ids) whenever any worker publishes a change.
+
+        Safe to call repeatedly; it also restarts the listener thread in a
+        freshly forked worker.
+        """
+        self._ensure_listener()
+        with self._lock:
+            self._callbacks.add(callback)
+
+    def _run_callbacks(self, user_ids):
+        for callback in list(self._callbacks):
+            callback(user_ids)
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        conn = self._connect()
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        last_prune = time.time()
+        while True:
+            rows = conn.execute(
+                'SELECT id, user_id FROM events WHERE id > ? ORDER BY id', (last_id,)
+            ).fetchall()
+            if rows:
+                last_id = rows[-1][0]
+                self._dispatch({user_id for _, user_id in rows})
+
+            if time.time() - last_prune > self.retention:
+                last_prune = time.time()
+                with conn:
+                    conn.execute('DELETE FROM events WHERE created_at < ?', (last_prune - self.retention,))
+
+            time.sleep(self.poll_interval)
+
+    def _dispatch(self, user_ids):
+        self._run_callbacks(user_ids)
+        with self._lock:
+            queues = [q for user_id in user_ids for q in self._subscribers.get(user_id, ())]
+        for q in queues:
+            try:
+                q.put_nowait(True)
+            except queue.Full:
+                # A pending wake-up already covers this change
+                pass
@@ -1,11 +1,44 @@
 from flask_sqlalchemy_lite import SQLAlchemy
 from flask_alembic import Alembic
 from flask_login import LoginManager
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import DeclarativeBase
+from events import Notifier
+from batching import GroupCommitter, StatsFolder
+from instrumentation import RequestTiming
+from metrics import Metrics
+from sqlite_profile import SQLiteProfile
 
 class Model(DeclarativeBase):
     pass
 
 db = SQLAlchemy()
 alembic = Alembic(metadatas=Model.metadata)
-login_manager = LoginManager()
\ No newline at end of file
+login_manager = LoginManager()
+notifier = Notifier()
+write_queue = GroupCommitter()
+stats_folder = StatsFolder()
+request_timing = RequestTiming()
+metrics = Metrics()
+sqlite_profile = SQLiteProfile()
+
+def dialect_insert():
+    """insert() for the session's dialect, which supports ON CONFLICT upserts"""
+    dialect = db.session.get_bind().dialect.name
+    return postgresql.insert if dialect == 'postgresql' else sqlite.insert
+
+def begin_write():
+    """Start db.session's next transaction as a write transaction.
+
+    On SQLite with the engine profile on, that's BEGIN IMMEDIATE, which
+    waits for the write lock before anything is read, so nothing can commit
+    between the checks a write depends on and the write. Otherwise SQLite
+    only begins a transaction at the first write, leaving earlier reads
+    outside it. Elsewhere it's an ordinary transaction. Call it before those
+    checks; a transaction the session already has open, such as the user
+    loader's, is committed first.
+    """
+    session = db.session
+    if session.in_transaction():
+        session.commit()
+    session.connection(execution_options={'sqlite_immediate': True})
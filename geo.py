@@ -0,0 +1,122 @@
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Stored cells are ~5m across; queries use prefixes of them
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash of a point; longer hashes are cells nested inside shorter ones"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    value = bits = 0
+    even = True
+    while len(chars) < precision:
+        coord, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            bounds[0] = mid
+        else:
+            value = value * 2
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            value = bits = 0
+    return ''.join(chars)
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given length"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+def wrap_longitude(lon):
+    return lon if -180.0 <= lon <= 180.0 else (lon + 180.0) % 360.0 - 180.0
+
+def split_bbox(west, south, east, north):
+    """Normalize a map viewport into boxes within [-180, 180].
+
+    Web maps report longitudes past the antimeridian once the world wraps,
+    so a viewport across it becomes two boxes.
+    """
+    south, north = max(south, -90.0), min(north, 90.0)
+    if east - west >= 360.0:
+        return [(-180.0, south, 180.0, north)]
+    west, east = wrap_longitude(west), wrap_longitude(east)
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+def _cell_indexes(low, high, origin, size, count):
+    first = max(int((low - origin) // size), 0)
+    last = min(int((high - origin) // size), count - 1)
+    return range(first, last + 1)
+
+def covering_cells(boxes, max_cells=16):
+    """Geohash prefixes covering the boxes, at the finest length needing at most max_cells.
+
+    Returns None when even single-character cells would need more, in
+    which case filtering by cell doesn't narrow anything down.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows, cols = round(180 / height), round(360 / width)
+        grids = [
+            (_cell_indexes(south, north, -90.0, height, rows), _cell_indexes(west, east, -180.0, width, cols))
+            for west, south, east, north in boxes
+        ]
+        if sum(len(lats) * len(lons) for lats, lons in grids) <= max_cells:
+            return {
+                geohash_encode(-90.0 + (i + 0.5) * height, -180.0 + (j + 0.5) * width, precision)
+                for lats, lons in grids for i in lats for j in lons
+            }
+    return None
+
+def neighbour_cells(lat, lon, precision):
+    """The cell containing a point and the eight around it"""
+    height, width = cell_size(precision)
+    return {
+        geohash_encode(min(max(lat + dy * height, -90.0), 90.0), wrap_longitude(lon + dx * width), precision)
+        for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+    }
+
+def neighbourhood_radius_km(lat, precision):
+    """Distance from a point within which neighbour_cells() is sure to hold every other point"""
+    height, width = cell_size(precision)
+    widest_lat = min(abs(lat) + height, 90.0)
+    return min(height, width * math.cos(math.radians(widest_lat))) * KM_PER_DEGREE
+
+def _next_prefix(prefix):
+    """The smallest prefix sorting after every geohash starting with this one, or None"""
+    prefix = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(prefix[-1]) + 1]
+
+def cell_ranges(cells):
+    """[low, high) string ranges matching every geohash inside the cells.
+
+    Prefix matches as ranges use a plain B-tree index on any database, and
+    cells that are adjacent in geohash order merge into one range. A high
+    of None means no upper bound.
+    """
+    ranges = []
+    for cell in sorted(cells):
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = _next_prefix(cell)
+        else:
+            ranges.append([cell, _next_prefix(cell)])
+    return [tuple(r) for r in ranges]
+
+def cluster_precision(zoom):
+    """Geohash length whose cells are roughly 64px wide at a web map zoom level"""
+    return min(max(round(2 * (zoom + 2) / 5), 1), GEOHASH_PRECISION)
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,25 @@
+"""gunicorn settings; gunicorn loads this file from the working directory.
+
+Each worker is its own process, so for /metrics to report the whole server
+rather than whichever worker answered, prometheus_client runs in
+multiprocess mode: workers write samples to files in
+PROMETHEUS_MULTIPROC_DIR and /metrics adds them up. The variable has to be
+set before prometheus_client is first imported, hence here.
+"""
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'loyalty-metrics'))
+
+from prometheus_client import multiprocess
+
+def on_starting(server):
+    # Samples left by a previous run would otherwise be added in
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+def child_exit(server, worker):
+    # Drops the exited worker's live gauges; its counters stay in the totals
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,47 @@
+import hashlib
+import math
+
+# 2**12 registers: a standard error of 1.04 / sqrt(4096), about 1.6%, so
+# roughly 95% of estimates land within 3.3% of the true count. Small counts
+# use linear counting and are close to exact.
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+_RANK_BITS = 64 - HLL_PRECISION
+
+def _hash64(value):
+    # Python's hash() of an int is the int itself, so use a real hash that
+    # is also stable across processes
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def hll_register(value):
+    """(register index, rank) a value sets in a sketch"""
+    h = _hash64(value)
+    index = h >> _RANK_BITS
+    rest = h & ((1 << _RANK_BITS) - 1)
+    return index, _RANK_BITS - rest.bit_length() + 1
+
+def hll_registers(values):
+    """Highest rank per register for a batch of values"""
+    registers = {}
+    for value in values:
+        index, rank = hll_register(value)
+        if rank > registers.get(index, 0):
+            registers[index] = rank
+    return registers
+
+def hll_estimate(rank_counts):
+    """Distinct values seen, from {rank: number of registers holding it}.
+
+    Registers that were never set don't appear; they count as rank 0.
+    """
+    m = HLL_REGISTERS
+    zeros = m - sum(rank_counts.values())
+    if zeros == m:
+        return 0
+    harmonic = zeros + sum(count * 2.0 ** -rank for rank, count in rank_counts.items())
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / harmonic
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return round(estimate)
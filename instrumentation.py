@@ -0,0 +1,117 @@
+import heapq
+import logging
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Statements kept per request for the slow-request log
+SLOW_LOG_STATEMENTS = 5
+
+class RequestTiming:
+    """Per-request timings, sent back as a Server-Timing header.
+
+    Counts SQL statements and adds up the time spent in the database,
+    rendering templates and anything wrapped in timed(), e.g. QR code
+    rendering. With SLOW_REQUEST_MS set, requests slower than that are
+    logged along with their slowest statements. Statements run outside a
+    request, such as by the group committer's thread, aren't attributed.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.slow_request_ms = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SERVER_TIMING', True)
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', 0)
+        if not self.enabled:
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        # Engine-wide, and only once however many apps are created
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            before_render_template.connect(_before_render)
+            template_rendered.connect(_after_render)
+
+    def _start(self):
+        g.timing = {
+            'started': time.perf_counter(),
+            'durations': {},
+            'statements': 0,
+            'slowest': [],
+            'render_started': None,
+        }
+
+    def _finish(self, response):
+        timing = g.pop('timing', None)
+        if timing is None:
+            return response
+        total = (time.perf_counter() - timing['started']) * 1000
+        durations = timing['durations']
+        metrics = [f'db;dur={durations.get("db", 0):.1f};desc="{timing["statements"]} queries"']
+        metrics += [f'{name};dur={ms:.1f}' for name, ms in durations.items() if name != 'db']
+        metrics.append(f'total;dur={total:.1f}')
+        response.headers['Server-Timing'] = ', '.join(metrics)
+
+        if self.slow_request_ms and total >= self.slow_request_ms:
+            logger.warning(
+                'Slow request %s %s: %.0fms, %d queries in %.0fms%s',
+                request.method, request.full_path.rstrip('?'), total, timing['statements'],
+                durations.get('db', 0),
+                ''.join(f'\n  {ms:8.1f}ms  {" ".join(statement.split())[:300]}'
+                        for ms, _, statement in sorted(timing['slowest'], reverse=True)),
+            )
+        return response
+
+def _timing():
+    return g.get('timing') if has_request_context() else None
+
+def _add(timing, name, ms):
+    timing['durations'][name] = timing['durations'].get(name, 0) + ms
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to this request's `name` timing"""
+    timing = _timing()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            _add(timing, name, (time.perf_counter() - started) * 1000)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._timing_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _timing()
+    started = getattr(context, '_timing_started', None)
+    if timing is None or started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+    timing['statements'] += 1
+    _add(timing, 'db', ms)
+    # Bounded min-heap of the slowest statements; the count breaks ties
+    entry = (ms, timing['statements'], statement)
+    if len(timing['slowest']) < SLOW_LOG_STATEMENTS:
+        heapq.heappush(timing['slowest'], entry)
+    else:
+        heapq.heappushpop(timing['slowest'], entry)
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        timing['render_started'] = time.perf_counter()
+
+def _after_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing['render_started'] is not None:
+        _add(timing, 'tpl', (time.perf_counter() - timing['render_started']) * 1000)
+        timing['render_started'] = None
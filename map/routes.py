@@ -1,29 +1,151 @@
-from flask import render_template, jsonify, request
-from sqlalchemy import select
+import math
+from flask import render_template, jsonify, request, abort
+from sqlalchemy import select, func, and_, or_
 from app import db
+from async_mode import runs_on_event_loop
 from models import User, UserType
+from geo import (
+    split_bbox, covering_cells, cell_ranges, neighbour_cells, neighbourhood_radius_km,
+    cluster_precision, haversine_km
+)
+from .search import search_merchants, merchant_search_condition, SEARCH_LIMIT, SEARCH_MAX_LIMIT
 from . import map_bp
 
+NEAREST_DEFAULT = 10
+NEAREST_MAX = 100
+# First neighbourhood searched for nearest-k, ~1.2km cells; widened until k are found
+NEAREST_START_PRECISION = 6
+# Viewports at or below this zoom come back as clusters
+CLUSTER_MAX_ZOOM = 13
+
 @map_bp.route('/')
 def show_map():
     return render_template('map/map.html')
 
+def _float_args(name, count):
+    """Comma-separated floats from a query arg, or None when it's absent"""
+    raw = request.args.get(name)
+    if raw is None:
+        return None
+    try:
+        values = [float(value) for value in raw.split(',')]
+    except ValueError:
+        abort(400)
+    if len(values) != count or not all(math.isfinite(value) for value in values):
+        abort(400)
+    return values
+
+def _in_cells(cells):
+    """Condition matching users whose geohash lies in any of the cells"""
+    return or_(*(
+        and_(User.geohash >= low, User.geohash < high) if high else User.geohash >= low
+        for low, high in cell_ranges(cells)
+    ))
+
+def _merchant_data(merchant, distance=None):
+    data = {
+        'id': merchant.id,
+        'business_name': merchant.business_name,
+        'address': merchant.address,
+        'latitude': merchant.latitude,
+        'longitude': merchant.longitude,
+    }
+    if distance is not None:
+        data['distance_km'] = round(distance, 3)
+    return data
+
+def _merchants_in_viewport(bbox, zoom, conditions):
+    """Merchants inside a viewport, clustered by geohash cell when zoomed out"""
+    boxes = split_bbox(*bbox)
+    conditions = conditions + [
+        User.geohash.is_not(None),
+        or_(*(
+            and_(User.latitude.between(south, north), User.longitude.between(west, east))
+            for west, south, east, north in boxes
+        )),
+    ]
+    cells = covering_cells(boxes)
+    if cells is not None:
+        conditions.append(_in_cells(cells))
+
+    if zoom is None or zoom > CLUSTER_MAX_ZOOM:
+        merchants = db.session.scalars(select(User).where(*conditions)).all()
+        return jsonify({'merchants': [_merchant_data(m) for m in merchants], 'clusters': []})
+
+    cell = func.substr(User.geohash, 1, cluster_precision(zoom))
+    groups = db.session.execute(
+        select(
+            func.count(User.id).label('count'),
+            func.avg(User.latitude).label('latitude'),
+            func.avg(User.longitude).label('longitude'),
+            func.min(User.id).label('merchant_id'),
+        ).where(*conditions).group_by(cell)
+    ).all()
+
+    # A cell holding a single merchant is shown as that merchant
+    single_ids = [group.merchant_id for group in groups if group.count == 1]
+    merchants = db.session.scalars(select(User).where(User.id.in_(single_ids))).all() if single_ids else []
+    clusters = [
+        {'latitude': group.latitude, 'longitude': group.longitude, 'count': group.count}
+        for group in groups if group.count > 1
+    ]
+    return jsonify({'merchants': [_merchant_data(m) for m in merchants], 'clusters': clusters})
+
+def _nearest_merchants(lat, lon, k, conditions):
+    """The k merchants closest to a point, searching outwards cell by cell"""
+    conditions = conditions + [User.geohash.is_not(None)]
+    for precision in range(NEAREST_START_PRECISION, 0, -1):
+        candidates = db.session.scalars(
+            select(User).where(*conditions, _in_cells(neighbour_cells(lat, lon, precision)))
+        ).all()
+        ranked = sorted(
+            ((haversine_km(lat, lon, m.latitude, m.longitude), m) for m in candidates),
+            key=lambda pair: pair[0]
+        )
+        # Anything outside the 3x3 block is further than its inner radius
+        if len(ranked) >= k and ranked[k - 1][0] <= neighbourhood_radius_km(lat, precision):
+            break
+    else:
+        ranked = sorted(
+            ((haversine_km(lat, lon, m.latitude, m.longitude), m)
+             for m in db.session.scalars(select(User).where(*conditions))),
+            key=lambda pair: pair[0]
+        )
+    return jsonify([_merchant_data(m, distance) for distance, m in ranked[:k]])
+
 @map_bp.route('/merchants')
+@runs_on_event_loop
 def get_merchants():
-    location_filter = request.args.get('location', '')
+    """Merchants for the map.
+
+    ?bbox=west,south,east,north returns those in a viewport, clustered when
+    &zoom= is low; ?near=lat,lon&k= returns the k nearest with distances.
+    Without either, every merchant is listed. ?location= searches names
+    and addresses: in the map modes it filters, otherwise it returns up to
+    &limit= ranked matches, typo-tolerant.
+    """
+    location_filter = request.args.get('location', '').strip()
 
-    query = select(User).where(User.user_type == UserType.MERCHANT)
+    conditions = [User.user_type == UserType.MERCHANT]
 
     if location_filter:
-        query = query.where(User.address.ilike(f'%{location_filter}%'))
-
-    merchants = db.session.scalars(query).all()
-    
-    merchant_data = []
-    for merchant in merchants:
-        merchant_data.append({
-            'business_name': merchant.business_name,
-            'address': merchant.address
-        })
-    
-    return jsonify(merchant_data)
+        conditions.append(merchant_search_condition(location_filter))
+
+    near = _float_args('near', 2)
+    if near:
+        if not (-90 <= near[0] <= 90 and -180 <= near[1] <= 180):
+            abort(400)
+        k = min(max(request.args.get('k', NEAREST_DEFAULT, type=int), 1), NEAREST_MAX)
+        return _nearest_merchants(near[0], near[1], k, conditions)
+
+    bbox = _float_args('bbox', 4)
+    if bbox:
+        return _merchants_in_viewport(bbox, request.args.get('zoom', type=int), conditions)
+
+    if location_filter:
+        limit = min(max(request.args.get('limit', SEARCH_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+        merchants = search_merchants(location_filter, limit)
+    else:
+        merchants = db.session.scalars(select(User).where(*conditions)).all()
+
+    return jsonify([_merchant_data(merchant) for merchant in merchants])
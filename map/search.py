@@ -0,0 +1,132 @@
+from sqlalchemy import select, func, and_, or_, case, literal, literal_column, table, column
+from app import db
+from models import User, UserType
+
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Share of a term's trigrams a fuzzy match has to contain; pg_trgm's
+# word_similarity_threshold is set to the same on Postgres
+FUZZY_THRESHOLD = 0.4
+# Fuzzy candidates fetched per result wanted, before re-ranking
+FUZZY_CANDIDATES = 10
+
+# SQLite: FTS5 table kept in sync by triggers, rowid = users.id
+merchant_search = table(
+    'merchant_search',
+    column('rowid'), column('business_name'), column('address'), column('merchant_search'),
+)
+# Postgres: the expression covered by the pg_trgm index, spelled exactly as
+# in migrations/1759968000_merchant_search.py so the planner matches it
+_pg_document = literal_column("(coalesce(users.business_name, '') || ' ' || coalesce(users.address, ''))")
+
+def _terms(query):
+    return query.lower().split()[:8]
+
+def _like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _word_trigrams(text):
+    """Trigrams of each word padded the way pg_trgm does, so word starts count"""
+    return set().union(*(_trigrams(f'  {word} ') for word in text.lower().split()))
+
+def _is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def _fts_conditions(terms):
+    """Every term as a substring of business_name or address.
+
+    The trigram tokenizer answers terms of three or more characters from
+    the index; shorter ones fall back to LIKE over the (merchant-only) table.
+    """
+    long_terms = [term for term in terms if len(term) >= 3]
+    conditions = []
+    if long_terms:
+        conditions.append(merchant_search.c.merchant_search.match(' '.join(map(_fts_phrase, long_terms))))
+    for term in terms:
+        if len(term) < 3:
+            pattern = _like_pattern(term)
+            conditions.append(or_(
+                merchant_search.c.business_name.like(pattern, escape='\\'),
+                merchant_search.c.address.like(pattern, escape='\\'),
+            ))
+    return conditions
+
+def _pg_exact(terms):
+    return and_(*(_pg_document.ilike(_like_pattern(term)) for term in terms))
+
+def merchant_search_condition(query):
+    """Condition on User matching merchants whose name or address contains every term"""
+    terms = _terms(query)
+    if not terms:
+        return User.user_type == UserType.MERCHANT
+    if _is_postgres():
+        return and_(User.user_type == UserType.MERCHANT, _pg_exact(terms))
+    return User.id.in_(select(merchant_search.c.rowid).where(*_fts_conditions(terms)))
+
+def _fuzzy_score(terms, text):
+    """Average share of each term's trigrams found in the text, like pg_trgm word similarity"""
+    grams = _word_trigrams(text)
+    return sum(len(_word_trigrams(term) & grams) / len(_word_trigrams(term)) for term in terms) / len(terms)
+
+def _search_sqlite(terms, limit):
+    bm25 = func.bm25(literal_column('merchant_search'), 2.0, 1.0)
+    ids = db.session.scalars(
+        select(merchant_search.c.rowid).where(*_fts_conditions(terms)).order_by(bm25).limit(limit)
+    ).all()
+
+    # Too few substring matches: look for names sharing most of the trigrams,
+    # which tolerates typos, and rank them after the exact hits
+    long_terms = [term for term in terms if len(term) >= 3]
+    if len(ids) < limit and long_terms:
+        grams = set().union(*map(_trigrams, long_terms))
+        candidates = db.session.execute(
+            select(merchant_search.c.rowid, merchant_search.c.business_name, merchant_search.c.address)
+            .where(merchant_search.c.merchant_search.match(' OR '.join(map(_fts_phrase, sorted(grams)))))
+            .order_by(bm25)
+            .limit(limit * FUZZY_CANDIDATES)
+        ).all()
+        seen = set(ids)
+        scored = sorted(
+            (
+                (_fuzzy_score(long_terms, f'{name or ""} {address or ""}'), rowid)
+                for rowid, name, address in candidates if rowid not in seen
+            ),
+            key=lambda pair: -pair[0]
+        )
+        ids = list(ids) + [rowid for score, rowid in scored if score >= FUZZY_THRESHOLD][:limit - len(ids)]
+
+    merchants = {m.id: m for m in db.session.scalars(select(User).where(User.id.in_(ids)))} if ids else {}
+    return [merchants[merchant_id] for merchant_id in ids if merchant_id in merchants]
+
+def _search_postgres(terms, limit):
+    query = ' '.join(terms)
+    exact = _pg_exact(terms)
+    db.session.execute(
+        select(func.set_config('pg_trgm.word_similarity_threshold', str(FUZZY_THRESHOLD), True))
+    )
+    return db.session.scalars(
+        select(User)
+        .where(User.user_type == UserType.MERCHANT, or_(exact, literal(query).op('<%')(_pg_document)))
+        .order_by(case((exact, 0), else_=1), func.word_similarity(query, _pg_document).desc(), User.id)
+        .limit(limit)
+    ).all()
+
+def search_merchants(query, limit=SEARCH_LIMIT):
+    """Merchants matching a search, best first.
+
+    Names or addresses containing every term come first, ranked by
+    relevance with business names weighted above addresses; close
+    misspellings follow.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    if _is_postgres():
+        return _search_postgres(terms, limit)
+    return _search_sqlite(terms, limit)
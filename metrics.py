@@ -0,0 +1,105 @@
+import os
+import time
+from collections import Counter as Tally
+from flask import g, request, Response
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+)
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Under gunicorn every worker writes its samples to memory-mapped files in
+# PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py) and /metrics adds them
+# up; without it the metrics live in this process only.
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by endpoint',
+    ['blueprint', 'endpoint', 'method', 'status'],
+)
+TRANSACTIONS_WRITTEN = Counter('transactions_written', 'Committed ledger rows, by transaction type', ['type'])
+QR_SCANS = Counter('qr_scans', 'QR code scans, by outcome', ['outcome'])
+POOL_CHECKOUT = Histogram(
+    'db_pool_checkout_seconds', 'Time spent waiting for a pooled database connection', ['engine'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+POOL_TIMEOUTS = Counter('db_pool_checkout_timeouts', 'Checkouts that gave up waiting for a connection', ['engine'])
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open beyond pool_size', ['engine'], multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections currently in use', ['engine'], multiprocess_mode='livesum')
+
+class Metrics:
+    """Prometheus metrics at /metrics, plus request latency recording"""
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._observe)
+        app.add_url_rule('/metrics', 'metrics', self._export)
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+
+    def _observe(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            REQUEST_LATENCY.labels(
+                request.blueprint or 'app', request.endpoint or 'unmatched', request.method, response.status_code
+            ).observe(time.perf_counter() - started)
+        return response
+
+    def _export(self):
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+class _TimedPool:
+    """Records checkout waits, timeouts and connections in use"""
+
+    metrics_engine = 'sync'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.labels(self.metrics_engine).inc()
+            raise
+        POOL_CHECKOUT.labels(self.metrics_engine).observe(time.perf_counter() - started)
+        self._record_usage()
+        return connection
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._record_usage()
+
+    def _record_usage(self):
+        # overflow() counts up from -pool_size until the pool is full
+        POOL_OVERFLOW.labels(self.metrics_engine).set(max(self.overflow(), 0))
+        POOL_CHECKED_OUT.labels(self.metrics_engine).set(self.checkedout())
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    # Log as the pool it replaces, so the usual sqlalchemy logging levels apply
+    _sqla_logger_namespace = 'sqlalchemy.pool.impl.QueuePool'
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    """TimedQueuePool for the async engine"""
+    metrics_engine = 'async'
+    _sqla_logger_namespace = 'sqlalchemy.pool.impl.AsyncAdaptedQueuePool'
+
+def count_transactions(session, transaction_type, count=1):
+    """Count ledger rows written in this session; reported once it commits"""
+    session.info.setdefault('written_transactions', Tally())[transaction_type.name] += count
+
+@event.listens_for(Session, 'after_commit')
+def _report_written_transactions(session):
+    written = session.info.pop('written_transactions', None)
+    if written:
+        for transaction_type, count in written.items():
+            TRANSACTIONS_WRITTEN.labels(transaction_type).inc(count)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_written_transactions(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('written_transactions', None)
@@ -0,0 +1,30 @@
+"""transaction history indexes
+
+Revision ID: 1757712000
+Revises: 1757283916
+Create Date: 2025-09-12 21:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1757712000'
+down_revision: Union[str, Sequence[str], None] = '1757283916'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_transactions_sender_id_created_at', 'transactions', ['sender_id', 'created_at'], unique=False)
+    op.create_index('ix_transactions_receiver_id_created_at', 'transactions', ['receiver_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_receiver_id_created_at', table_name='transactions')
+    op.drop_index('ix_transactions_sender_id_created_at', table_name='transactions')
@@ -0,0 +1,49 @@
+"""user stats rollup
+
+Revision ID: 1758240000
+Revises: 1757712000
+Create Date: 2025-09-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1758240000'
+down_revision: Union[str, Sequence[str], None] = '1757712000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_issued', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('total_earned', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('total_spent', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('customers_served', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('active_vouchers', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Backfill from existing history; `flask rebuild-stats` does the same later
+    op.execute("""
+        INSERT INTO user_stats (user_id, total_issued, total_earned, total_spent, customers_served, active_vouchers)
+        SELECT u.id,
+            COALESCE((SELECT SUM(t.points) FROM transactions t
+                      WHERE t.sender_id = u.id AND t.transaction_type != 'REDEMPTION'), 0),
+            COALESCE((SELECT SUM(t.points) FROM transactions t WHERE t.receiver_id = u.id), 0),
+            COALESCE((SELECT SUM(t.points) FROM transactions t WHERE t.sender_id = u.id), 0),
+            (SELECT COUNT(DISTINCT t.receiver_id) FROM transactions t WHERE t.sender_id = u.id),
+            (SELECT COUNT(v.id) FROM vouchers v WHERE v.merchant_id = u.id AND v.is_redeemed = false)
+        FROM users u
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
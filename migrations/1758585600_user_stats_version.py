@@ -0,0 +1,30 @@
+"""user stats version
+
+Revision ID: 1758585600
+Revises: 1758240000
+Create Date: 2025-09-23 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1758585600'
+down_revision: Union[str, Sequence[str], None] = '1758240000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('user_stats') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('user_stats') as batch_op:
+        batch_op.drop_column('version')
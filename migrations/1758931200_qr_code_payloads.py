@@ -0,0 +1,104 @@
+"""store signed qr payloads instead of png data uris
+
+Revision ID: 1758931200
+Revises: 1758585600
+Create Date: 2025-09-27 00:00:00.000000
+
+"""
+import base64
+import io
+import os
+from datetime import timezone
+from typing import Sequence, Union
+
+from alembic import op
+import qrcode
+import sqlalchemy as sa
+from itsdangerous import URLSafeTimedSerializer, TimestampSigner
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1758931200'
+down_revision: Union[str, Sequence[str], None] = '1758585600'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+transactions = sa.table(
+    'transactions',
+    sa.column('id', sa.Integer),
+    sa.column('sender_id', sa.Integer),
+    sa.column('points', sa.Integer),
+    sa.column('description', sa.Text),
+    sa.column('qr_code', sa.Text),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def _signed_payload(secret_key, row):
+    """Re-sign the row's QR data as of its creation time, keeping its expiry"""
+    created = int(row.created_at.replace(tzinfo=timezone.utc).timestamp())
+
+    class CreatedAtSigner(TimestampSigner):
+        def get_timestamp(self):
+            return created
+
+    serializer = URLSafeTimedSerializer(secret_key, signer=CreatedAtSigner)
+    return serializer.dumps({
+        'type': 'points_issue',
+        'merchant_id': row.sender_id,
+        'points': row.points,
+        'description': row.description,
+    })
+
+
+def _png_data_uri(payload):
+    """The base64 PNG data URI the previous code stored for a signed payload"""
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img_buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(img_buffer, format='PNG')
+    return f"data:image/png;base64,{base64.b64encode(img_buffer.getvalue()).decode()}"
+
+
+def _rewrite(conn, condition, convert):
+    """Replace qr_code with convert(row) for rows matching condition, in batches"""
+    update = transactions.update().where(
+        transactions.c.id == sa.bindparam('row_id')
+    ).values(qr_code=sa.bindparam('payload'))
+
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(transactions).where(
+                transactions.c.id > last_id, condition
+            ).order_by(transactions.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(update, [
+            {'row_id': row.id, 'payload': convert(row)} for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    _rewrite(
+        op.get_bind(),
+        transactions.c.qr_code.like('data:image/png;base64,%'),
+        lambda row: _signed_payload(secret_key, row),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The previous code reads qr_code as an image; render the payloads back
+    _rewrite(
+        op.get_bind(),
+        sa.and_(transactions.c.qr_code.is_not(None), transactions.c.qr_code.not_like('data:%')),
+        lambda row: _png_data_uri(row.qr_code),
+    )
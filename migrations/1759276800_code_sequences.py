@@ -0,0 +1,32 @@
+"""code sequences
+
+Revision ID: 1759276800
+Revises: 1758931200
+Create Date: 2025-10-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1759276800'
+down_revision: Union[str, Sequence[str], None] = '1758931200'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('code_sequences',
+    sa.Column('name', sa.String(length=32), nullable=False),
+    sa.Column('next_value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('code_sequences')
@@ -0,0 +1,71 @@
+"""merchant search
+
+Revision ID: 1759968000
+Revises: 1759622400
+Create Date: 2025-10-09 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1759968000'
+down_revision: Union[str, Sequence[str], None] = '1759622400'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        # Must match the expression searched in map/search.py
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute("""
+            CREATE INDEX ix_users_merchant_search ON users
+            USING gin ((coalesce(business_name, '') || ' ' || coalesce(address, '')) gin_trgm_ops)
+            WHERE user_type = 'MERCHANT'
+        """)
+        return
+
+    # Trigram-tokenized so substrings match; rowid is the merchant's user id,
+    # and triggers keep it in step with every write to users
+    op.execute("CREATE VIRTUAL TABLE merchant_search USING fts5(business_name, address, tokenize='trigram')")
+    op.execute("""
+        CREATE TRIGGER merchant_search_insert AFTER INSERT ON users
+        WHEN new.user_type = 'MERCHANT' BEGIN
+            INSERT INTO merchant_search (rowid, business_name, address)
+            VALUES (new.id, new.business_name, new.address);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER merchant_search_update AFTER UPDATE OF user_type, business_name, address ON users BEGIN
+            DELETE FROM merchant_search WHERE rowid = old.id;
+            INSERT INTO merchant_search (rowid, business_name, address)
+            SELECT new.id, new.business_name, new.address WHERE new.user_type = 'MERCHANT';
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER merchant_search_delete AFTER DELETE ON users
+        WHEN old.user_type = 'MERCHANT' BEGIN
+            DELETE FROM merchant_search WHERE rowid = old.id;
+        END
+    """)
+    op.execute("""
+        INSERT INTO merchant_search (rowid, business_name, address)
+        SELECT id, business_name, address FROM users WHERE user_type = 'MERCHANT'
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX ix_users_merchant_search')
+        return
+
+    op.execute('DROP TRIGGER merchant_search_delete')
+    op.execute('DROP TRIGGER merchant_search_update')
+    op.execute('DROP TRIGGER merchant_search_insert')
+    op.execute('DROP TABLE merchant_search')
@@ -0,0 +1,32 @@
+"""voucher history indexes
+
+Revision ID: 1760313600
+Revises: 1759968000
+Create Date: 2025-10-13 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1760313600'
+down_revision: Union[str, Sequence[str], None] = '1759968000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_vouchers_merchant_id_created_at', 'vouchers', ['merchant_id', 'created_at'], unique=False)
+    op.create_index('ix_vouchers_merchant_id_is_redeemed_created_at', 'vouchers', ['merchant_id', 'is_redeemed', 'created_at'], unique=False)
+    op.create_index('ix_vouchers_redeemed_by_created_at', 'vouchers', ['redeemed_by', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_vouchers_redeemed_by_created_at', table_name='vouchers')
+    op.drop_index('ix_vouchers_merchant_id_is_redeemed_created_at', table_name='vouchers')
+    op.drop_index('ix_vouchers_merchant_id_created_at', table_name='vouchers')
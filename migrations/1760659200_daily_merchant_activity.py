@@ -0,0 +1,66 @@
+"""daily merchant activity rollup
+
+Revision ID: 1760659200
+Revises: 1760313600
+Create Date: 2025-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1760659200'
+down_revision: Union[str, Sequence[str], None] = '1760313600'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The transactiontype enum already exists on Postgres
+    transaction_type = sa.Enum(
+        'VOUCHER_ISSUE', 'QR_ISSUE', 'AIRDROP', 'TRANSFER', 'REDEMPTION', name='transactiontype'
+    ).with_variant(postgresql.ENUM(name='transactiontype', create_type=False), 'postgresql')
+    op.create_table('daily_merchant_activity',
+    sa.Column('merchant_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('transaction_type', transaction_type, nullable=False),
+    sa.Column('points', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('transactions', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['merchant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('merchant_id', 'day', 'transaction_type')
+    )
+    op.create_table('daily_merchant_customers',
+    sa.Column('merchant_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['merchant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('merchant_id', 'day', 'customer_id')
+    )
+    # Backfill from existing history; `flask backfill-analytics` does the same later
+    day = 'CAST(created_at AS DATE)' if op.get_bind().dialect.name == 'postgresql' else 'date(created_at)'
+    merchant_rows = "sender_id IS NOT NULL AND transaction_type != 'TRANSFER'"
+    op.execute(f"""
+        INSERT INTO daily_merchant_activity (merchant_id, day, transaction_type, points, transactions)
+        SELECT sender_id, {day}, transaction_type, SUM(points), COUNT(id)
+        FROM transactions
+        WHERE {merchant_rows}
+        GROUP BY sender_id, {day}, transaction_type
+    """)
+    op.execute(f"""
+        INSERT INTO daily_merchant_customers (merchant_id, day, customer_id)
+        SELECT DISTINCT sender_id, {day}, receiver_id
+        FROM transactions
+        WHERE {merchant_rows} AND receiver_id IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_merchant_customers')
+    op.drop_table('daily_merchant_activity')
@@ -0,0 +1,60 @@
+"""customer sketches
+
+Revision ID: 1761004800
+Revises: 1760659200
+Create Date: 2025-10-21 00:00:00.000000
+
+"""
+from itertools import groupby
+from operator import itemgetter
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from hll import hll_registers
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1761004800'
+down_revision: Union[str, Sequence[str], None] = '1760659200'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    sketches = op.create_table('customer_sketches',
+    sa.Column('merchant_id', sa.Integer(), nullable=False),
+    sa.Column('register', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['merchant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('merchant_id', 'register')
+    )
+    # Backfill from existing history; `flask rebuild-stats` does the same later
+    conn = op.get_bind()
+    pairs = conn.execute(sa.text("""
+        SELECT DISTINCT sender_id, receiver_id FROM transactions
+        WHERE transaction_type IN ('AIRDROP', 'QR_ISSUE', 'REDEMPTION')
+            AND sender_id IS NOT NULL AND receiver_id IS NOT NULL
+        ORDER BY sender_id
+    """))
+    for merchant_id, rows in groupby(pairs, key=itemgetter(0)):
+        conn.execute(sketches.insert(), [
+            {'merchant_id': merchant_id, 'register': register, 'rank': rank}
+            for register, rank in hll_registers(customer_id for _, customer_id in rows).items()
+        ])
+    with op.batch_alter_table('user_stats') as batch_op:
+        batch_op.drop_column('customers_served')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('user_stats') as batch_op:
+        batch_op.add_column(sa.Column('customers_served', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE user_stats SET customers_served = (
+            SELECT COUNT(DISTINCT t.receiver_id) FROM transactions t WHERE t.sender_id = user_stats.user_id
+        )
+    """)
+    op.drop_table('customer_sketches')
@@ -0,0 +1,34 @@
+"""qr redemptions
+
+Revision ID: 1761350400
+Revises: 1761004800
+Create Date: 2025-10-25 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1761350400'
+down_revision: Union[str, Sequence[str], None] = '1761004800'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('qr_redemptions',
+    sa.Column('code_hash', sa.String(length=64), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('redeemed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('code_hash')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('qr_redemptions')
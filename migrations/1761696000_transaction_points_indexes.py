@@ -0,0 +1,30 @@
+"""transaction points indexes
+
+Revision ID: 1761696000
+Revises: 1761350400
+Create Date: 2025-10-29 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1761696000'
+down_revision: Union[str, Sequence[str], None] = '1761350400'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_transactions_sender_id_points_id', 'transactions', ['sender_id', 'points', 'id'], unique=False)
+    op.create_index('ix_transactions_receiver_id_points_id', 'transactions', ['receiver_id', 'points', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transactions_receiver_id_points_id', table_name='transactions')
+    op.drop_index('ix_transactions_sender_id_points_id', table_name='transactions')
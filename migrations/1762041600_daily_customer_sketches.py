@@ -0,0 +1,68 @@
+"""daily customer sketches
+
+Revision ID: 1762041600
+Revises: 1761696000
+Create Date: 2025-11-02 00:00:00.000000
+
+"""
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from hll import hll_registers
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1762041600'
+down_revision: Union[str, Sequence[str], None] = '1761696000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    sketches = op.create_table('daily_customer_sketches',
+    sa.Column('merchant_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('register', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['merchant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('merchant_id', 'day', 'register')
+    )
+    # One sketch per merchant and day from the rows it replaces
+    conn = op.get_bind()
+    customers = conn.execute(sa.text(
+        'SELECT merchant_id, day, customer_id FROM daily_merchant_customers ORDER BY merchant_id, day'
+    ))
+    for (merchant_id, day), rows in groupby(customers, key=itemgetter(0, 1)):
+        conn.execute(sketches.insert(), [
+            {'merchant_id': merchant_id, 'day': date.fromisoformat(day) if isinstance(day, str) else day,
+             'register': register, 'rank': rank}
+            for register, rank in hll_registers(customer_id for *_, customer_id in rows).items()
+        ])
+    op.drop_table('daily_merchant_customers')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table('daily_merchant_customers',
+    sa.Column('merchant_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['merchant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('merchant_id', 'day', 'customer_id')
+    )
+    # Sketches can't be turned back into customers; rebuild from history
+    day = 'CAST(created_at AS DATE)' if op.get_bind().dialect.name == 'postgresql' else 'date(created_at)'
+    op.execute(f"""
+        INSERT INTO daily_merchant_customers (merchant_id, day, customer_id)
+        SELECT DISTINCT sender_id, {day}, receiver_id
+        FROM transactions
+        WHERE sender_id IS NOT NULL AND transaction_type != 'TRANSFER' AND receiver_id IS NOT NULL
+    """)
+    op.drop_table('daily_customer_sketches')
@@ -0,0 +1,44 @@
+"""merchant stats deltas
+
+Revision ID: 1762387200
+Revises: 1762041600
+Create Date: 2025-11-06 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1762387200'
+down_revision: Union[str, Sequence[str], None] = '1762041600'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The transactiontype enum already exists on Postgres
+    transaction_type = sa.Enum(
+        'VOUCHER_ISSUE', 'QR_ISSUE', 'AIRDROP', 'TRANSFER', 'REDEMPTION', name='transactiontype'
+    ).with_variant(postgresql.ENUM(name='transactiontype', create_type=False), 'postgresql')
+    op.create_table('merchant_stats_deltas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('merchant_id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('transaction_type', transaction_type, nullable=False),
+    sa.Column('points', sa.Integer(), nullable=False),
+    sa.Column('active_vouchers', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['merchant_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('merchant_stats_deltas')
@@ -1,9 +1,10 @@
 from typing import List, Optional
-from datetime import datetime, timezone
-from sqlalchemy import String, Integer, Float, DateTime, Boolean, Text, Enum, ForeignKey
+from datetime import date, datetime, timezone
+from sqlalchemy import event, String, Integer, SmallInteger, BigInteger, Float, Date, DateTime, Boolean, Text, Enum, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from flask_login import UserMixin
 from extensions import Model
+from geo import geohash_encode
 import enum
 
 class UserType(enum.Enum):
@@ -19,6 +20,9 @@ class TransactionType(enum.Enum):
 
 class User(UserMixin, Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_geohash', 'geohash'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
@@ -28,10 +32,12 @@ class User(UserMixin, Model):
     user_type: Mapped[UserType] = mapped_column(Enum(UserType), nullable=False)
     business_name: Mapped[Optional[str]] = mapped_column(String(120))
     address: Mapped[Optional[str]] = mapped_column(String(255))
-    # latitude: Mapped[Optional[float]] = mapped_column(Float)
-    # longitude: Mapped[Optional[float]] = mapped_column(Float)
+    latitude: Mapped[Optional[float]] = mapped_column(Float)
+    longitude: Mapped[Optional[float]] = mapped_column(Float)
+    # Derived from latitude/longitude on flush; see _set_geohash
+    geohash: Mapped[Optional[str]] = mapped_column(String(12))
     points_balance: Mapped[int] = mapped_column(Integer, default=0)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
     
     # Relationships
     sent_transactions: Mapped[List["Transaction"]] = relationship(
@@ -44,8 +50,24 @@ class User(UserMixin, Model):
         "Voucher", foreign_keys="Voucher.merchant_id", back_populates="merchant"
     )
 
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _set_geohash(mapper, connection, target):
+    """Keep the indexed geohash cell in step with the coordinates"""
+    if target.latitude is None or target.longitude is None:
+        target.geohash = None
+    else:
+        target.geohash = geohash_encode(target.latitude, target.longitude)
+
 class Transaction(Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        Index('ix_transactions_sender_id_created_at', 'sender_id', 'created_at'),
+        Index('ix_transactions_receiver_id_created_at', 'receiver_id', 'created_at'),
+        # Keysets for the points sorts of the history page
+        Index('ix_transactions_sender_id_points_id', 'sender_id', 'points', 'id'),
+        Index('ix_transactions_receiver_id_points_id', 'receiver_id', 'points', 'id'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     transaction_type: Mapped[TransactionType] = mapped_column(Enum(TransactionType), nullable=False)
@@ -55,7 +77,7 @@ class Transaction(Model):
     description: Mapped[Optional[str]] = mapped_column(Text)
     voucher_code: Mapped[Optional[str]] = mapped_column(String(50))
     qr_code: Mapped[Optional[str]] = mapped_column(Text)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
     
     # Relationships
     sender: Mapped[Optional["User"]] = relationship(
@@ -67,6 +89,11 @@ class Transaction(Model):
 
 class Voucher(Model):
     __tablename__ = 'vouchers'
+    __table_args__ = (
+        Index('ix_vouchers_merchant_id_created_at', 'merchant_id', 'created_at'),
+        Index('ix_vouchers_merchant_id_is_redeemed_created_at', 'merchant_id', 'is_redeemed', 'created_at'),
+        Index('ix_vouchers_redeemed_by_created_at', 'redeemed_by', 'created_at'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     code: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -74,8 +101,73 @@ class Voucher(Model):
     points_value: Mapped[int] = mapped_column(Integer, nullable=False)
     is_redeemed: Mapped[bool] = mapped_column(Boolean, default=False)
     redeemed_by: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('users.id'))
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
     redeemed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
     
     # Relationships
     merchant: Mapped["User"] = relationship("User", foreign_keys=[merchant_id], back_populates="vouchers")
+
+class UserStats(Model):
+    __tablename__ = 'user_stats'
+    
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True)
+    total_issued: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    total_earned: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    total_spent: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    active_vouchers: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    # Bumped on every write touching the user; dashboard ETags derive from it
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+
+class CustomerSketch(Model):
+    """One HyperLogLog register per row of a merchant's distinct-customer sketch (see hll.py)"""
+    __tablename__ = 'customer_sketches'
+    
+    merchant_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True)
+    register: Mapped[int] = mapped_column(SmallInteger, primary_key=True, autoincrement=False)
+    rank: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+
+class DailyMerchantActivity(Model):
+    """Points and transaction counts per merchant, day and type, kept up to date on every write"""
+    __tablename__ = 'daily_merchant_activity'
+    
+    merchant_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    transaction_type: Mapped[TransactionType] = mapped_column(Enum(TransactionType), primary_key=True)
+    points: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+    transactions: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+
+class DailyCustomerSketch(Model):
+    """One HyperLogLog register of a merchant's customers on one day; days merge by max (see hll.py)"""
+    __tablename__ = 'daily_customer_sketches'
+    
+    merchant_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    register: Mapped[int] = mapped_column(SmallInteger, primary_key=True, autoincrement=False)
+    rank: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+
+class MerchantStatsDelta(Model):
+    """One transaction's merchant-side stats, queued by a hot write path until stats.fold_merchant_stats applies it"""
+    __tablename__ = 'merchant_stats_deltas'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    merchant_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False)
+    customer_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('users.id'))
+    transaction_type: Mapped[TransactionType] = mapped_column(Enum(TransactionType), nullable=False)
+    points: Mapped[int] = mapped_column(Integer, nullable=False)
+    active_vouchers: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+class QRRedemption(Model):
+    """A scanned batch QR code; the primary key lets each one be redeemed once"""
+    __tablename__ = 'qr_redemptions'
+    
+    # See transactions.routes.qr_redemption_key
+    code_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    customer_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False)
+    redeemed_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class CodeSequence(Model):
+    __tablename__ = 'code_sequences'
+    
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    next_value: Mapped[int] = mapped_column(BigInteger, nullable=False)
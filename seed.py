@@ -1,68 +1,287 @@
+"""Synthetic data at production-like scale.
+
+    flask seed --customers 1000000 --merchants 20000 --transactions 50000000
+    python seed.py --customers 1000 --merchants 20 --transactions 20000
+
+Replaces everything in the database. Merchant traffic and customer
+activity both follow power laws, so a few merchants and customers see
+most of the transactions. Rows are bulk-inserted in chunks, customers'
+points_balance is what their generated ledger adds up to, and the rollup
+tables are rebuilt from the ledger at the end. Every user's password is
+"password".
+"""
+import csv
+import enum
+import io
+import itertools
 import random
-from app import create_app, db
-from models import User, UserType, Transaction, TransactionType, Voucher, Model
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+import click
+from sqlalchemy import delete, select, update, text
 from werkzeug.security import generate_password_hash
+from extensions import db, alembic
+from models import (
+    User, UserType, Transaction, TransactionType, Voucher, UserStats, CustomerSketch,
+    DailyMerchantActivity, DailyCustomerSketch, QRRedemption, MerchantStatsDelta,
+)
+from geo import geohash_encode
+from stats import rebuild_user_stats
+from analytics import backfill_merchant_activity
+from transactions.vouchers import allocate_sequence, encode_voucher_code, voucher_code_key
 
-app = create_app()
+# Zipf exponents: the hottest merchant gets ~10% of all traffic at 20k
+# merchants; customer activity is flatter but still long-tailed
+MERCHANT_SKEW = 1.1
+CUSTOMER_SKEW = 0.8
+# Share of generated events by kind; a redeemed voucher adds a second row
+EVENT_MIX = {
+    TransactionType.QR_ISSUE: 55,
+    TransactionType.AIRDROP: 15,
+    TransactionType.VOUCHER_ISSUE: 20,
+    TransactionType.TRANSFER: 10,
+}
+VOUCHER_REDEEM_RATE = 0.6
+VOUCHER_VALUES = (5, 10, 20, 50)
+AIRDROP_VALUES = (10, 25, 50, 100)
 
-with app.app_context():
-    # Create all tables
-    Model.metadata.create_all(db.engine)
+CITIES = (
+    ('Springfield', 39.78, -89.65), ('Riverton', 43.02, -108.38), ('Lakeside', 32.86, -116.92),
+    ('Fairview', 40.82, -73.99), ('Georgetown', 38.91, -77.07), ('Portsmouth', 50.82, -1.09),
+)
+NAME_WORDS = (
+    'Golden', 'Corner', 'Urban', 'Little', 'Green', 'Blue', 'Sunny', 'Old Town', 'Harbor', 'Maple',
+    'Rustic', 'Daily', 'Happy', 'Royal', 'Copper', 'Silver',
+)
+BUSINESS_KINDS = (
+    'Bakery', 'Cafe', 'Coffee', 'Books', 'Deli', 'Pizza', 'Florist', 'Grocer', 'Barber', 'Bistro',
+    'Tea House', 'Pharmacy', 'Cycles', 'Noodles', 'Taqueria', 'Butcher',
+)
+STREETS = ('Main', 'Oak', 'Pine', 'Elm', 'High', 'Market', 'Church', 'Mill', 'Park', 'Station')
 
-    # Clean up old data
-    db.session.query(Transaction).delete()
-    db.session.query(Voucher).delete()
-    db.session.query(User).delete()
-    db.session.commit()
+def _zipf_cum_weights(n, skew):
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(n)))
 
-    # Create users
-    users = []
-    for i in range(10):
-        user_type = random.choice([UserType.CUSTOMER, UserType.MERCHANT])
-        user = User(
-            username=f'{user_type.value}{i}',
-            email=f'{user_type.value}{i}@example.com',
-            phone=f'123456789{i}',
-            password_hash=generate_password_hash('password'),
-            user_type=user_type,
-            business_name=f'Business {i}' if user_type == UserType.MERCHANT else None,
-            address=f'{i} Main St, Anytown, USA' if user_type == UserType.MERCHANT else None,
-            points_balance=random.randint(0, 1000)
-        )
-        users.append(user)
-        db.session.add(user)
-    
-    db.session.commit()
+def _is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def _copy_value(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat(sep=' ')
+    return value
 
-    # Create transactions
-    for _ in range(20):
-        sender = random.choice(users)
-        receiver = random.choice(users)
-        while sender == receiver:
-            receiver = random.choice(users)
-        
-        transaction = Transaction(
-            transaction_type=random.choice(list(TransactionType)),
-            sender_id=sender.id,
-            receiver_id=receiver.id,
-            points=random.randint(10, 100),
-            description=f'Test transaction'
-        )
-        db.session.add(transaction)
-    
+def _bulk_insert(model, rows):
+    """Core executemany, or COPY on Postgres, which is several times faster"""
+    if not rows:
+        return
+    table = model.__table__
+    if not _is_postgres():
+        db.session.execute(table.insert(), rows)
+        return
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row[name]) for name in columns])
+    buffer.seek(0)
+    # None is written as an unquoted empty field, which CSV COPY reads as NULL
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+def _clear():
+    for model in (MerchantStatsDelta, DailyCustomerSketch, DailyMerchantActivity, CustomerSketch, UserStats,
+                  QRRedemption, Transaction, Voucher, User):
+        db.session.execute(delete(model))
     db.session.commit()
 
-    # Create vouchers
-    merchants = [user for user in users if user.user_type == UserType.MERCHANT]
-    for merchant in merchants:
-        for _ in range(5):
-            voucher = Voucher(
-                code=''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=8)),
-                merchant_id=merchant.id,
-                points_value=random.randint(10, 100)
-            )
-            db.session.add(voucher)
-    
+def _merchant_row(i, password_hash, rng):
+    city, lat, lon = rng.choice(CITIES)
+    latitude, longitude = lat + rng.gauss(0, 0.05), lon + rng.gauss(0, 0.05)
+    return {
+        'username': f'merchant{i}',
+        'email': f'merchant{i}@example.com',
+        'password_hash': password_hash,
+        'user_type': UserType.MERCHANT,
+        'business_name': f'{rng.choice(NAME_WORDS)} {rng.choice(BUSINESS_KINDS)}',
+        'address': f'{rng.randint(1, 999)} {rng.choice(STREETS)} St, {city}',
+        'latitude': latitude,
+        'longitude': longitude,
+        # Core inserts skip the ORM listener that normally sets this
+        'geohash': geohash_encode(latitude, longitude),
+        'points_balance': 0,
+    }
+
+def _customer_row(i, password_hash, rng):
+    return {
+        'username': f'customer{i}',
+        'email': f'customer{i}@example.com',
+        'password_hash': password_hash,
+        'user_type': UserType.CUSTOMER,
+        'business_name': None,
+        'address': None,
+        'latitude': None,
+        'longitude': None,
+        'geohash': None,
+        'points_balance': 0,
+    }
+
+def _insert_users(make_row, count, user_type, password_hash, rng, chunk_size):
+    for start in range(0, count, chunk_size):
+        _bulk_insert(User, [
+            make_row(i, password_hash, rng) for i in range(start, min(start + chunk_size, count))
+        ])
+        db.session.commit()
+    # Shuffled so popularity isn't correlated with id
+    ids = db.session.scalars(select(User.id).where(User.user_type == user_type).order_by(User.id)).all()
+    rng.shuffle(ids)
+    return ids
+
+def _generate_chunk(size, window_start, window, merchants, customers, balances, rng):
+    """Transaction and voucher rows for `size` events within one time window"""
+    merchant_ids, merchant_weights = merchants
+    customer_ids, customer_weights = customers
+    kinds = rng.choices(list(EVENT_MIX), weights=list(EVENT_MIX.values()), k=size)
+    senders = rng.choices(merchant_ids, cum_weights=merchant_weights, k=size)
+    receivers = rng.choices(range(len(customer_ids)), cum_weights=customer_weights, k=size * 2)
+    seconds = sorted(rng.random() * window.total_seconds() for _ in range(size))
+    end = window_start + window
+
+    voucher_count = kinds.count(TransactionType.VOUCHER_ISSUE)
+    first = allocate_sequence('voucher', voucher_count) if voucher_count else 0
+    key = voucher_code_key()
+    codes = (encode_voucher_code(number, key) for number in range(first, first + voucher_count))
+
+    transactions, vouchers = [], []
+    def add(kind, sender, receiver, points, created_at, description, voucher_code=None):
+        transactions.append({
+            'transaction_type': kind, 'sender_id': sender, 'receiver_id': receiver, 'points': points,
+            'description': description, 'voucher_code': voucher_code, 'created_at': created_at,
+        })
+
+    for i, kind in enumerate(kinds):
+        created_at = window_start + timedelta(seconds=seconds[i])
+        merchant_id = senders[i]
+        customer = receivers[2 * i]
+        if kind == TransactionType.TRANSFER:
+            recipient = receivers[2 * i + 1]
+            points = min(balances[customer], rng.randint(1, 50))
+            if points > 0 and recipient != customer:
+                balances[customer] -= points
+                balances[recipient] += points
+                add(kind, customer_ids[customer], customer_ids[recipient], points, created_at, 'Points transfer')
+                continue
+            # Nothing to send: the customer scans a code instead
+            kind = TransactionType.QR_ISSUE
+
+        if kind == TransactionType.QR_ISSUE:
+            points = rng.randint(1, 20)
+            balances[customer] += points
+            add(kind, merchant_id, customer_ids[customer], points, created_at, 'QR code scan')
+        elif kind == TransactionType.AIRDROP:
+            points = rng.choice(AIRDROP_VALUES)
+            balances[customer] += points
+            add(kind, merchant_id, customer_ids[customer], points, created_at, 'Airdrop')
+        else:
+            code, points = next(codes), rng.choice(VOUCHER_VALUES)
+            add(kind, merchant_id, None, points, created_at, 'Voucher', code)
+            voucher = {
+                'code': code, 'merchant_id': merchant_id, 'points_value': points, 'is_redeemed': False,
+                'redeemed_by': None, 'created_at': created_at, 'redeemed_at': None,
+            }
+            if rng.random() < VOUCHER_REDEEM_RATE:
+                redeemed_at = min(created_at + timedelta(hours=rng.expovariate(1 / 72)), end)
+                balances[customer] += points
+                voucher.update(is_redeemed=True, redeemed_by=customer_ids[customer], redeemed_at=redeemed_at)
+                add(TransactionType.REDEMPTION, merchant_id, customer_ids[customer], points, redeemed_at,
+                    'Voucher redemption', code)
+            vouchers.append(voucher)
+    return transactions, vouchers
+
+def generate(customers, merchants, transactions, days=365, chunk_size=50000, seed=0, echo=print):
+    """Replace the database contents with a synthetic dataset of the given size"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    def progress(message):
+        echo(f'[{time.perf_counter() - started:7.1f}s] {message}')
+
+    alembic.upgrade()
+    if not _is_postgres():
+        # The default 2MB page cache thrashes once the indexes outgrow it
+        db.session.execute(text('PRAGMA cache_size = -262144'))
+    _clear()
+    password_hash = generate_password_hash('password')
+    merchant_ids = _insert_users(_merchant_row, merchants, UserType.MERCHANT, password_hash, rng, chunk_size)
+    customer_ids = _insert_users(_customer_row, customers, UserType.CUSTOMER, password_hash, rng, chunk_size)
+    progress(f'{merchants} merchants and {customers} customers')
+
+    merchant_pool = (merchant_ids, _zipf_cum_weights(merchants, MERCHANT_SKEW))
+    customer_pool = (customer_ids, _zipf_cum_weights(customers, CUSTOMER_SKEW))
+    balances = array('q', bytes(8 * customers))
+    # Events per chunk, allowing for the extra row a redeemed voucher adds
+    rows_per_event = 1 + EVENT_MIX[TransactionType.VOUCHER_ISSUE] / sum(EVENT_MIX.values()) * VOUCHER_REDEEM_RATE
+    events = round(transactions / rows_per_event)
+    chunks = max(1, -(-events // chunk_size))
+    window = timedelta(days=days) / chunks
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+
+    # Building the ledger's secondary indexes once at the end is much
+    # cheaper than updating them row by row
+    indexes = [*Transaction.__table__.indexes, *Voucher.__table__.indexes]
+    for index in indexes:
+        index.drop(db.session.connection())
+    written = 0
+    try:
+        for chunk in range(chunks):
+            size = min(chunk_size, events - chunk * chunk_size)
+            rows, vouchers = _generate_chunk(size, start + window * chunk, window, merchant_pool, customer_pool,
+                                             balances, rng)
+            _bulk_insert(Voucher, vouchers)
+            _bulk_insert(Transaction, rows)
+            db.session.commit()
+            written += len(rows)
+            if (chunk + 1) % 20 == 0 or chunk + 1 == chunks:
+                progress(f'{written} transactions')
+    finally:
+        # Even a failed run must not leave the tables without their indexes
+        db.session.rollback()
+        for index in indexes:
+            index.create(db.session.connection())
+        db.session.commit()
+    progress('indexes')
+
+    for offset in range(0, customers, chunk_size):
+        changed = [
+            {'id': customer_ids[i], 'points_balance': balances[i]}
+            for i in range(offset, min(offset + chunk_size, customers)) if balances[i]
+        ]
+        if changed:
+            db.session.execute(update(User), changed)
     db.session.commit()
+    progress('balances')
+
+    rebuild_user_stats()
+    backfill_merchant_activity()
+    progress('stats and analytics rollups rebuilt')
+    return written
+
+@click.command('seed')
+@click.option('--customers', default=1000, show_default=True)
+@click.option('--merchants', default=20, show_default=True)
+@click.option('--transactions', default=20000, show_default=True, help='Approximate number of ledger rows.')
+@click.option('--days', default=365, show_default=True, help='History spread over this many days up to now.')
+@click.option('--chunk-size', default=50000, show_default=True, help='Rows per bulk insert.')
+@click.option('--seed', 'seed_value', default=0, show_default=True, help='Random seed, for repeatable data.')
+def seed_command(customers, merchants, transactions, days, chunk_size, seed_value):
+    """Replace all data with a synthetic dataset of the given size."""
+    if customers < 2 or merchants < 1:
+        raise click.BadParameter('need at least 2 customers and 1 merchant')
+    written = generate(customers, merchants, transactions, days, chunk_size, seed_value, echo=click.echo)
+    click.echo(f'Seeded {merchants} merchants, {customers} customers and {written} transactions.')
 
-    print('Database seeded successfully!')
+if __name__ == '__main__':
+    from app import create_app
+    with create_app().app_context():
+        seed_command()
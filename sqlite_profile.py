@@ -0,0 +1,67 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Applied to every connection. WAL lets readers carry on while a write
+# commits, and with it synchronous=NORMAL only syncs at checkpoints; a
+# power cut can lose the last commits but never corrupts the file.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    # Negative sizes are in KiB
+    ('cache_size', -16000),
+    ('mmap_size', 256 * 1024 * 1024),
+)
+
+def is_sqlite_file(url):
+    """True for SQLite URLs naming a database file rather than memory"""
+    url = make_url(url)
+    return (url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+            and url.query.get('mode') != 'memory')
+
+class SQLiteProfile:
+    """Engine settings for serving concurrent requests from one SQLite file.
+
+    Every connection gets the PRAGMAS and a busy_timeout, so a writer waits
+    for the lock instead of failing with "database is locked". Transactions
+    start with BEGIN IMMEDIATE where begin_write() asks for it, and as
+    before otherwise.
+
+    Only applies to SQLite database files, and only with SQLITE_PROFILE on.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.busy_timeout_ms = 5000
+
+    def init_app(self, app):
+        from extensions import db
+
+        self.enabled = (app.config.get('SQLITE_PROFILE', False)
+                        and is_sqlite_file(app.config['SQLALCHEMY_ENGINES']['default']['url']))
+        self.busy_timeout_ms = app.config.get('SQLITE_BUSY_TIMEOUT_MS', self.busy_timeout_ms)
+        if not self.enabled:
+            return
+        with app.app_context():
+            engines = [db.engine]
+            # asgi.py's reads share the file
+            if app.config.get('SQLALCHEMY_ASYNC_ENGINES') and db.async_engine.dialect.name == 'sqlite':
+                engines.append(db.async_engine.sync_engine)
+        for engine in engines:
+            event.listen(engine, 'connect', self._connect)
+        event.listen(engines[0], 'begin', _begin)
+
+    def _connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in (*PRAGMAS, ('busy_timeout', self.busy_timeout_ms)):
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def _begin(conn):
+    # The driver begins its own deferred transaction at the first write;
+    # for BEGIN IMMEDIATE it has to be told to stay out of the way
+    dbapi_connection = conn.connection.dbapi_connection
+    if conn.get_execution_options().get('sqlite_immediate'):
+        dbapi_connection.isolation_level = None
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+    else:
+        dbapi_connection.isolation_level = ''
@@ -44,37 +44,58 @@ if ('serviceWorker' in navigator) {
   });
 }
 
+// Server-Sent Events stream for dashboard stats, when supported
+let dashboardEvents = null;
+
+function dashboardEventsConnected() {
+  return dashboardEvents !== null && dashboardEvents.readyState === EventSource.OPEN;
+}
+
 // Dashboard functionality
 document.addEventListener('DOMContentLoaded', function() {
   // Auto-refresh dashboard stats
   function refreshStats() {
+    // Pushed updates make polling redundant while the event stream is up
+    if (dashboardEventsConnected()) {
+      return;
+    }
     fetch('/dashboard/stats')
       .then(response => response.json())
-      .then(data => {
-        // Update stats in the dashboard
-        const balanceElement = document.getElementById('points-balance');
-        if (balanceElement) {
-          balanceElement.textContent = data.points_balance;
-        }
-        
-        const earnedElement = document.getElementById('total-earned');
-        if (earnedElement) {
-          earnedElement.textContent = data.total_earned;
-        }
-        
-        const spentElement = document.getElementById('total-spent');
-        if (spentElement) {
-          spentElement.textContent = data.total_spent;
-        }
-        
-        const recentElement = document.getElementById('recent-transactions');
-        if (recentElement) {
-          recentElement.textContent = data.recent_transactions;
-        }
-      })
+      .then(applyStats)
       .catch(error => console.error('Error refreshing stats:', error));
   }
 
+  function applyStats(data) {
+    // Update stats in the dashboard
+    const balanceElement = document.getElementById('points-balance');
+    if (balanceElement) {
+      balanceElement.textContent = data.points_balance;
+    }
+    
+    const earnedElement = document.getElementById('total-earned');
+    if (earnedElement) {
+      earnedElement.textContent = data.total_earned;
+    }
+    
+    const spentElement = document.getElementById('total-spent');
+    if (spentElement) {
+      spentElement.textContent = data.total_spent;
+    }
+    
+    const recentElement = document.getElementById('recent-transactions');
+    if (recentElement) {
+      recentElement.textContent = data.recent_transactions;
+    }
+  }
+
+  // Subscribe to pushed stats updates on dashboard pages
+  if (document.getElementById('transaction-list') && 'EventSource' in window) {
+    dashboardEvents = new EventSource('/dashboard/events');
+    dashboardEvents.addEventListener('stats', (e) => {
+      document.dispatchEvent(new CustomEvent('dashboard:stats', { detail: JSON.parse(e.data) }));
+    });
+  }
+
   // Refresh stats every 30 seconds
   setInterval(refreshStats, 30000);
 
@@ -104,6 +125,23 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   }
 
+  // Infinite scroll: fetch the next page when the "load more" row scrolls into view
+  const transactionList = document.getElementById('transaction-list');
+  if (transactionList && 'IntersectionObserver' in window) {
+    const loadMoreObserver = new IntersectionObserver(entries => {
+      entries.forEach(entry => {
+        if (entry.isIntersecting) {
+          loadMoreObserver.unobserve(entry.target);
+          loadMoreTransactions(entry.target);
+        }
+      });
+    });
+
+    new MutationObserver(() => {
+      transactionList.querySelectorAll('.load-more-row').forEach(row => loadMoreObserver.observe(row));
+    }).observe(transactionList, { childList: true });
+  }
+
   // Form validation
   const forms = document.querySelectorAll('form');
   forms.forEach(form => {
@@ -143,6 +181,28 @@ function showAlert(message, type = 'info') {
   }, 5000);
 }
 
+// Replace the "load more" row with the next page of transaction rows
+function loadMoreTransactions(row) {
+  if (!row || row.dataset.loading) {
+    return;
+  }
+  row.dataset.loading = 'true';
+
+  fetch(row.dataset.nextUrl, {
+    headers: {
+      'HX-Request': 'true'
+    }
+  })
+  .then(response => response.text())
+  .then(html => {
+    row.outerHTML = html;
+  })
+  .catch(error => {
+    delete row.dataset.loading;
+    console.error('Error loading more transactions:', error);
+  });
+}
+
 // Copy to clipboard functionality
 function copyToClipboard(text) {
   navigator.clipboard.writeText(text).then(() => {
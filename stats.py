@@ -0,0 +1,271 @@
+import logging
+import sqlite3
+import click
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, func, delete, true, event
+from sqlalchemy.orm import Session
+from extensions import db, notifier, stats_folder, dialect_insert
+from models import User, UserStats, CustomerSketch, MerchantStatsDelta, Transaction, TransactionType, Voucher
+from analytics import record_merchant_activity
+from hll import hll_registers, hll_estimate
+from metrics import count_transactions
+
+STAT_COLUMNS = ('total_issued', 'total_earned', 'total_spent', 'active_vouchers')
+# Merchant payouts that count towards customers served
+CUSTOMER_TYPES = (TransactionType.AIRDROP, TransactionType.QR_ISSUE, TransactionType.REDEMPTION)
+
+def bump_user_stats(user_id, **deltas):
+    """Add deltas to a user's stats row, creating it if missing.
+
+    Runs as an upsert in the caller's session so it commits or rolls back
+    together with the write it describes. Also bumps the row's version.
+    """
+    stmt = dialect_insert()(UserStats).values(user_id=user_id, version=1, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            **{name: getattr(UserStats, name) + stmt.excluded[name] for name in deltas},
+            'version': UserStats.version + 1,
+        }
+    )
+    db.session.execute(stmt)
+    mark_users_changed([user_id])
+
+def mark_users_changed(user_ids):
+    """Queue "user changed" notifications, published once the session commits"""
+    db.session.info.setdefault('touched_users', set()).update(user_ids)
+
+def record_customers(merchant_id, customer_ids):
+    """Add customers to the merchant's distinct-customer sketch.
+
+    Each register only ever grows, so concurrent writers upsert their
+    registers with a max and never conflict over a read-modify-write.
+    """
+    stmt = dialect_insert()(CustomerSketch)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CustomerSketch.merchant_id, CustomerSketch.register],
+        set_={'rank': stmt.excluded.rank},
+        where=stmt.excluded.rank > CustomerSketch.rank
+    )
+    db.session.execute(stmt, [
+        {'merchant_id': merchant_id, 'register': register, 'rank': rank}
+        for register, rank in hll_registers(customer_ids).items()
+    ])
+
+def customers_served(merchant_id, exact=False):
+    """Distinct customers the merchant has paid out to.
+
+    Estimated from the merchant's sketch, at most 4096 small rows however
+    many transactions there are, within the error bound in hll.py. `exact`
+    counts the transactions table instead.
+    """
+    if exact:
+        return db.session.scalar(
+            select(func.count(func.distinct(Transaction.receiver_id))).where(
+                Transaction.sender_id == merchant_id,
+                Transaction.transaction_type.in_(CUSTOMER_TYPES)
+            )
+        )
+    rank_counts = db.session.execute(
+        select(CustomerSketch.rank, func.count())
+        .where(CustomerSketch.merchant_id == merchant_id)
+        .group_by(CustomerSketch.rank)
+    ).all()
+    return hll_estimate(dict(rank_counts))
+
+def get_user_version(user_id):
+    """Current data version for a user, 0 if nothing has touched them yet"""
+    stats = db.session.get(UserStats, user_id)
+    return stats.version if stats else 0
+
+def record_transaction_stats(transaction_type, points, sender_id=None, receiver_id=None, count=1, created_at=None,
+                             active_vouchers=0, defer_sender=False):
+    """Update sender and receiver stats for a transaction about to be written.
+
+    `count` rows totalling `points` may be recorded at once; `created_at`
+    should match the rows' timestamp so they land in the right daily bucket.
+    `active_vouchers` also changes the sender's count of unredeemed vouchers.
+
+    With `defer_sender` the sender's side of a single transaction is queued
+    instead (see queue_merchant_stats), so many customers scanning one
+    merchant's code don't all update that merchant's rows.
+    """
+    count_transactions(db.session, transaction_type, count)
+    created_at = created_at or datetime.now(timezone.utc)
+    if sender_id and defer_sender:
+        queue_merchant_stats(sender_id, transaction_type, points, receiver_id, created_at, active_vouchers)
+    elif sender_id:
+        _record_sender_stats(sender_id, transaction_type, points, count,
+                             [receiver_id] if receiver_id else [], created_at.date(), active_vouchers)
+    
+    if receiver_id:
+        bump_user_stats(receiver_id, total_earned=points)
+
+def _record_sender_stats(sender_id, transaction_type, points, count, receiver_ids, day, active_vouchers=0):
+    record_merchant_activity(sender_id, transaction_type, points, count, receiver_ids, day)
+    sender_deltas = {'total_spent': points}
+    if transaction_type != TransactionType.REDEMPTION:
+        sender_deltas['total_issued'] = points
+    if active_vouchers:
+        sender_deltas['active_vouchers'] = active_vouchers
+    if receiver_ids and transaction_type in CUSTOMER_TYPES:
+        record_customers(sender_id, receiver_ids)
+    bump_user_stats(sender_id, **sender_deltas)
+
+def queue_merchant_stats(merchant_id, transaction_type, points, customer_id, created_at, active_vouchers=0):
+    """Queue a transaction's merchant-side stats for fold_merchant_stats.
+
+    A plain insert into an append-only table, so the caller's transaction
+    writes no row keyed by the merchant and takes no lock other writers for
+    the same merchant would wait on. The merchant's stats, rollups and
+    version catch up when the worker's stats folder next runs.
+    """
+    db.session.execute(insert(MerchantStatsDelta).values(
+        merchant_id=merchant_id, customer_id=customer_id, transaction_type=transaction_type,
+        points=points, active_vouchers=active_vouchers, created_at=created_at
+    ))
+    stats_folder.start()
+
+def fold_merchant_stats(limit=None):
+    """Apply queued merchant stats in the caller's transaction; returns how many.
+
+    The DELETE ... RETURNING claims the rows it applies, so two folders
+    running at once never count the same transaction twice. Each merchant,
+    day and type then costs one set of upserts however many scans queued.
+    """
+    queued = select(MerchantStatsDelta.id).order_by(MerchantStatsDelta.id)
+    if limit:
+        queued = queued.limit(limit)
+    deltas = db.session.execute(
+        delete(MerchantStatsDelta)
+        .where(MerchantStatsDelta.id.in_(queued.scalar_subquery()))
+        .returning(MerchantStatsDelta.merchant_id, MerchantStatsDelta.created_at,
+                   MerchantStatsDelta.transaction_type, MerchantStatsDelta.points,
+                   MerchantStatsDelta.customer_id, MerchantStatsDelta.active_vouchers)
+    ).all()
+
+    # (merchant, day, type) -> [points, transactions, customers, active vouchers]
+    groups = defaultdict(lambda: [0, 0, [], 0])
+    for merchant_id, created_at, transaction_type, points, customer_id, active_vouchers in deltas:
+        group = groups[merchant_id, created_at.date(), transaction_type]
+        group[0] += points
+        group[1] += 1
+        if customer_id:
+            group[2].append(customer_id)
+        group[3] += active_vouchers
+    for (merchant_id, day, transaction_type), (points, count, customer_ids, active_vouchers) in groups.items():
+        _record_sender_stats(merchant_id, transaction_type, points, count, customer_ids, day, active_vouchers)
+    return len(deltas)
+
+def record_bulk_transaction_stats(transaction_type, sender_id, credits, created_at=None):
+    """Stats for one sender paying many receivers, as a handful of statements.
+
+    `credits` maps receiver id to points.
+    """
+    total = sum(credits.values())
+    count_transactions(db.session, transaction_type, len(credits))
+    day = (created_at or datetime.now(timezone.utc)).date()
+    _record_sender_stats(sender_id, transaction_type, total, len(credits), list(credits), day)
+    
+    stmt = dialect_insert()(UserStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            'total_earned': UserStats.total_earned + stmt.excluded.total_earned,
+            'version': UserStats.version + 1,
+        }
+    )
+    db.session.execute(stmt, [
+        {'user_id': user_id, 'total_earned': points, 'version': 1}
+        for user_id, points in credits.items()
+    ])
+    mark_users_changed(credits)
+
+def rebuild_user_stats():
+    """Recompute every user's stats row from the transactions and vouchers tables"""
+    # Queued stats are already in the ledger; applied here so they aren't counted twice
+    fold_merchant_stats()
+    def total(query):
+        return func.coalesce(query.scalar_subquery(), 0)
+    
+    rows = select(
+        User.id,
+        total(select(func.sum(Transaction.points)).where(
+            Transaction.sender_id == User.id,
+            Transaction.transaction_type != TransactionType.REDEMPTION
+        )),
+        total(select(func.sum(Transaction.points)).where(Transaction.receiver_id == User.id)),
+        total(select(func.sum(Transaction.points)).where(Transaction.sender_id == User.id)),
+        total(select(func.count(Voucher.id)).where(
+            Voucher.merchant_id == User.id,
+            Voucher.is_redeemed == False
+        )),
+    )
+    
+    # Upsert rather than truncate so versions keep increasing and no client
+    # can revalidate a stale ETag against a reset counter. The WHERE true
+    # keeps SQLite from parsing ON CONFLICT as part of the SELECT.
+    stmt = dialect_insert()(UserStats).from_select(['user_id', *STAT_COLUMNS], rows.where(true()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            **{name: stmt.excluded[name] for name in STAT_COLUMNS},
+            'version': UserStats.version + 1,
+        }
+    )
+    db.session.execute(stmt)
+    rebuild_customer_sketches()
+    db.session.commit()
+
+def rebuild_customer_sketches():
+    """Recompute every merchant's customer sketch from the transactions table"""
+    db.session.execute(delete(CustomerSketch))
+    pairs = db.session.execute(
+        select(Transaction.sender_id, Transaction.receiver_id)
+        .where(Transaction.transaction_type.in_(CUSTOMER_TYPES), Transaction.receiver_id.is_not(None))
+        .order_by(Transaction.sender_id)
+        .execution_options(yield_per=10000)
+    )
+    for merchant_id, rows in groupby(pairs, key=itemgetter(0)):
+        record_customers(merchant_id, (customer_id for _, customer_id in rows))
+
+@event.listens_for(Session, 'before_flush')
+def _touch_flushed_users(session, flush_context, instances):
+    """Profile edits made through the ORM notify like any other change"""
+    changed = {
+        obj.id for obj in session.dirty | session.deleted
+        if isinstance(obj, User) and obj.id is not None
+    }
+    if changed:
+        session.info.setdefault('touched_users', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _notify_touched_users(session):
+    """Push a change notification for every user a committed write touched"""
+    touched = session.info.pop('touched_users', None)
+    if touched:
+        try:
+            notifier.publish(touched)
+        except sqlite3.Error:
+            # The write is already committed; clients fall back to polling
+            logging.getLogger(__name__).exception('Could not publish user notifications')
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_touched_users(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('touched_users', None)
+
+@click.command('fold-stats')
+def fold_stats_command():
+    """Apply queued merchant stats, for when the background folder is off."""
+    folded = stats_folder.fold()
+    click.echo(f'{folded} queued transactions folded.')
+
+@click.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the user_stats rollup table from scratch."""
+    rebuild_user_stats()
+    click.echo('User stats rebuilt.')
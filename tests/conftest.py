@@ -0,0 +1,56 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from app import create_app
+from extensions import db, alembic, notifier
+from models import User, UserType
+from auth.user_cache import user_cache
+from dashboard.routes import response_cache
+from transactions.routes import qr_image_cache
+
+PASSWORD = 'password'
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Build the app on a fresh SQLite file, migrated to the latest revision"""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "loyalty.db"}')
+    # No folder threads outliving the test's database; tests call stats_folder.fold()
+    monkeypatch.setenv('STATS_FOLD_INTERVAL_MS', '0')
+
+    def make(async_mode=False):
+        app = create_app(async_mode=async_mode)
+        app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, EVENTS_DB_PATH=str(tmp_path / 'events.db'))
+        notifier.init_app(app)
+        # Process-wide caches would otherwise serve the last test's users
+        for cache in (user_cache, response_cache, qr_image_cache):
+            cache.clear()
+        with app.app_context():
+            alembic.upgrade()
+        return app
+    return make
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def users(app):
+    """Ids of a merchant and a customer, both with the password PASSWORD"""
+    password_hash = generate_password_hash(PASSWORD)
+    with app.app_context():
+        merchant = User(username='merchant', email='merchant@example.com', password_hash=password_hash,
+                        user_type=UserType.MERCHANT, business_name='Corner Cafe', points_balance=0)
+        customer = User(username='customer', email='customer@example.com', password_hash=password_hash,
+                        user_type=UserType.CUSTOMER, points_balance=100)
+        db.session.add_all([merchant, customer])
+        db.session.commit()
+        return {'merchant': merchant.id, 'customer': customer.id}
+
+@pytest.fixture
+def login(app):
+    """login(email) returns a test client logged in as that user"""
+    def login(email):
+        client = app.test_client()
+        response = client.post('/auth/login', data={'email': email, 'password': PASSWORD})
+        assert response.status_code == 302
+        return client
+    return login
@@ -0,0 +1,31 @@
+from datetime import date, datetime, timezone
+from extensions import db
+from models import TransactionType
+from analytics import record_merchant_activity, merchant_activity, backfill_merchant_activity
+
+def test_unique_customers_merge_across_days(app, users):
+    merchant = users['merchant']
+    with app.app_context():
+        # Customers 1-5 on Monday, 4-9 on Tuesday: nine different customers
+        record_merchant_activity(merchant, TransactionType.AIRDROP, 50, 5, list(range(1, 6)), date(2025, 6, 2))
+        record_merchant_activity(merchant, TransactionType.AIRDROP, 60, 6, list(range(4, 10)), date(2025, 6, 3))
+        db.session.commit()
+        by_day = merchant_activity(merchant, date(2025, 6, 2), date(2025, 6, 8), 'day')
+        by_week = merchant_activity(merchant, date(2025, 6, 2), date(2025, 6, 8), 'week')
+    assert [entry['unique_customers'] for entry in by_day['series'][:3]] == [5, 6, 0]
+    assert by_week['series'][0]['unique_customers'] == 9
+    assert by_day['totals']['unique_customers'] == by_week['totals']['unique_customers'] == 9
+    assert by_week['totals']['transactions'] == 11
+
+def test_backfill_rebuilds_sketches_from_the_ledger(app, login, users):
+    merchant = login('merchant@example.com')
+    merchant.post('/transactions/issue', data={
+        'issue_type': 'airdrop', 'points': 5, 'customer_email': 'customer@example.com',
+    })
+    today = datetime.now(timezone.utc).date()
+    with app.app_context():
+        before = merchant_activity(users['merchant'], today, today, 'day')['totals']
+        backfill_merchant_activity()
+        after = merchant_activity(users['merchant'], today, today, 'day')['totals']
+    assert before['unique_customers'] == after['unique_customers'] == 1
+    assert before['issued'] == after['issued'] == 5
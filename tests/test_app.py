@@ -0,0 +1,7 @@
+from extensions import db
+
+def test_sqlalchemy_echo_reaches_the_engine(make_app, monkeypatch):
+    monkeypatch.setenv('SQLALCHEMY_ECHO', '1')
+    app = make_app()
+    with app.app_context():
+        assert db.engine.echo
@@ -0,0 +1,42 @@
+import asyncio
+import json
+from flask import g
+from async_mode import AsyncApp, EventLoopFlask
+from extensions import db
+
+def test_flask_sqlalchemy_lite_keeps_sessions_in_g(app):
+    # AsyncApp._bind_async_session swaps db.session for the async session's
+    # sync face through this private attribute
+    with app.app_context():
+        session = db.session
+        assert g._sqlalchemy_sessions['default'] is session
+        replacement = db.sessionmaker()
+        g._sqlalchemy_sessions = {'default': replacement}
+        assert db.session is replacement
+
+def asgi_get(asgi_app, path):
+    """Status and body of a GET served by an ASGI app"""
+    messages = []
+    requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # The client stays connected until the response is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [],
+             'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80)}
+    asyncio.run(asgi_app(scope, receive, send))
+    return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+def test_event_loop_view_runs_on_async_session(make_app, users):
+    app = make_app(async_mode=True)
+    assert isinstance(app, EventLoopFlask)
+    status, body = asgi_get(AsyncApp(app, threads=1), '/map/merchants')
+    # Its session teardown is an async callback, awaited on the loop's thread
+    assert status == 200
+    assert [merchant['business_name'] for merchant in json.loads(body)] == ['Corner Cafe']
@@ -0,0 +1,18 @@
+from cache import LRUCache
+
+def test_maxbytes_evicts_least_recently_used():
+    cache = LRUCache(maxsize=100, maxbytes=10)
+    cache.set('a', b'1234')
+    cache.set('b', b'1234')
+    cache.get('a')
+    cache.set('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == cache.get('c') == b'1234'
+    assert cache.nbytes == 8
+
+def test_value_over_maxbytes_is_not_stored():
+    cache = LRUCache(maxbytes=10)
+    cache.set('a', b'1234')
+    cache.set('a', b'x' * 11)
+    assert cache.get('a') is None
+    assert cache.nbytes == 0
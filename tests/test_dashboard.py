@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import event, insert
+from extensions import db
+from models import Transaction, TransactionType
+from dashboard.routes import response_cache
+
+def test_unknown_arguments_are_not_cached(login, users):
+    client = login('customer@example.com')
+    response_cache.clear()
+    for n in range(5):
+        assert client.get(f'/dashboard/transactions?limit=200&x={n}').status_code == 200
+    assert len(response_cache) == 0
+    client.get('/dashboard/transactions?sort=date_asc')
+    assert len(response_cache) == 1
+
+def test_event_streams_past_the_cap_get_204(app, login, users):
+    app.config['EVENTS_MAX_STREAMS'] = 1
+    client = login('customer@example.com')
+    first = client.get('/dashboard/events')
+    assert first.status_code == 200
+    assert client.get('/dashboard/events').status_code == 204
+    first.close()
+    second = client.get('/dashboard/events')
+    assert second.status_code == 200
+    second.close()
+
+def count_statements(app, client, path, headers=None):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    response_cache.clear()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        assert client.get(path, headers=headers).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return statements
+
+@pytest.mark.parametrize('headers', [None, {'HX-Request': 'true'}], ids=['json', 'htmx'])
+def test_history_page_statements_do_not_grow_with_page_size(app, login, users, headers):
+    with app.app_context():
+        db.session.execute(insert(Transaction), [
+            {'transaction_type': TransactionType.TRANSFER, 'sender_id': users['merchant'],
+             'receiver_id': users['customer'], 'points': points}
+            for points in range(1, 121)
+        ])
+        db.session.commit()
+    client = login('customer@example.com')
+    # Loads the user snapshot cache, as any earlier request would have
+    client.get('/dashboard/stats')
+    for limit in (1, 50, 200):
+        statements = count_statements(app, client, f'/dashboard/transactions?limit={limit}', headers)
+        # Version lookup, the page, then its senders and receivers with one IN query each
+        assert len(statements) == 4, statements
@@ -0,0 +1,35 @@
+import tracemalloc
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from extensions import db
+from models import Transaction, TransactionType
+from dashboard.export import ledger_rows, ledger_csv
+
+LEDGER_ROWS = 30000
+# A streamed export peaks near 1.5 MB; holding the ledger's rows takes over 10
+PEAK_LIMIT = 4 * 2 ** 20
+
+def test_export_streams_in_bounded_memory(app, users):
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.session.execute(insert(Transaction), [
+            {
+                'transaction_type': TransactionType.AIRDROP if i % 2 else TransactionType.QR_ISSUE,
+                'sender_id': users['merchant'],
+                'receiver_id': users['customer'],
+                'points': i % 50 + 1,
+                'description': f'Synthetic transaction {i}',
+                'created_at': start + timedelta(seconds=i * 7),
+            }
+            for i in range(LEDGER_ROWS)
+        ])
+        db.session.commit()
+
+        tracemalloc.start()
+        try:
+            lines = sum(chunk.count('\n') for chunk in ledger_csv(ledger_rows(users['merchant'])))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert lines == LEDGER_ROWS + 1
+    assert peak < PEAK_LIMIT
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import event, insert
+from extensions import db
+from models import Transaction, TransactionType
+
+def history_plans(app, client, path):
+    """EXPLAIN QUERY PLAN details of the history queries a GET runs"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'UNION ALL' in statement:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        assert client.get(path).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert statements
+    with app.app_context():
+        connection = db.session.connection()
+        return [
+            [row[3] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+            for statement, parameters in statements
+        ]
+
+@pytest.fixture
+def history(app, users):
+    """A few transfers each way, so pages of one have a next cursor"""
+    with app.app_context():
+        db.session.execute(insert(Transaction), [
+            {'transaction_type': TransactionType.TRANSFER, 'sender_id': sender, 'receiver_id': receiver,
+             'points': points}
+            for points in range(1, 4)
+            for sender, receiver in ((users['merchant'], users['customer']), (users['customer'], users['merchant']))
+        ])
+        db.session.commit()
+
+@pytest.mark.parametrize('sort, keyset', [
+    ('date_desc', 'created_at'), ('date_asc', 'created_at'), ('points_desc', 'points_id'), ('points_asc', 'points_id'),
+])
+def test_history_branches_search_their_indexes(app, login, history, sort, keyset):
+    client = login('customer@example.com')
+    first_page = client.get(f'/dashboard/transactions?sort={sort}&limit=1').json
+    for path in (f'/dashboard/transactions?sort={sort}',
+                 f'/dashboard/transactions?sort={sort}&cursor={first_page["next_cursor"]}'):
+        for plan in history_plans(app, client, path):
+            assert any(f'USING INDEX ix_transactions_sender_id_{keyset}' in step for step in plan)
+            assert any(f'USING INDEX ix_transactions_receiver_id_{keyset}' in step for step in plan)
+            assert not [step for step in plan if step.startswith('SCAN')]
+            # The index order is the page order, with no sort of all the user's rows
+            assert not [step for step in plan if 'TEMP B-TREE' in step]
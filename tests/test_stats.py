@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+from sqlalchemy import select, func
+from extensions import db, stats_folder
+from models import UserStats, CustomerSketch, DailyMerchantActivity, MerchantStatsDelta
+from analytics import merchant_activity
+from stats import customers_served, rebuild_user_stats
+from transactions.routes import sign_qr_code_data
+from transactions.vouchers import issue_vouchers
+
+def scan(app, client, merchant_id, points):
+    with app.test_request_context():
+        qr_data = sign_qr_code_data({'type': 'points_issue', 'points': points, 'merchant_id': merchant_id})
+    response = client.post('/transactions/scan_qr', json={'qr_data': qr_data})
+    assert response.json['success']
+
+def stats(user_id):
+    return db.session.get(UserStats, user_id)
+
+def test_scans_queue_the_merchant_side_until_folded(app, login, users):
+    merchant = users['merchant']
+    customer = login('customer@example.com')
+    scan(app, customer, merchant, 7)
+    scan(app, customer, merchant, 3)
+    today = datetime.now(timezone.utc).date()
+
+    with app.app_context():
+        # The scans wrote nothing keyed by the merchant
+        assert stats(merchant) is None
+        assert db.session.scalar(select(func.count()).select_from(DailyMerchantActivity)) == 0
+        assert db.session.scalar(select(func.count()).select_from(CustomerSketch)) == 0
+        assert db.session.scalar(select(func.count()).select_from(MerchantStatsDelta)) == 2
+        assert stats(users['customer']).total_earned == 10
+
+    assert stats_folder.fold() == 2
+    with app.app_context():
+        assert stats(merchant).total_issued == 10
+        assert stats(merchant).version == 1
+        assert customers_served(merchant) == 1
+        totals = merchant_activity(merchant, today, today, 'day')['totals']
+        assert (totals['issued'], totals['transactions']) == (10, 2)
+        assert db.session.scalar(select(func.count()).select_from(MerchantStatsDelta)) == 0
+
+def test_redemptions_queue_the_active_voucher_count(app, login, users):
+    with app.app_context():
+        code = issue_vouchers(users['merchant'], 2, 20)[0]
+        db.session.commit()
+        assert stats(users['merchant']).active_vouchers == 2
+
+    customer = login('customer@example.com')
+    customer.post('/transactions/redeem', data={'voucher_code': code})
+    stats_folder.fold()
+    with app.app_context():
+        assert stats(users['merchant']).active_vouchers == 1
+        assert stats(users['customer']).total_earned == 20
+
+def test_rebuild_does_not_count_queued_stats_twice(app, login, users):
+    scan(app, login('customer@example.com'), users['merchant'], 5)
+    with app.app_context():
+        rebuild_user_stats()
+        assert stats(users['merchant']).total_issued == 5
+    assert stats_folder.fold() == 0
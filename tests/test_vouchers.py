@@ -0,0 +1,29 @@
+from sqlalchemy import insert
+from extensions import db
+from models import Voucher
+from transactions.vouchers import (
+    allocate_voucher_codes, encode_voucher_code, has_valid_check_character, voucher_code_key
+)
+
+def test_codes_are_distinct_and_carry_a_check_character(app):
+    with app.app_context():
+        key = voucher_code_key()
+        codes = [encode_voucher_code(number, key) for number in range(1, 20001)]
+    assert len(set(codes)) == len(codes)
+    assert all(has_valid_check_character(code) for code in codes)
+
+def test_codes_depend_on_the_secret_key(app):
+    with app.app_context():
+        first = [encode_voucher_code(number) for number in range(1, 4)]
+        app.secret_key = 'another deployment'
+        second = [encode_voucher_code(number) for number in range(1, 4)]
+    assert not set(first) & set(second)
+
+def test_allocation_skips_codes_already_issued(app, users):
+    with app.app_context():
+        # The code the next sequence number would get, issued earlier
+        taken = encode_voucher_code(1)
+        db.session.execute(insert(Voucher), [{'code': taken, 'merchant_id': users['merchant'], 'points_value': 5}])
+        codes = allocate_voucher_codes(3)
+    assert taken not in codes
+    assert len(set(codes)) == 3
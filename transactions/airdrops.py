@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, update, func
+from extensions import db, begin_write
+from models import User, UserType, Transaction, TransactionType
+from stats import record_bulk_transaction_stats
+
+logger = logging.getLogger(__name__)
+
+AIRDROP_CHUNK_SIZE = 1000
+
+def parse_airdrop_csv(stream, default_points):
+    """Read (line, email, points) rows from an uploaded CSV.
+
+    The file needs an email column and may have a points column; a header
+    row is optional. Returns the rows and any per-line errors.
+    """
+    rows, errors = [], []
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig'))
+    for line, record in enumerate(reader, start=1):
+        if not record or not record[0].strip():
+            continue
+        email = record[0].strip()
+        if line == 1 and '@' not in email:
+            continue
+        try:
+            points = int(record[1]) if len(record) > 1 and record[1].strip() else default_points
+        except ValueError:
+            errors.append({'line': line, 'email': email, 'error': 'Invalid points value'})
+            continue
+        if points <= 0:
+            errors.append({'line': line, 'email': email, 'error': 'Points must be positive'})
+            continue
+        rows.append((line, email, points))
+    return rows, errors
+
+def _resolve_chunk(rows, already_credited):
+    """Map a chunk of CSV rows to {customer id: points} with one IN query"""
+    users = {
+        email: (user_id, user_type)
+        for user_id, email, user_type in db.session.execute(
+            select(User.id, User.email, User.user_type).where(
+                User.email.in_({email for _, email, _ in rows})
+            )
+        )
+    }
+    credits, errors = {}, []
+    for line, email, points in rows:
+        user = users.get(email)
+        if user is None:
+            errors.append({'line': line, 'email': email, 'error': 'Unknown email'})
+        elif user[1] != UserType.CUSTOMER:
+            errors.append({'line': line, 'email': email, 'error': 'Not a customer'})
+        elif user[0] in credits or user[0] in already_credited:
+            errors.append({'line': line, 'email': email, 'error': 'Duplicate email'})
+        else:
+            credits[user[0]] = points
+    return credits, errors
+
+def _segment_filter(merchant_id, segment):
+    conditions = [User.user_type == UserType.CUSTOMER]
+    if segment == 'my_customers':
+        conditions.append(User.id.in_(
+            select(Transaction.receiver_id).where(Transaction.sender_id == merchant_id)
+        ))
+    return conditions
+
+def _segment_chunks(merchant_id, segment, points):
+    """Yield {customer id: points} chunks for a segment, paging by id"""
+    conditions = _segment_filter(merchant_id, segment)
+    last_id = 0
+    while True:
+        chunk = db.session.scalars(
+            select(User.id).where(User.id > last_id, *conditions)
+            .order_by(User.id).limit(AIRDROP_CHUNK_SIZE)
+        ).all()
+        if not chunk:
+            return
+        last_id = chunk[-1]
+        yield {user_id: points for user_id in chunk}
+
+def segment_size(merchant_id, segment):
+    return db.session.scalar(
+        select(func.count(User.id)).where(*_segment_filter(merchant_id, segment))
+    ) or 0
+
+def _apply_chunk(merchant_id, credits, description):
+    """Credit one chunk with set-based UPDATEs and executemany inserts, then commit.
+
+    A failed chunk is rolled back as a whole before the error propagates.
+    """
+    try:
+        _write_chunk(merchant_id, credits, description)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def _write_chunk(merchant_id, credits, description):
+    begin_write()
+    created_at = datetime.now(timezone.utc)
+    record_bulk_transaction_stats(TransactionType.AIRDROP, merchant_id, credits, created_at=created_at)
+
+    by_points = defaultdict(list)
+    for user_id, points in credits.items():
+        by_points[points].append(user_id)
+    for points, user_ids in by_points.items():
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(points_balance=User.points_balance + points)
+            .execution_options(synchronize_session=False)
+        )
+
+    db.session.execute(insert(Transaction), [
+        {
+            'transaction_type': TransactionType.AIRDROP,
+            'sender_id': merchant_id,
+            'receiver_id': user_id,
+            'points': points,
+            'description': description,
+            'created_at': created_at,
+        }
+        for user_id, points in credits.items()
+    ])
+
+def run_bulk_airdrop(merchant_id, description, rows=None, parse_errors=(), segment=None, points=None):
+    """Airdrop in committed chunks, yielding NDJSON progress lines.
+
+    Either `rows` (and `parse_errors`) from parse_airdrop_csv, or a
+    `segment` name with a flat `points` amount. The last line carries the
+    per-row error report, or if a chunk fails, the error and how many
+    credits were applied by the chunks committed before it.
+    """
+    errors = list(parse_errors)
+    succeeded = 0
+    processed = len(errors)
+
+    if segment:
+        total = segment_size(merchant_id, segment)
+        chunks = ((credits, []) for credits in _segment_chunks(merchant_id, segment, points))
+    else:
+        total = len(rows) + len(errors)
+        credited = set()
+
+        def resolve():
+            for start in range(0, len(rows), AIRDROP_CHUNK_SIZE):
+                credits, chunk_errors = _resolve_chunk(rows[start:start + AIRDROP_CHUNK_SIZE], credited)
+                credited.update(credits)
+                yield credits, chunk_errors
+        chunks = resolve()
+
+    try:
+        for credits, chunk_errors in chunks:
+            if credits:
+                _apply_chunk(merchant_id, credits, description)
+            errors.extend(chunk_errors)
+            succeeded += len(credits)
+            processed += len(credits) + len(chunk_errors)
+            yield json.dumps({
+                'processed': processed,
+                'total': total,
+                'succeeded': succeeded,
+                'failed': len(errors),
+            }) + '\n'
+    except Exception as e:
+        # Resolving a chunk can fail too; the session may be mid-transaction
+        db.session.rollback()
+        logger.exception('Bulk airdrop by merchant %s stopped', merchant_id)
+        yield json.dumps({
+            'done': True,
+            'error': str(e),
+            'applied': succeeded,
+            'processed': processed,
+            'total': total,
+            'succeeded': succeeded,
+            'failed': len(errors),
+            'errors': errors,
+        }) + '\n'
+        return
+
+    yield json.dumps({
+        'done': True,
+        'processed': processed,
+        'total': total,
+        'succeeded': succeeded,
+        'failed': len(errors),
+        'errors': errors,
+    }) + '\n'
@@ -1,12 +1,14 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, FloatField, RadioField, SubmitField
-from wtforms.validators import DataRequired, NumberRange
+from flask_wtf.file import FileField, FileAllowed
+from wtforms import StringField, FloatField, IntegerField, RadioField, SelectField, SubmitField
+from wtforms.validators import DataRequired, NumberRange, Optional
 
 class IssuePointsForm(FlaskForm):
     issue_type = RadioField('Issue Type', choices=[('voucher', 'Voucher'), ('qr_code', 'QR Code'), ('airdrop', 'Airdrop')], validators=[DataRequired()])
     points = FloatField('Points', validators=[DataRequired(), NumberRange(min=0.1)])
     description = StringField('Description')
     customer_email = StringField('Customer Email')
+    quantity = IntegerField('Number of QR Codes', default=1, validators=[Optional(), NumberRange(min=1, max=500)])
     submit = SubmitField('Issue Points')
 
 class TransferPointsForm(FlaskForm):
@@ -18,3 +20,20 @@ class TransferPointsForm(FlaskForm):
 class RedeemVoucherForm(FlaskForm):
     voucher_code = StringField('Voucher Code', validators=[DataRequired()])
     submit = SubmitField('Redeem Voucher')
+
+class BulkVoucherForm(FlaskForm):
+    count = IntegerField('Number of Vouchers', validators=[DataRequired(), NumberRange(min=1, max=50000)])
+    points = IntegerField('Points per Voucher', validators=[DataRequired(), NumberRange(min=1)])
+    description = StringField('Description')
+    submit = SubmitField('Issue Vouchers')
+
+class BulkAirdropForm(FlaskForm):
+    csv_file = FileField('Customer CSV', validators=[FileAllowed(['csv'], 'CSV files only')])
+    segment = SelectField('Or Airdrop to a Segment', choices=[
+        ('', 'Use uploaded CSV'),
+        ('my_customers', 'Customers I have issued points to'),
+        ('all_customers', 'All customers'),
+    ], default='')
+    points = IntegerField('Points per Customer', validators=[DataRequired(), NumberRange(min=1)])
+    description = StringField('Description')
+    submit = SubmitField('Start Airdrop')
@@ -0,0 +1,76 @@
+import io
+import multiprocessing
+import zipfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import qrcode
+import qrcode.image.svg
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def render_qr_code(signed_data, image_format='png'):
+    """Render signed QR code data as PNG or SVG bytes"""
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(signed_data)
+    qr.make(fit=True)
+    
+    if image_format == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+    
+    img_buffer = io.BytesIO()
+    img.save(img_buffer)
+    return img_buffer.getvalue()
+
+def _render_pool(workers):
+    """The worker's render pool, started with `workers` processes on first use.
+
+    Its processes come from a forkserver (spawn where there is none), never
+    by forking this process, whose other threads may hold locks mid-request.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+def render_qr_codes(payloads, image_format='png', workers=2):
+    """Render many payloads in parallel on a process pool, yielding images in order"""
+    pool = _render_pool(workers)
+    chunksize = max(1, len(payloads) // (workers * 4))
+    return pool.map(
+        render_qr_code, payloads, [image_format] * len(payloads), chunksize=chunksize
+    )
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only sink that hands back whatever was written since the last drain"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_qr_zip(payloads, image_format='png', workers=2):
+    """Yield a ZIP archive of rendered QR codes chunk by chunk.
+
+    Images are stored uncompressed since PNG data is already compressed.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for number, image in enumerate(render_qr_codes(payloads, image_format, workers), start=1):
+            archive.writestr(f'qr-{number:04d}.{image_format}', image)
+            yield buffer.drain()
+    yield buffer.drain()
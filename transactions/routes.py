@@ -1,20 +1,35 @@
-import random
-import string
-import qrcode
-import io
-import base64
-from flask import render_template, request, redirect, url_for, flash, jsonify, current_app
+import hashlib
+import json
+import secrets
+from flask import render_template, request, redirect, url_for, flash, jsonify, current_app, abort, make_response, Response, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime, timezone
-from sqlalchemy import select
-from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadTimeSignature
+from sqlalchemy import select, insert, update
+from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from transactions import transactions_bp
 from app import db
-from models import User, Transaction, Voucher, UserType, TransactionType
-from .forms import IssuePointsForm, TransferPointsForm, RedeemVoucherForm
+from extensions import write_queue, begin_write, dialect_insert
+from instrumentation import timed
+from metrics import QR_SCANS
+from batching import WriteRejected
+from models import User, Transaction, Voucher, QRRedemption, UserType, TransactionType
+from stats import record_transaction_stats, mark_users_changed
+from cache import LRUCache
+from .forms import IssuePointsForm, TransferPointsForm, RedeemVoucherForm, BulkVoucherForm, BulkAirdropForm
+from .airdrops import parse_airdrop_csv, run_bulk_airdrop
+from .qr import render_qr_code, stream_qr_zip
+from .vouchers import (
+    VOUCHER_CODE_LENGTH, allocate_voucher_codes,
+    has_valid_check_character, issue_vouchers, vouchers_csv
+)
 
-def _create_transaction(transaction_type, points, sender_id=None, receiver_id=None, description=None, voucher_code=None, qr_code=None):
-    """Helper function to create a transaction"""
+def _create_transaction(transaction_type, points, sender_id=None, receiver_id=None, description=None, voucher_code=None, qr_code=None,
+                        active_vouchers=0, defer_sender_stats=False):
+    """Helper function to create a transaction; see record_transaction_stats for the stats options"""
+    created_at = datetime.now(timezone.utc)
+    record_transaction_stats(transaction_type, points, sender_id=sender_id, receiver_id=receiver_id,
+                             created_at=created_at, active_vouchers=active_vouchers,
+                             defer_sender=defer_sender_stats)
     transaction = Transaction(
         transaction_type=transaction_type,
         sender_id=sender_id,
@@ -22,42 +37,78 @@ def _create_transaction(transaction_type, points, sender_id=None, receiver_id=No
         points=points,
         description=description,
         voucher_code=voucher_code,
-        qr_code=qr_code
+        qr_code=qr_code,
+        created_at=created_at
     )
     db.session.add(transaction)
     return transaction
 
+def _adjust_balance(user_id, delta):
+    """Atomically add delta to a user's balance in the database.
+
+    A single conditional UPDATE ... RETURNING, so no row has to be read and
+    locked first. Debits only apply when the balance covers them. Returns
+    the new balance, or None when nothing was updated.
+    """
+    stmt = update(User).where(User.id == user_id)
+    if delta < 0:
+        stmt = stmt.where(User.points_balance >= -delta)
+    stmt = stmt.values(points_balance=User.points_balance + delta).returning(User.points_balance)
+    mark_users_changed([user_id])
+    return db.session.scalar(stmt.execution_options(synchronize_session=False))
+
+def _run_write(operation, *args):
+    """Run a write operation and commit it, through the group committer if enabled"""
+    if write_queue.enabled:
+        return write_queue.submit(operation, *args)
+    try:
+        begin_write()
+        result = operation(*args)
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+
 def generate_voucher_code():
-    """Generate a unique voucher code"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+    """Generate a unique voucher code from the voucher sequence"""
+    return allocate_voucher_codes(1)[0]
 
-def generate_qr_code(data):
-    """Generate QR code as base64 encoded image"""
+def sign_qr_code_data(data):
+    """Sign QR code data; the signed string is what gets stored and encoded"""
     s = URLSafeTimedSerializer(current_app.secret_key)
-    signed_data = s.dumps(data)
+    return s.dumps(data)
 
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(signed_data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_base64}"
+QR_IMAGE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Rendered QR images keyed by (payload hash, format); payloads never change
+qr_image_cache = LRUCache(maxsize=512)
 
-def verify_qr_code_data(signed_data, max_age=300):
-    """Verify the signature of the QR code data"""
+def verify_qr_code_data(signed_data, max_age=300, batch_max_age=None):
+    """Verify the signature of the QR code data; returns it with its signing time.
+
+    Batch codes, which carry a serial, are printed and handed out, so they
+    stay valid for batch_max_age seconds instead when it is given. Raises
+    SignatureExpired for codes older than that and BadSignature for
+    anything that wasn't signed by us.
+    """
     s = URLSafeTimedSerializer(current_app.secret_key)
-    try:
-        data = s.loads(signed_data, max_age=max_age)
-        return data
-    except Exception:
-        return None
+    data, signed_at = s.loads(signed_data, max_age=max(max_age, batch_max_age or 0), return_timestamp=True)
+    if not (batch_max_age and isinstance(data, dict) and 'serial' in data):
+        age = (datetime.now(timezone.utc) - signed_at).total_seconds()
+        if age > max_age:
+            raise SignatureExpired(f'Signature age {age:.0f} > {max_age} seconds',
+                                   payload=data, date_signed=signed_at)
+    return data, signed_at
+
+def qr_redemption_key(qr_data, signed_at):
+    """Identity of a batch QR code for single-use checks.
+
+    Hashes the verified contents rather than the signed string, which has
+    more than one valid spelling.
+    """
+    canonical = json.dumps(qr_data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{signed_at.timestamp():.0f}:{canonical}'.encode()).hexdigest()
 
 @transactions_bp.route('/issue', methods=['GET', 'POST'])
 @login_required
@@ -74,6 +125,7 @@ def issue_points():
         description = form.description.data
         
         try:
+            begin_write()
             if issue_type == 'voucher':
                 voucher_code = generate_voucher_code()
                 
@@ -89,12 +141,16 @@ def issue_points():
                     sender_id=current_user.id,
                     points=points,
                     description=description,
-                    voucher_code=voucher_code
+                    voucher_code=voucher_code,
+                    active_vouchers=1
                 )
                 
                 db.session.commit()
                 flash(f'Voucher code created: {voucher_code}', 'success')
                 
+            elif issue_type == 'qr_code' and (form.quantity.data or 1) > 1:
+                return _issue_qr_batch(points, description, form.quantity.data)
+                
             elif issue_type == 'qr_code':
                 qr_data = {
                     'type': 'points_issue',
@@ -102,14 +158,12 @@ def issue_points():
                     'points': points,
                     'description': description,
                 }
-                qr_image = generate_qr_code(qr_data)
-                
                 _create_transaction(
                     transaction_type=TransactionType.QR_ISSUE,
                     sender_id=current_user.id,
                     points=points,
                     description=description,
-                    qr_code=qr_image
+                    qr_code=sign_qr_code_data(qr_data)
                 )
                 db.session.commit()
                 
@@ -118,24 +172,24 @@ def issue_points():
             elif issue_type == 'airdrop':
                 customer_email = form.customer_email.data
                 
-                with db.session.begin_nested():
-                    customer = db.session.scalar(
-                        select(User).where(User.email == customer_email).with_for_update()
-                    )
-                    
-                    if not customer or customer.user_type != UserType.CUSTOMER:
-                        flash('Customer not found', 'error')
-                        return render_template('transactions/issue.html', form=form)
-                    
-                    customer.points_balance += points
-                    
-                    _create_transaction(
-                        transaction_type=TransactionType.AIRDROP,
-                        sender_id=current_user.id,
-                        receiver_id=customer.id,
-                        points=points,
-                        description=description
-                    )
+                customer = db.session.scalar(
+                    select(User).where(User.email == customer_email)
+                )
+                
+                if not customer or customer.user_type != UserType.CUSTOMER:
+                    db.session.rollback()
+                    flash('Customer not found', 'error')
+                    return render_template('transactions/issue.html', form=form)
+                
+                _adjust_balance(customer.id, points)
+                
+                _create_transaction(
+                    transaction_type=TransactionType.AIRDROP,
+                    sender_id=current_user.id,
+                    receiver_id=customer.id,
+                    points=points,
+                    description=description
+                )
                 
                 db.session.commit()
                 
@@ -147,6 +201,139 @@ def issue_points():
     
     return render_template('transactions/issue.html', form=form)
 
+def _issue_qr_batch(points, description, quantity):
+    """Issue a batch of distinct QR codes in one commit and stream them as a ZIP"""
+    # Tells apart batches with the same contents signed in the same second
+    batch = secrets.token_urlsafe(8)
+    payloads = [
+        sign_qr_code_data({
+            'type': 'points_issue',
+            'merchant_id': current_user.id,
+            'points': points,
+            'description': description,
+            'batch': batch,
+            'serial': serial,
+        })
+        for serial in range(1, quantity + 1)
+    ]
+    
+    created_at = datetime.now(timezone.utc)
+    record_transaction_stats(TransactionType.QR_ISSUE, points * quantity, sender_id=current_user.id,
+                             count=quantity, created_at=created_at)
+    db.session.execute(insert(Transaction), [
+        {
+            'transaction_type': TransactionType.QR_ISSUE,
+            'sender_id': current_user.id,
+            'points': points,
+            'description': description,
+            'qr_code': payload,
+            'created_at': created_at,
+        }
+        for payload in payloads
+    ])
+    db.session.commit()
+    
+    # Rendering happens on a process pool while the archive streams out
+    filename = f"qr-codes-{datetime.now(timezone.utc):%Y%m%d%H%M%S}.zip"
+    return Response(
+        stream_qr_zip(payloads, workers=current_app.config['QR_RENDER_WORKERS']),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@transactions_bp.route('/qr/<int:transaction_id>.<image_format>')
+@login_required
+def qr_image(transaction_id, image_format):
+    """Render a merchant's stored QR code on demand"""
+    if image_format not in QR_IMAGE_TYPES:
+        abort(404)
+    
+    transaction = db.session.get(Transaction, transaction_id)
+    if not transaction or not transaction.qr_code or transaction.sender_id != current_user.id:
+        abort(404)
+    
+    etag = hashlib.sha1(transaction.qr_code.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        key = (etag, image_format)
+        image = qr_image_cache.get(key)
+        if image is None:
+            with timed('qr'):
+                image = render_qr_code(transaction.qr_code, image_format)
+            qr_image_cache.set(key, image)
+        response = make_response(image)
+        response.mimetype = QR_IMAGE_TYPES[image_format]
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@transactions_bp.route('/vouchers/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_vouchers():
+    """Merchant issues many vouchers at once and downloads the codes as CSV"""
+    form = BulkVoucherForm()
+    if current_user.user_type != UserType.MERCHANT:
+        flash('Access denied: Merchants only', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    if form.validate_on_submit():
+        try:
+            begin_write()
+            codes = issue_vouchers(
+                current_user.id, form.count.data, form.points.data, form.description.data
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error issuing vouchers: {str(e)}', 'error')
+            return render_template('transactions/bulk_vouchers.html', form=form)
+        
+        filename = f"vouchers-{datetime.now(timezone.utc):%Y%m%d%H%M%S}.csv"
+        return Response(
+            vouchers_csv(codes, form.points.data),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    
+    return render_template('transactions/bulk_vouchers.html', form=form)
+
+@transactions_bp.route('/airdrop/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_airdrop():
+    """Merchant airdrops points to a CSV of customer emails or a segment.
+
+    The POST streams NDJSON progress, one line per committed chunk, ending
+    with a per-row error report.
+    """
+    form = BulkAirdropForm()
+    if current_user.user_type != UserType.MERCHANT:
+        flash('Access denied: Merchants only', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    if form.validate_on_submit():
+        if form.segment.data:
+            progress = run_bulk_airdrop(
+                current_user.id, form.description.data,
+                segment=form.segment.data, points=form.points.data
+            )
+        elif form.csv_file.data:
+            rows, parse_errors = parse_airdrop_csv(form.csv_file.data.stream, form.points.data)
+            progress = run_bulk_airdrop(
+                current_user.id, form.description.data,
+                rows=rows, parse_errors=parse_errors
+            )
+        else:
+            return jsonify({'done': True, 'message': 'Upload a CSV file or choose a segment'}), 400
+        
+        return Response(stream_with_context(progress), mimetype='application/x-ndjson')
+    
+    if request.method == 'POST':
+        return jsonify({'done': True, 'message': 'Invalid form', 'errors': form.errors}), 400
+    
+    return render_template('transactions/bulk_airdrop.html', form=form)
+
 @transactions_bp.route('/transfer', methods=['GET', 'POST'])
 @login_required
 def transfer_points():
@@ -157,39 +344,46 @@ def transfer_points():
         points = form.points.data
         description = form.description.data
         
-        if points > current_user.points_balance:
+        # The checks below read in the transaction that writes
+        begin_write()
+        # current_user is a cached snapshot; check against the stored balance
+        balance = db.session.scalar(select(User.points_balance).where(User.id == current_user.id))
+        if points > balance:
+            # Releases the write lock before rendering
+            db.session.rollback()
             flash('Insufficient points balance', 'error')
             return render_template('transactions/transfer.html', form=form)
 
-        with db.session.begin_nested():
-            sender = db.session.get(User, current_user.id, with_for_update=True)
-
-            if points > sender.points_balance:
-                flash('Insufficient points balance', 'error')
-                return render_template('transactions/transfer.html', form=form)
-            
-            recipient = db.session.scalar(
-                select(User).where(User.email == recipient_email).with_for_update()
-            )
-            
-            if not recipient:
-                flash('Recipient not found', 'error')
-                return render_template('transactions/transfer.html', form=form)
-            
-            if recipient.id == sender.id:
-                flash('Cannot transfer points to yourself', 'error')
-                return render_template('transactions/transfer.html', form=form)
-            
-            sender.points_balance -= points
-            recipient.points_balance += points
-            
-            _create_transaction(
-                transaction_type=TransactionType.TRANSFER,
-                sender_id=sender.id,
-                receiver_id=recipient.id,
-                points=points,
-                description=description
-            )
+        recipient = db.session.scalar(
+            select(User).where(User.email == recipient_email)
+        )
+        
+        if not recipient:
+            db.session.rollback()
+            flash('Recipient not found', 'error')
+            return render_template('transactions/transfer.html', form=form)
+        
+        if recipient.id == current_user.id:
+            db.session.rollback()
+            flash('Cannot transfer points to yourself', 'error')
+            return render_template('transactions/transfer.html', form=form)
+        
+        # Update both rows in id order so opposing transfers can't deadlock
+        deltas = sorted([(current_user.id, -points), (recipient.id, points)])
+        results = dict((user_id, _adjust_balance(user_id, delta)) for user_id, delta in deltas)
+        
+        if results[current_user.id] is None:
+            db.session.rollback()
+            flash('Insufficient points balance', 'error')
+            return render_template('transactions/transfer.html', form=form)
+        
+        _create_transaction(
+            transaction_type=TransactionType.TRANSFER,
+            sender_id=current_user.id,
+            receiver_id=recipient.id,
+            points=points,
+            description=description
+        )
         
         db.session.commit()
         
@@ -198,6 +392,41 @@ def transfer_points():
     
     return render_template('transactions/transfer.html', form=form)
 
+def _redeem_voucher_code(user_id, code):
+    """Redeem a voucher for a customer; returns the points credited"""
+    # Claim the voucher with one conditional UPDATE; only one concurrent
+    # redemption can flip is_redeemed, so no row lock is needed
+    claimed = db.session.execute(
+        update(Voucher)
+        .where(Voucher.code == code, Voucher.is_redeemed == False)
+        .values(
+            is_redeemed=True,
+            redeemed_by=user_id,
+            redeemed_at=datetime.now(timezone.utc)
+        )
+        .returning(Voucher.merchant_id, Voucher.points_value)
+        .execution_options(synchronize_session=False)
+    ).first()
+    
+    if not claimed:
+        exists = db.session.scalar(select(Voucher.id).where(Voucher.code == code))
+        raise WriteRejected('Voucher code already redeemed' if exists else 'Invalid voucher code')
+    
+    _adjust_balance(user_id, claimed.points_value)
+    
+    # The merchant's stats are queued, as for scans
+    _create_transaction(
+        transaction_type=TransactionType.REDEMPTION,
+        sender_id=claimed.merchant_id,
+        receiver_id=user_id,
+        points=claimed.points_value,
+        description=f'Voucher redemption: {code}',
+        voucher_code=code,
+        active_vouchers=-1,
+        defer_sender_stats=True
+    )
+    return claimed.points_value
+
 @transactions_bp.route('/redeem', methods=['GET', 'POST'])
 @login_required
 def redeem_voucher():
@@ -206,43 +435,60 @@ def redeem_voucher():
     if form.validate_on_submit():
         voucher_code = form.voucher_code.data.upper()
         
-        with db.session.begin_nested():
-            voucher = db.session.scalar(
-                select(Voucher).where(Voucher.code == voucher_code).with_for_update()
-            )
-            
-            if not voucher:
-                flash('Invalid voucher code', 'error')
-                return render_template('transactions/redeem.html', form=form)
-            
-            if voucher.is_redeemed:
-                flash('Voucher code already redeemed', 'error')
-                return render_template('transactions/redeem.html', form=form)
-            
-            user = db.session.get(User, current_user.id, with_for_update=True)
-            
-            user.points_balance += voucher.points_value
-            
-            voucher.is_redeemed = True
-            voucher.redeemed_by = user.id
-            voucher.redeemed_at = datetime.now(timezone.utc)
-            
-            _create_transaction(
-                transaction_type=TransactionType.REDEMPTION,
-                sender_id=voucher.merchant_id,
-                receiver_id=user.id,
-                points=voucher.points_value,
-                description=f'Voucher redemption: {voucher_code}',
-                voucher_code=voucher_code
-            )
+        # Sequence-allocated codes carry a check character; reject typos early
+        if len(voucher_code) == VOUCHER_CODE_LENGTH and not has_valid_check_character(voucher_code):
+            flash('Invalid voucher code', 'error')
+            return render_template('transactions/redeem.html', form=form)
         
-        db.session.commit()
+        try:
+            points = _run_write(_redeem_voucher_code, current_user.id, voucher_code)
+        except WriteRejected as e:
+            flash(str(e), 'error')
+            return render_template('transactions/redeem.html', form=form)
         
-        flash(f'Successfully redeemed {voucher.points_value} points!', 'success')
+        flash(f'Successfully redeemed {points} points!', 'success')
         return redirect(url_for('dashboard.index'))
     
     return render_template('transactions/redeem.html', form=form)
 
+def _award_qr_points(user_id, merchant_id, points, description, code_hash=None):
+    """Credit a customer for a scanned QR code; returns the merchant's business name.
+
+    Batch codes pass their qr_redemption_key as code_hash and can only be
+    redeemed once.
+    """
+    # The merchant row is only validated, never written, so a plain read;
+    # locking it would serialize every customer scanning the same code
+    sender = db.session.get(User, merchant_id)
+    
+    if not sender or sender.user_type != UserType.MERCHANT:
+        raise WriteRejected('Invalid merchant in QR code')
+    
+    if code_hash:
+        # Like voucher claims, the insert itself decides between concurrent scans
+        claimed = db.session.scalar(
+            dialect_insert()(QRRedemption)
+            .values(code_hash=code_hash, customer_id=user_id, redeemed_at=datetime.now(timezone.utc))
+            .on_conflict_do_nothing(index_elements=[QRRedemption.code_hash])
+            .returning(QRRedemption.code_hash)
+        )
+        if not claimed:
+            raise WriteRejected('QR code already redeemed')
+    
+    _adjust_balance(user_id, points)
+    
+    # Every customer of the merchant scans the same code, so the merchant's
+    # stats are queued rather than upserted here (see queue_merchant_stats)
+    _create_transaction(
+        transaction_type=TransactionType.QR_ISSUE,
+        sender_id=sender.id,
+        receiver_id=user_id,
+        points=points,
+        description=description,
+        defer_sender_stats=True
+    )
+    return sender.business_name
+
 @transactions_bp.route('/scan_qr', methods=['POST'])
 @login_required
 def scan_qr():
@@ -251,19 +497,25 @@ def scan_qr():
     signed_qr_data = request.json.get('qr_data')
     
     if not signed_qr_data:
+        QR_SCANS.labels('missing').inc()
         return jsonify({'success': False, 'message': 'QR data missing'})
 
     try:
-        qr_data = verify_qr_code_data(signed_qr_data)
+        qr_data, signed_at = verify_qr_code_data(signed_qr_data,
+                                                 batch_max_age=current_app.config['QR_BATCH_MAX_AGE'])
     except SignatureExpired:
+        QR_SCANS.labels('expired').inc()
         return jsonify({'success': False, 'message': 'QR code has expired'})
-    except BadTimeSignature:
+    except BadSignature:
+        QR_SCANS.labels('bad_signature').inc()
         return jsonify({'success': False, 'message': 'Invalid QR code signature'})
     except Exception as e:
+        QR_SCANS.labels('error').inc()
         current_app.logger.error(f"Error verifying QR code: {e}")
         return jsonify({'success': False, 'message': 'Error processing QR code'})
     
-    if not qr_data or qr_data.get('type') != 'points_issue':
+    if not isinstance(qr_data, dict) or qr_data.get('type') != 'points_issue':
+        QR_SCANS.labels('invalid').inc()
         return jsonify({'success': False, 'message': 'Invalid QR code content'})
 
     points = qr_data.get('points')
@@ -271,31 +523,24 @@ def scan_qr():
     description = qr_data.get('description')
 
     if not all([points, merchant_id]):
+        QR_SCANS.labels('invalid').inc()
         return jsonify({'success': False, 'message': 'Incomplete QR code data'})
 
-    try:
-        with db.session.begin_nested():
-            receiver = db.session.get(User, current_user.id, with_for_update=True)
-            sender = db.session.get(User, merchant_id, with_for_update=True)
+    # Single codes are shown at the till for everyone to scan; batch codes
+    # are handed out one per customer
+    code_hash = qr_redemption_key(qr_data, signed_at) if 'serial' in qr_data else None
 
-            if not sender or sender.user_type != UserType.MERCHANT:
-                return jsonify({'success': False, 'message': 'Invalid merchant in QR code'})
-
-            receiver.points_balance += points
-
-            _create_transaction(
-                transaction_type=TransactionType.QR_ISSUE,
-                sender_id=sender.id,
-                receiver_id=receiver.id,
-                points=points,
-                description=description
-            )
-        
-        db.session.commit()
-        
-        flash(f'Successfully received {points} points from {sender.business_name}', 'success')
-        return jsonify({'success': True, 'message': 'Points awarded successfully'})
+    try:
+        business_name = _run_write(_award_qr_points, current_user.id, merchant_id, points, description,
+                                   code_hash)
+    except WriteRejected as e:
+        QR_SCANS.labels('rejected').inc()
+        return jsonify({'success': False, 'message': str(e)})
     except Exception as e:
-        db.session.rollback()
+        QR_SCANS.labels('failed').inc()
         current_app.logger.error(f"Error processing QR code transaction: {e}")
         return jsonify({'success': False, 'message': f'Transaction failed: {str(e)}'})
+    
+    QR_SCANS.labels('success').inc()
+    flash(f'Successfully received {points} points from {business_name}', 'success')
+    return jsonify({'success': True, 'message': 'Points awarded successfully'})
@@ -0,0 +1,159 @@
+import csv
+import hashlib
+import io
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from sqlalchemy import insert, select
+from extensions import db, begin_write, dialect_insert
+from models import CodeSequence, User, UserType, Voucher, Transaction, TransactionType
+from stats import record_transaction_stats
+
+# Crockford base32 has no I, L, O or U, so codes survive being read aloud
+CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_BODY_LENGTH = 8
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_BODY_LENGTH
+
+# Body plus check character. Legacy random codes are 8 characters, so
+# sequence-allocated codes can never collide with them.
+VOUCHER_CODE_LENGTH = CODE_BODY_LENGTH + 1
+
+# Codes are a Feistel permutation of the 2**40 code space keyed from the
+# app's secret key, so distinct sequence numbers always get distinct codes
+# but one code says nothing about the others without the key
+_HALF_BITS = 20
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_FEISTEL_ROUNDS = 6
+
+VOUCHER_CHUNK_SIZE = 5000
+
+def allocate_sequence(name, count):
+    """Reserve `count` consecutive numbers from a named sequence; returns the first.
+
+    A single upsert row lock per call, regardless of count, so concurrent
+    issuers each get a disjoint block.
+    """
+    stmt = dialect_insert()(CodeSequence).values(name=name, next_value=count + 1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CodeSequence.name],
+        set_={'next_value': CodeSequence.next_value + count}
+    ).returning(CodeSequence.next_value)
+    return db.session.scalar(stmt) - count
+
+def voucher_code_key():
+    """Key for encode_voucher_code, derived from the app's secret key"""
+    secret = current_app.secret_key
+    secret = secret if isinstance(secret, bytes) else secret.encode()
+    return hashlib.blake2b(secret, person=b'voucher-codes', digest_size=32).digest()
+
+def _permute(number, key):
+    left, right = number >> _HALF_BITS, number & _HALF_MASK
+    for round_number in range(_FEISTEL_ROUNDS):
+        digest = hashlib.blake2b(bytes((round_number,)) + right.to_bytes(3, 'big'), key=key, digest_size=4).digest()
+        left, right = right, left ^ (int.from_bytes(digest, 'big') & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+def encode_voucher_code(number, key=None):
+    """Map a sequence number to its unique voucher code.
+
+    Pass voucher_code_key() as `key` when encoding many numbers.
+    """
+    scrambled = _permute(number % CODE_SPACE, key or voucher_code_key())
+    chars = []
+    for _ in range(CODE_BODY_LENGTH):
+        scrambled, digit = divmod(scrambled, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    body = ''.join(reversed(chars))
+    return body + _check_character(body)
+
+def _check_character(body):
+    """Luhn mod 32 check character; catches any single typo and most swaps"""
+    base = len(CODE_ALPHABET)
+    factor = 2
+    total = 0
+    for char in reversed(body):
+        addend = factor * CODE_ALPHABET.index(char)
+        factor = 1 if factor == 2 else 2
+        total += addend // base + addend % base
+    return CODE_ALPHABET[(base - total % base) % base]
+
+def has_valid_check_character(code):
+    return (
+        len(code) == VOUCHER_CODE_LENGTH
+        and all(char in CODE_ALPHABET for char in code)
+        and _check_character(code[:-1]) == code[-1]
+    )
+
+def allocate_voucher_codes(count):
+    """`count` new voucher codes from one sequence block.
+
+    Codes from the sequence never repeat each other, but may repeat one
+    issued under an older encoding; those are swapped for fresh numbers.
+    """
+    key = voucher_code_key()
+    first = allocate_sequence('voucher', count)
+    codes = [encode_voucher_code(number, key) for number in range(first, first + count)]
+    taken = set()
+    for start in range(0, count, VOUCHER_CHUNK_SIZE):
+        taken.update(db.session.scalars(
+            select(Voucher.code).where(Voucher.code.in_(codes[start:start + VOUCHER_CHUNK_SIZE]))
+        ))
+    if taken:
+        fresh = allocate_voucher_codes(len(taken))
+        codes = [fresh.pop() if code in taken else code for code in codes]
+    return codes
+
+def issue_vouchers(merchant_id, count, points, description=None):
+    """Create `count` vouchers and their VOUCHER_ISSUE transactions.
+
+    Codes come from allocate_voucher_codes. Rows go in with executemany in
+    chunks; the caller commits.
+    """
+    codes = allocate_voucher_codes(count)
+    created_at = datetime.now(timezone.utc)
+    
+    for start in range(0, count, VOUCHER_CHUNK_SIZE):
+        chunk = codes[start:start + VOUCHER_CHUNK_SIZE]
+        db.session.execute(insert(Voucher), [
+            {'code': code, 'merchant_id': merchant_id, 'points_value': points, 'created_at': created_at}
+            for code in chunk
+        ])
+        db.session.execute(insert(Transaction), [
+            {
+                'transaction_type': TransactionType.VOUCHER_ISSUE,
+                'sender_id': merchant_id,
+                'points': points,
+                'description': description,
+                'voucher_code': code,
+                'created_at': created_at,
+            }
+            for code in chunk
+        ])
+    
+    record_transaction_stats(TransactionType.VOUCHER_ISSUE, points * count, sender_id=merchant_id,
+                             count=count, created_at=created_at, active_vouchers=count)
+    return codes
+
+def vouchers_csv(codes, points):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['code', 'points'])
+    writer.writerows((code, points) for code in codes)
+    return output.getvalue()
+
+@click.command('issue-vouchers')
+@click.argument('merchant_email')
+@click.argument('count', type=click.IntRange(1))
+@click.argument('points', type=click.IntRange(1))
+@click.option('--description', default=None, help='Description stored on each voucher transaction.')
+@click.option('--output', type=click.File('w'), default='-', help='CSV destination (default: stdout).')
+def issue_vouchers_command(merchant_email, count, points, description, output):
+    """Bulk-issue COUNT vouchers worth POINTS each and write their codes as CSV."""
+    begin_write()
+    merchant = db.session.scalar(select(User).where(User.email == merchant_email))
+    if not merchant or merchant.user_type != UserType.MERCHANT:
+        raise click.BadParameter('No merchant with that email', param_hint='MERCHANT_EMAIL')
+    
+    codes = issue_vouchers(merchant.id, count, points, description)
+    db.session.commit()
+    output.write(vouchers_csv(codes, points))